@@ -40,3 +40,27 @@ def test_score_auto_correlation():
     assert 'color' in res.keys() and 'word' not in res.keys() and 'congruency' not in res.keys()
 
 
+
+
+def test_score_auto_correlation_is_seeded():
+    try:
+        from sklearn.neural_network import MLPClassifier
+    except ImportError as e:
+        assert True
+        return
+    sequential = auto_correlation_scores_samples_between(samples, starts=4, seed=3)
+    parallel = auto_correlation_scores_samples_between(samples, starts=4, seed=3, n_jobs=3)
+    assert sequential == parallel
+    within = auto_correlation_scores_sample_within(samples[0], starts=4, seed=3)
+    assert within == auto_correlation_scores_sample_within(samples[0], starts=4, seed=3, n_jobs=2)
+
+
+def test_score_auto_correlation_stops_at_threshold():
+    try:
+        from sklearn.neural_network import MLPClassifier
+    except ImportError as e:
+        assert True
+        return
+    # A threshold of 0 is met by the first fit, so later restarts are skipped
+    first = auto_correlation_scores_samples_between(samples, starts=1, seed=5)
+    assert auto_correlation_scores_samples_between(samples, starts=10, seed=5, threshold=0) == first
@@ -1,3 +1,4 @@
+import numpy as np
 import operator as op
 import pytest
 
@@ -25,3 +26,16 @@ def test_guided_sampling_works():
     trials = synthesize_trials(block, 5, sampling_strategy=GuidedGen)
 
     assert len(trials) == 5
+
+
+def test_guided_sampling_with_workers_matches_serial():
+    np.random.seed(7)
+    serial = GuidedGen(1).sample_object(block, 3)
+    np.random.seed(7)
+    parallel = GuidedGen(3).sample_object(block, 3)
+
+    assert parallel.samples == serial.samples
+    assert parallel.metrics['solver_call_count'] == serial.metrics['solver_call_count']
+    for sample in parallel.metrics['sample_metrics']:
+        for trial in sample['trials']:
+            assert len(trial['solver_calls']) == trial['solver_call_count']
@@ -0,0 +1,349 @@
+"""
+Benchmarks the designs in `example_programs` with each sampling strategy.
+
+Each example program is run with `synthesize_trials` replaced by a function
+that captures the blocks the program builds, so running a program times only
+the construction of its blocks. Each captured block is then benchmarked with
+each strategy in a separate process, so that a strategy's peak memory is not
+affected by the others and a strategy that does not finish can be stopped.
+For each block and strategy, the results record:
+
+  * 'block_time': time to run the program, which builds its blocks
+  * 'backend_request_time': time for `block.build_backend_request()`
+  * 'cnf_time', 'cnf_variables', 'cnf_clauses': time to build the block's CNF and its size
+  * 'sample_time': time for the strategy to produce the samples
+  * 'phases': time of each phase that the strategy records in its metrics, such as 'solve' and 'decode'
+  * 'implied_levels_time': time to add implied levels to the samples, as `synthesize_trials` does
+  * 'max_rss': peak resident set size of the benchmarking process, in kilobytes,
+    and 'block_max_rss', the same after building the block
+  * with `--trace-memory`, 'peak_traced_memory': peak memory allocated by
+    Python while benchmarking, in bytes, which slows every step down
+
+A strategy that fails, such as one whose solver package is not installed, is
+recorded with status 'error' and its message, and one that runs longer than
+the timeout with status 'timeout'.
+
+Usage, from the repository root:
+
+    python benchmarks/run.py [--strategies RandomGen,SMGen] [--designs Stroop_simple] [--samples 5]
+                             [--timeout 300] [--trace-memory] [--output results.json]
+    python benchmarks/run.py --compare old.json new.json [--tolerance 0.2]
+
+Results are written as JSON, by default to `benchmarks/results/<commit>.json`,
+so that `--compare` can report the changes between two commits.
+
+With `--constraint-checks`, each block with compiled constraint checks is
+instead benchmarked on random candidate sequences, which are checked with the
+block's `ConstraintChecker` in batches, as RandomGen checks its candidates,
+and with each constraint's `potential_sample_conforms`, as RandomGen did
+before. The exit status is 1 if the checker is slower than that reference for
+any block, or disagrees with it:
+
+    python benchmarks/run.py --constraint-checks [--designs Stroop_simple] [--candidates 20000]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import runpy
+import subprocess
+import sys
+import tracemalloc
+
+from collections import defaultdict
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sweetpea
+
+from sweetpea._internal.block import Block
+from sweetpea._internal.primitive import ContinuousFactor
+from sweetpea._internal.sampling_strategy.random import MAX_CANDIDATE_BATCH
+from sweetpea._internal.sampling_strategy.guided import GuidedGen
+from sweetpea._internal.sampling_strategy.trace import sampling_spans
+from sweetpea._internal.server import build_cnf
+
+
+EXAMPLES = os.path.join(ROOT, 'example_programs')
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+
+STRATEGIES = {
+    'RandomGen': sweetpea.RandomGen,
+    'IterateSATGen': sweetpea.IterateSATGen,
+    'CMSGen': sweetpea.CMSGen,
+    'UniGen': sweetpea.UniGen,
+    'SMGen': sweetpea.SMGen,
+    'GuidedGen': GuidedGen,
+}
+
+# Functions that example programs call on their results, which are replaced
+# while capturing blocks since no samples are produced.
+_OUTPUT_FUNCTIONS = ['print_experiments', 'tabulate_experiments', 'save_experiments_csv',
+                     'experiments_to_tuples', 'experiments_to_dicts']
+
+# Compared between result files, where a larger value is worse.
+_COMPARED = ['block_time', 'backend_request_time', 'cnf_time', 'sample_time',
+             'implied_levels_time', 'peak_traced_memory', 'max_rss']
+
+
+def designs() -> List[str]:
+    return sorted(f[:-3] for f in os.listdir(EXAMPLES) if f.endswith('.py'))
+
+
+def capture_blocks(design: str) -> Tuple[List[Block], float, Optional[str]]:
+    """Runs an example program, returning the blocks that it passes to
+    `synthesize_trials`, the time that it took, and an error message if it
+    failed. Blocks captured before a failure are kept."""
+    blocks = []
+
+    def capture(block, *args, **kwargs):
+        blocks.append(block)
+        return []
+
+    saved = {name: getattr(sweetpea, name) for name in ['synthesize_trials'] + _OUTPUT_FUNCTIONS}
+    for name in saved:
+        setattr(sweetpea, name, capture if name == 'synthesize_trials' else (lambda *args, **kwargs: []))
+    cwd = os.getcwd()
+    os.chdir(EXAMPLES)
+    error = None
+    start = perf_counter()
+    try:
+        runpy.run_path(os.path.join(EXAMPLES, design + '.py'), run_name='__main__')
+    except BaseException as e:
+        error = f'{type(e).__name__}: {e}'
+    elapsed = perf_counter() - start
+    os.chdir(cwd)
+    for name, fn in saved.items():
+        setattr(sweetpea, name, fn)
+    return blocks, elapsed, error
+
+
+def benchmark_one(design: str, block_index: int, strategy: str, samples: int, trace_memory: bool = False) -> dict:
+    """Benchmarks one block of a design with one strategy in this process."""
+    if trace_memory:
+        tracemalloc.start()
+    blocks, block_time, error = capture_blocks(design)
+    if block_index >= len(blocks):
+        return {'status': 'error', 'error': error or 'no block'}
+    block = blocks[block_index]
+    result = {'status': 'ok', 'block_time': block_time,
+              'block_max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}  # type: Dict[str, Any]
+    try:
+        start = perf_counter()
+        backend_request = block.build_backend_request()
+        result['backend_request_time'] = perf_counter() - start
+        start = perf_counter()
+        cnf = build_cnf(block)
+        result['cnf_time'] = perf_counter() - start
+        clauses = cnf.as_list_of_list_of_ints()
+        result['cnf_variables'] = max((abs(var) for clause in clauses for var in clause), default=0)
+        result['cnf_clauses'] = len(clauses)
+        del cnf, clauses, backend_request
+
+        start = perf_counter()
+        sampling_result = STRATEGIES[strategy].sample(block, samples)
+        result['sample_time'] = perf_counter() - start
+        result['sample_count'] = len(sampling_result.samples)
+        phases = {}  # type: Dict[str, float]
+        for span in sampling_spans(sampling_result.metrics):
+            if span['track'] == 'main':
+                phases[span['name']] = phases.get(span['name'], 0.0) + span['time']
+        result['phases'] = phases
+
+        start = perf_counter()
+        for sample in sampling_result.samples[:samples]:
+            block.add_implied_levels(sample)
+        result['implied_levels_time'] = perf_counter() - start
+    except BaseException as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+    if trace_memory:
+        result['peak_traced_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    result['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run(design_names: List[str], strategies: List[str], samples: int, timeout: float,
+        trace_memory: bool = False) -> List[dict]:
+    results = []
+    for design in design_names:
+        blocks, _, error = capture_blocks(design)
+        if not blocks:
+            results.append({'design': design, 'block': 0, 'strategy': None,
+                            'status': 'error', 'error': error or 'no block'})
+            print(f'{design}: {results[-1]["error"]}', flush=True)
+            continue
+        for block_index in range(len(blocks)):
+            for strategy in strategies:
+                entry = {'design': design, 'block': block_index, 'strategy': strategy}
+                entry.update(_run_in_subprocess(design, block_index, strategy, samples, timeout,
+                                                trace_memory))
+                results.append(entry)
+                summary = entry.get('error', '') if entry['status'] != 'ok' else f'{entry["sample_time"]:.3f}s'
+                print(f'{design}[{block_index}] {strategy}: {entry["status"]} {summary}'.rstrip(), flush=True)
+    return results
+
+
+def _run_in_subprocess(design: str, block_index: int, strategy: str, samples: int, timeout: float,
+                       trace_memory: bool) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), '--one', design, str(block_index), strategy,
+               '--samples', str(samples)] + (['--trace-memory'] if trace_memory else [])
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'status': 'timeout', 'error': f'longer than {timeout} seconds'}
+    # The result is the last line of output, after anything the program printed
+    lines = completed.stdout.strip().splitlines()
+    try:
+        return json.loads(lines[-1])
+    except (IndexError, ValueError):
+        errors = completed.stderr.strip().splitlines()
+        return {'status': 'error', 'error': errors[-1] if errors else 'no result'}
+
+
+def benchmark_constraint_checks(design_names: List[str], candidates: int) -> List[dict]:
+    """Times checking random candidate sequences against the constraints of
+    each block that has compiled checks."""
+    rng = random.Random(0)
+    results = []
+    for design in design_names:
+        blocks, _, _ = capture_blocks(design)
+        for block_index, block in enumerate(blocks):
+            entry = {'design': design, 'block': block_index}  # type: Dict[str, Any]
+            try:
+                checker = block.constraint_checker()
+                if all(check is None for _, check in checker.checks):
+                    continue
+                trials = block.trials_per_sample()
+                factors = [f for f in block.design if not isinstance(f, ContinuousFactor)]
+                samples = [{f: [rng.choice(f.levels) for _ in range(trials)] for f in factors}
+                           for _ in range(candidates)]
+            except BaseException as e:
+                entry.update({'status': 'error', 'error': f'{type(e).__name__}: {e}'})
+                results.append(entry)
+                print(f'{design}[{block_index}]: {entry["error"]}', flush=True)
+                continue
+
+            start = perf_counter()
+            expected = [all(c.potential_sample_conforms(sample, block) for c in block.constraints)
+                        for sample in samples]
+            reference_time = perf_counter() - start
+            start = perf_counter()
+            conforming = [bool(conforms) for i in range(0, len(samples), MAX_CANDIDATE_BATCH)
+                          for conforms in checker.conforming(samples[i:i + MAX_CANDIDATE_BATCH])]
+            checker_time = perf_counter() - start
+            entry.update({'status': 'ok', 'trials': trials, 'candidates': candidates,
+                          'reference_time': reference_time, 'checker_time': checker_time,
+                          'agrees': conforming == expected})
+            results.append(entry)
+            print(f'{design}[{block_index}] {trials} trials: reference {reference_time:.3f}s, '
+                  f'checker {checker_time:.3f}s ({reference_time / checker_time:.1f}x)'
+                  + ('' if entry['agrees'] else ', DISAGREES'), flush=True)
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+
+
+def compare(old_file: str, new_file: str, tolerance: float) -> int:
+    """Prints the measurements that changed by more than `tolerance` as a
+    fraction of the old value, returning the number of regressions."""
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    old_results = {(r['design'], r['block'], r['strategy']): r for r in old['results']}
+    regressions = 0
+    changes = defaultdict(list)
+    for r in new['results']:
+        key = (r['design'], r['block'], r['strategy'])
+        before = old_results.get(key)
+        if before is None:
+            continue
+        if before['status'] != r['status']:
+            changes[key].append(f'status {before["status"]} -> {r["status"]}')
+            regressions += r['status'] != 'ok'
+            continue
+        for measure in _COMPARED:
+            if measure not in before or measure not in r or not before[measure]:
+                continue
+            ratio = r[measure] / before[measure]
+            if abs(ratio - 1) > tolerance:
+                changes[key].append(f'{measure} {before[measure]:.4g} -> {r[measure]:.4g} ({ratio:.2f}x)')
+                regressions += ratio > 1
+    print(f'{old["environment"]["commit"]} -> {new["environment"]["commit"]}')
+    for (design, block, strategy), lines in changes.items():
+        print(f'{design}[{block}] {strategy}:')
+        for line in lines:
+            print(f'    {line}')
+    print(f'{regressions} regression(s)')
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark example programs with each sampling strategy.')
+    parser.add_argument('--designs', default='', help='comma-separated example program names (default: all)')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES),
+                        help='comma-separated strategy names (default: all)')
+    parser.add_argument('--samples', type=int, default=5, help='samples per benchmark')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds allowed for each benchmark')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also record peak memory allocated by Python, which slows benchmarks down')
+    parser.add_argument('--output', default=None, help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change reported by --compare (default: 0.2)')
+    parser.add_argument('--constraint-checks', action='store_true',
+                        help='benchmark compiled constraint checks against potential_sample_conforms')
+    parser.add_argument('--candidates', type=int, default=20000,
+                        help='candidate sequences per block for --constraint-checks (default: 20000)')
+    parser.add_argument('--one', nargs=3, metavar=('DESIGN', 'BLOCK', 'STRATEGY'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.tolerance) else 0
+    if args.constraint_checks:
+        checks = benchmark_constraint_checks(args.designs.split(',') if args.designs else designs(),
+                                             args.candidates)
+        slower = [r for r in checks if r['status'] == 'ok'
+                  and (not r['agrees'] or r['checker_time'] > r['reference_time'])]
+        return 1 if slower else 0
+    if args.one:
+        design, block_index, strategy = args.one
+        result = benchmark_one(design, int(block_index), strategy, args.samples, args.trace_memory)
+        print()
+        print(json.dumps(result))
+        return 0
+
+    design_names = args.designs.split(',') if args.designs else designs()
+    strategies = args.strategies.split(',')
+    for strategy in strategies:
+        if strategy not in STRATEGIES:
+            parser.error(f'unknown strategy {strategy}, expected one of {", ".join(STRATEGIES)}')
+    env = environment()
+    results = run(design_names, strategies, args.samples, args.timeout, args.trace_memory)
+    output = args.output or os.path.join(RESULTS, (env['commit'] or 'results') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': env, 'samples': args.samples, 'trace_memory': args.trace_memory,
+                   'results': results}, f, indent=1)
+    print(f'Wrote {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,4 +4,71 @@ randomized experimental designs and the synthesis of trial sequences from those
 designs.
 """
 
-from sweetpea._internal.main import *
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from sweetpea._internal.main import *
+
+
+# The module that defines each exported name. Names are imported from their
+# module on first use, so that importing `sweetpea` does not load numpy,
+# networkx, the sampling strategies, or the solver tools until they are needed.
+_EXPORTS = {
+    **{name: 'sweetpea._internal.main' for name in [
+        'synthesize_trials', 'enumerate_trials', 'sample_mismatch_experiment', 'validate_samples',
+        'auto_correlation_scores_sample_within', 'auto_correlation_scores_samples_between',
+        'predictability_scores',
+        'print_experiments', 'tabulate_experiments',
+        'save_experiments_csv', 'experiments_to_tuples', 'experiments_to_dicts',
+        'save_experiments_npz', 'save_experiments_npy', 'load_experiments_columns']},
+    **{name: 'sweetpea._internal.async_synthesis' for name in [
+        'synthesize_trials_async', 'iterate_trials_async']},
+    'TrialMatrix': 'sweetpea._internal.trial_matrix',
+    'CancellationToken': 'sweetpea._internal.progress',
+    'SamplingService': 'sweetpea._internal.sampling_service',
+
+    'Block': 'sweetpea._internal.block',
+    **{name: 'sweetpea._internal.cross_block' for name in [
+        'CrossBlock', 'MultiCrossBlock', 'Repeat', 'Nest', 'Merge', 'RepeatMode', 'AlignmentMode']},
+
+    **{name: 'sweetpea._internal.primitive' for name in [
+        'Factor', 'Level', 'DerivedLevel', 'ElseLevel', 'ContinuousFactor',
+        'WithinTrial', 'Transition', 'Window', 'ContinuousFactorWindow']},
+
+    **{name: 'sweetpea._internal.constraint' for name in [
+        'Derivation', 'Exclude', 'Pin', 'MinimumTrials', 'ExactlyK',
+        'AtMostKInARow', 'AtLeastKInARow', 'ExactlyKInARow', 'LatinSquare', 'Sequential']},
+    'Constraint': 'sweetpea._internal.base_constraint',
+
+    'Gen': 'sweetpea._internal.sampling_strategy.base',
+    'RandomGen': 'sweetpea._internal.sampling_strategy.random',
+    'IterateSATGen': 'sweetpea._internal.sampling_strategy.iterate_sat',
+    'CMSGen': 'sweetpea._internal.sampling_strategy.cmsgen',
+    'UniGen': 'sweetpea._internal.sampling_strategy.unigen',
+    'IterateILPGen': 'sweetpea._internal.sampling_strategy.iterate_ilp',
+    'UniformGen': 'sweetpea._internal.sampling_strategy.uniform',
+    'IterateGen': 'sweetpea._internal.sampling_strategy.iterate',
+    'SMGen': 'sweetpea._internal.sampling_strategy.smgen',
+    'AutoGen': 'sweetpea._internal.sampling_strategy.auto',
+
+    **{name: 'sweetpea._internal.distribution' for name in [
+        'UniformDistribution', 'GaussianDistribution',
+        'ExponentialDistribution', 'LogNormalDistribution', 'CustomDistribution']},
+}
+
+# Type checkers take the exported names from the star import above instead.
+if not TYPE_CHECKING:
+    __all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
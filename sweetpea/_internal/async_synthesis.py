@@ -0,0 +1,250 @@
+import asyncio
+import os
+import pickle
+import threading
+import warnings
+
+from functools import partial
+from multiprocessing import get_all_start_methods, get_context
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, cast
+from weakref import WeakKeyDictionary
+
+from sweetpea._internal.block import Block
+from sweetpea._internal.progress import CancellationToken
+from sweetpea._internal.sampling_strategy.iterate import IterateGen
+
+
+"""
+Synthesis for programs that run an asyncio event loop. Each call samples in
+its own worker process, which is started for the call and exits with it. The
+solvers that a strategy runs are subprocesses of the worker, so neither
+sampling nor solving blocks the event loop, which only waits for the worker's
+messages: progress events, and then the trials or an exception. The event
+loop waits for them with a reader on the pipe rather than a thread.
+
+When the process has no threads other than the main one, the worker is
+forked, so that it inherits the block, whose derivations may hold predicates
+that cannot be pickled. Otherwise, forking could leave the worker deadlocked
+on a lock that another thread holds, so the worker is started by the
+forkserver, or else by spawn, and the block is sent to it pickled, with
+cloudpickle if it is installed, which also pickles lambdas. A worker that is
+not forked imports the program's main module again, as multiprocessing does.
+
+The number of workers that run at once is limited across all calls on an
+event loop, to SWEETPEA_ASYNC_WORKERS if set, or else to the number of CPUs.
+Cancelling the task that awaits a call stops its worker. A cancellation
+token's timeout applies within the worker, and while the worker runs, the
+event loop checks whether the token is cancelled, in which case it tells the
+worker to stop through an event shared with the worker's copy of the token.
+The token's `stopped` flag is set from the worker's result.
+
+Only when the worker cannot be forked and the block cannot be pickled does
+sampling run in a thread of the event loop's default executor instead, with a
+warning. The thread holds the interpreter lock while it samples, so it slows
+the event loop, and it cannot be stopped by cancelling the task, but does stop
+when the token is cancelled.
+"""
+
+# The arguments of `_synthesize` other than its progress function.
+_Args = Tuple[Block, int, Any, bool, Optional[CancellationToken]]
+
+# Seconds between checks of whether a worker's token is cancelled.
+_CANCEL_POLL_INTERVAL = 0.05
+
+_limits = cast('WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]', WeakKeyDictionary())
+
+
+def _limit() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _limits:
+        _limits[loop] = asyncio.Semaphore(int(os.environ.get('SWEETPEA_ASYNC_WORKERS', os.cpu_count() or 1)))
+    return _limits[loop]
+
+
+def _synthesize(block: Block, samples: int, sampling_strategy: Any, as_matrix: bool,
+                cancellation: Optional[CancellationToken],
+                on_progress: Optional[Callable[[dict], None]]) -> Tuple[Any, bool]:
+    # Also reports whether sampling stopped early, since a worker's token is a copy
+    from sweetpea._internal.main import synthesize_trials
+    trials = synthesize_trials(block, samples, sampling_strategy, as_matrix=as_matrix,
+                               on_progress=on_progress, cancellation=cancellation)
+    return trials, cancellation is not None and cancellation.stopped
+
+
+def _pickled(args: _Args) -> Optional[bytes]:
+    # The arguments for a worker that is not forked, or None if they cannot
+    # be pickled. The token is replaced by a copy without its event, which
+    # the worker replaces with the shared one.
+    cancellation = args[4]
+    if cancellation is not None:
+        detached = CancellationToken.__new__(CancellationToken)
+        detached.deadline = cancellation.deadline
+        detached.stopped = False
+        args = args[:4] + (detached,)
+    try:
+        return pickle.dumps(args)
+    except Exception:
+        pass
+    try:
+        import cloudpickle  # type: ignore
+    except ImportError:
+        return None
+    try:
+        return cast(bytes, cloudpickle.dumps(args))
+    except Exception:
+        return None
+
+
+def _work(connection: Any, stop: Any, payload: Any) -> None:
+    # Runs in the worker process, where the token is a copy that is cancelled
+    # through the shared `stop` event
+    def forward(event: dict) -> None:
+        connection.send(('progress', event))
+
+    try:
+        args = cast(_Args, pickle.loads(payload) if isinstance(payload, bytes) else payload)
+    except BaseException as e:
+        connection.send(('error', RuntimeError(f"Sampling worker could not load its block: {e}")))
+        connection.close()
+        return
+    if args[4] is not None:
+        args[4]._cancelled = stop
+
+    try:
+        message = ('done', _synthesize(*args, forward))  # type: Tuple[str, Any]
+    except BaseException as e:
+        message = ('error', e)
+    try:
+        connection.send(message)
+    except Exception:
+        # The exception could not be pickled
+        connection.send(('error', RuntimeError(f"{type(message[1]).__name__}: {message[1]}")))
+    connection.close()
+
+
+async def _in_process(args: _Args, on_progress: Optional[Callable[[dict], None]],
+                      start_method: str, payload: Any) -> Tuple[Any, bool]:
+    loop = asyncio.get_running_loop()
+    cancellation = args[4]
+    context = cast(Any, get_context(start_method))
+    receiver, sender = context.Pipe(duplex=False)
+    stop = context.Event()
+    worker = context.Process(target=_work, args=(sender, stop, payload), daemon=True)
+    worker.start()
+    sender.close()
+    # Set when the worker sends a message, or when the token is due to be checked
+    wake = asyncio.Event()
+    loop.add_reader(receiver.fileno(), wake.set)
+    try:
+        while True:
+            if cancellation is not None and cancellation.cancelled:
+                stop.set()
+            check = loop.call_later(_CANCEL_POLL_INTERVAL, wake.set)
+            try:
+                await wake.wait()
+            finally:
+                check.cancel()
+            wake.clear()
+            while receiver.poll():
+                try:
+                    kind, value = receiver.recv()
+                except EOFError:
+                    raise RuntimeError(f"Sampling worker exited with code {worker.exitcode}")
+                if kind == 'progress':
+                    if on_progress is not None:
+                        on_progress(value)
+                elif kind == 'error':
+                    raise value
+                else:
+                    return value
+    finally:
+        loop.remove_reader(receiver.fileno())
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
+        receiver.close()
+
+
+async def _in_thread(args: _Args, on_progress: Optional[Callable[[dict], None]]) -> Tuple[Any, bool]:
+    loop = asyncio.get_running_loop()
+    forward = None
+    if on_progress is not None:
+        forward = partial(loop.call_soon_threadsafe, on_progress)
+    return await loop.run_in_executor(None, partial(_synthesize, *args, forward))
+
+
+async def synthesize_trials_async(block: Block,
+                                  samples: int = 10,
+                                  sampling_strategy=IterateGen,
+                                  as_matrix: bool = False,
+                                  on_progress: Optional[Callable[[dict], None]] = None,
+                                  cancellation: Optional[CancellationToken] = None):
+    """Like :func:`.synthesize_trials`, but samples in a worker process,
+    so that awaiting the result does not block the event loop.
+
+    Each call starts its own worker. When the process has threads other than
+    the main one, the worker is not forked, since it could deadlock on a lock
+    that another thread holds; it is started by the forkserver or spawn
+    instead, and so `block` and `sampling_strategy` must be picklable, with
+    cloudpickle if it is installed, and the program's main module is imported
+    again in the worker, so its top-level code should be under an
+    ``if __name__ == '__main__':`` guard. If the worker cannot be forked and
+    the block cannot be pickled, sampling runs in a thread instead, with a
+    :class:`RuntimeWarning`; the thread slows the event loop, and stops when
+    `cancellation` is cancelled, but not when the awaiting task is.
+
+    The number of workers that run at once is limited across all calls on an
+    event loop to the ``SWEETPEA_ASYNC_WORKERS`` environment variable, or
+    else to the number of CPUs; further calls wait for a worker. Cancelling
+    the awaiting task or `cancellation` stops its worker. The `on_progress`
+    function is called on the event loop.
+    """
+    args = (block, samples, sampling_strategy, as_matrix, cancellation)  # type: _Args
+    async with _limit():
+        methods = get_all_start_methods()
+        if 'fork' in methods and threading.active_count() == 1:
+            trials, stopped = await _in_process(args, on_progress, 'fork', args)
+        else:
+            payload = _pickled(args)
+            if payload is not None:
+                start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+                trials, stopped = await _in_process(args, on_progress, start_method, payload)
+            else:
+                warnings.warn("The block cannot be pickled for a worker process, and forking one while "
+                              "other threads run could deadlock it, so sampling runs in a thread, which "
+                              "slows the event loop and does not stop when the awaiting task is cancelled.",
+                              RuntimeWarning)
+                trials, stopped = await _in_thread(args, on_progress)
+    if stopped:
+        cast(CancellationToken, cancellation).stopped = True
+    return trials
+
+
+async def iterate_trials_async(block: Block,
+                               samples: int = 10,
+                               sampling_strategy=IterateGen,
+                               batch_size: Optional[int] = None,
+                               on_progress: Optional[Callable[[dict], None]] = None,
+                               cancellation: Optional[CancellationToken] = None) -> AsyncIterator[dict]:
+    """Produces `samples` sets of trials as an asynchronous iterator. The sets
+    are sampled in batches of `batch_size`, each with
+    :func:`.synthesize_trials_async`, and each batch's sets are produced as
+    soon as the batch is complete. Batches run at the same time, up to the
+    limit on workers.
+
+    Batches are sampled independently, so a set of trials can appear in more
+    than one batch, and a strategy that always produces the same sets, such
+    as :class:`.IterateSATGen`, produces them again in every batch. By
+    default, all of the sets are sampled as one batch.
+    """
+    batch_size = batch_size or samples
+    tasks = [asyncio.ensure_future(synthesize_trials_async(block, min(batch_size, samples - start),
+                                                           sampling_strategy, False, on_progress, cancellation))
+             for start in range(0, samples, batch_size)]
+    try:
+        for batch in asyncio.as_completed(tasks):
+            for trials in cast(List[dict], await batch):
+                yield trials
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,143 +1,230 @@
+import os
 import random
-
-
-def _get_level_to_float_mapping(factor, sample) -> dict:
-    item = set()
-    for l in sample[factor]:
-        item.add(l)
-    item_ = sorted(item)
-    return {item_[i]: float(i) for i in range(len(item_))}
-
-
-def _convert_sample_levels_to_floats(factor_dict, sample) -> dict:
-    s_ = {}
-    for k in sample.keys():
-        s_[k] = [factor_dict[k][l] for l in sample[k]]
-    return s_
-
-
-def convert_samples(samples: list) -> list:
-    """Convert string levels in a sample to numbers"""
-    factors = set()
-    # get factors
-    for s in samples:
-        for f in s.keys():
-            factors.add(f)
-    factor_dict = {}
-    # get the level dict for every factor:
-    for s in samples:
-        for f in factors:
-            factor_dict[f] = _get_level_to_float_mapping(f, s)
-    res = []
-    for s in samples:
-        s_ = _convert_sample_levels_to_floats(factor_dict, s)
-        res.append(s_)
-    return res
-
-
-def convert_sample(sample: dict) -> dict:
-    factor_dict = {}
-    for f in sample.keys():
-        factor_dict[f] = _get_level_to_float_mapping(f, sample)
-    return _convert_sample_levels_to_floats(factor_dict, sample)
-
-
-def train_test_split_samples(samples: list, percentage: float = .8) -> tuple:
-    """split list of samples in train and test samples"""
-    samples_ = samples.copy()
-    random.shuffle(samples_)
-    split = int(percentage * len(samples_))
-    if split == 0 or split == len(samples_):
-        raise Exception('Train or test set empty')
-    return samples_[:split], samples_[split:]
-
-
-def create_x_y_sample(sample: dict, y_factor: str, k: int = 10) -> tuple:
-    """create the independent and dependent values in a sample"""
-    x_lists = []
-    y_list = sample[y_factor]
-    for key in sample.keys():
-        x_lists.append(sample[key])
-    k_ = min(len(y_list) // 2, k)
-    start = 0
-    end = k_
-    x_res = []
-    y_res = []
-    if len(y_list) <= k_:
+import zlib
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import get_all_start_methods, get_context
+from typing import Dict, List, Optional, Tuple, cast
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class LaggedSamples:
+    """Samples prepared for auto correlation scoring. Levels are coded as
+    integers, and each trial after the first `k` of a sample becomes a row of
+    a design matrix holding the levels of all factors in the `k` preceding
+    trials, with the trial's own levels as the values to predict. Samples can
+    have different numbers of trials, and their rows are stacked in order. The
+    matrix is built once and shared by every factor and restart of a score.
+
+    With `one_hot`, each preceding level is represented by one indicator
+    column per level of its factor instead of by its integer code.
+    """
+
+    def __init__(self, samples: list, k: int = 10, one_hot: bool = False):
+        self.factors = list(samples[0].keys())
+        self.levels = {f: sorted(set(l for s in samples for l in s[f])) for f in self.factors}
+        lengths = [len(s[self.factors[0]]) for s in samples]
+        if any(len(s[f]) != n for s, n in zip(samples, lengths) for f in self.factors):
+            raise Exception('factors in an auto correlation test sample must have the same number of trials')
+        k_ = min(min(lengths) // 2, k)
+        if min(lengths) <= k_:
+            raise Exception('predict distance to high in auto correlation test')
+        self.sample_count = len(samples)
+
+        # Shape (factors, trials of all samples)
+        coded = np.empty((len(self.factors), sum(lengths)), dtype=np.int64)
+        for i, f in enumerate(self.factors):
+            index = {l: code for code, l in enumerate(self.levels[f])}
+            coded[i] = np.fromiter((index[l] for s in samples for l in s[f]), dtype=np.int64, count=sum(lengths))
+
+        # Shape (factors, rows, k + 1), where the last trial of each window is predicted
+        windows = sliding_window_view(coded, k_ + 1, axis=1)[:, _window_starts(lengths, k_ + 1)]
+        # Sample i has rows offsets[i] to offsets[i + 1]
+        self.offsets = np.cumsum([0] + [n - k_ for n in lengths])
+        self.y = windows[:, :, k_]
+        lagged = windows[:, :, :k_]
+        if one_hot:
+            columns = [np.eye(len(self.levels[f]))[lagged[i]] for i, f in enumerate(self.factors)]
+            # Shape (rows, k * levels) for each factor
+            parts = [c.reshape(c.shape[0], -1) for c in columns]
+        else:
+            parts = [lagged[i].astype(np.float64) for i in range(len(self.factors))]
+        # Each row lists the preceding trials of each factor in turn, shape (rows, columns)
+        self.x = np.concatenate(parts, axis=1)
+
+    def rows(self, factor: str, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The design-matrix rows and values to predict for `factor` in the given samples."""
+        rows = np.concatenate([np.arange(self.offsets[s], self.offsets[s + 1]) for s in samples])
+        return self.x[rows], self.y[self.factors.index(factor), rows]
+
+
+def _window_starts(lengths: List[int], width: int) -> np.ndarray:
+    """the starts of the windows of `width` trials that lie within one sample, where the
+    samples' trials, with the given numbers of trials, are concatenated"""
+    starts = np.cumsum([0] + lengths[:-1])
+    return np.concatenate([np.arange(start, start + n - width + 1) for start, n in zip(starts, lengths)])
+
+
+def _entropy(counts: np.ndarray) -> np.ndarray:
+    """the entropy in bits of each row of a count array"""
+    totals = counts.sum(axis=-1, keepdims=True)
+    p = np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+    return -np.sum(p * np.log2(p, out=np.zeros(p.shape), where=p > 0), axis=-1)
+
+
+def predictability_score_factor(samples: list, factor: str, k: int = 1) -> float:
+    """get how predictable a factor's level is from its levels in the previous k trials, as the
+    fraction of the factor's entropy that is explained by those levels, 1 - H(level | previous) / H(level),
+    with probabilities estimated by counting n-grams over all samples. 0 means that the previous levels
+    carry no information, and 1 means that they determine the level. As with any plug-in estimate, a
+    small number of trials per combination of previous levels inflates the score."""
+    levels = sorted(set(l for s in samples for l in s[factor]))
+    index = {l: code for code, l in enumerate(levels)}
+    lengths = [len(s[factor]) for s in samples]
+    k_ = min(min(lengths) // 2, k)
+    if k_ == 0:
         raise Exception('predict distance to high in auto correlation test')
-    while end < len(y_list):
-        x_temp = []
-        for x in x_lists:
-            x_temp += x[start: end]
-        x_res.append(x_temp)
-        y_res.append(y_list[end])
-        start += 1
-        end += 1
-    return x_res, y_res
-
-
-def create_x_y_train_test_samples(samples: list, factor: str, percentage: float = .8, k: int = 10) -> tuple:
-    """create a list of train independent, train dependent, test independent and test dpendent variables"""
-    train_set, test_set = train_test_split_samples(samples, percentage)
-    x_train = []
-    y_train = []
-    x_test = []
-    y_test = []
-    for s in train_set:
-        x_train_, y_train_ = create_x_y_sample(s, factor, k)
-        x_train += x_train_
-        y_train += y_train_
-    for s in test_set:
-        x_test_, y_test_ = create_x_y_sample(s, factor, k)
-        x_test += x_test_
-        y_test += y_test_
+    coded = np.fromiter((index[l] for s in samples for l in s[factor]), dtype=np.int64, count=sum(lengths))
+    windows = sliding_window_view(coded, k_ + 1)[_window_starts(lengths, k_ + 1)]
+    _, contexts = np.unique(windows[:, :k_], axis=0, return_inverse=True)
+    joint = contexts.reshape(-1) * len(levels) + windows[:, k_]
+    counts = np.bincount(joint, minlength=(contexts.max() + 1) * len(levels)).reshape(-1, len(levels))
+    entropy = float(_entropy(counts.sum(axis=0)))
+    if entropy == 0:
+        return 1.0
+    conditional = float(np.sum(counts.sum(axis=1) / len(windows) * _entropy(counts)))
+    return 1 - conditional / entropy
+
+
+def train_test_split_samples(lagged: LaggedSamples, factor: str, percentage: float = .8,
+                             rng: Optional[random.Random] = None) -> tuple:
+    """split the rows of a list of samples by sample into train and test rows"""
+    order = list(range(lagged.sample_count))
+    (rng or random).shuffle(order)
+    split = int(percentage * len(order))
+    if split == 0 or split == len(order):
+        raise Exception('Train or test set empty')
+    x_train, y_train = lagged.rows(factor, np.array(order[:split]))
+    x_test, y_test = lagged.rows(factor, np.array(order[split:]))
     return x_train, y_train, x_test, y_test
 
 
-def create_x_y_train_test_sample(sample: dict, factor: str, train_test_split: float = .8) -> tuple:
-    x_set, y_set = create_x_y_sample(sample, factor)
-    zipped = list(zip(x_set, y_set))
-    random.shuffle(zipped)
-    split = int(train_test_split * len(zipped))
-    if split == 0 or split == len(zipped):
+def train_test_split_rows(lagged: LaggedSamples, factor: str, percentage: float = .8,
+                          rng: Optional[random.Random] = None) -> tuple:
+    """split the rows of all samples into train and test rows"""
+    x, y = lagged.rows(factor, np.arange(lagged.sample_count))
+    order = list(range(len(y)))
+    (rng or random).shuffle(order)
+    split = int(percentage * len(order))
+    if split == 0 or split == len(order):
         raise Exception('Train or test set empty')
-    return [e[0] for e in zipped[:split]], \
-        [e[1] for e in zipped[:split]], \
-        [e[0] for e in zipped[split:]], \
-        [e[1] for e in zipped[split:]]
+    train, test = np.array(order[:split]), np.array(order[split:])
+    return x[train], y[train], x[test], y[test]
 
 
-def auto_correlation_score_factor_within(sample: dict, factor: str, train_test_split: float = .8,
-                                         k: int = 10, starts: int = 10) -> float:
-    """get the auto correlation score for a single factor for a samples (within)"""
+def _classifier(seed: int = 1):
     try:
         from sklearn.neural_network import MLPClassifier
     except ImportError as e:
         raise Exception(
             'To use a auto correlation test, please install the scikit-learn package: pip install scikit-learn\n')
-    sample_converted = convert_sample(sample)
-    score_max = 0
-    for i in range(starts):
-        x_train, y_train, x_test, y_test = create_x_y_train_test_sample(sample_converted, factor, train_test_split)
-        clf = MLPClassifier(solver='lbfgs', alpha=1e-5, hidden_layer_sizes=(15,), random_state=1)
-        clf.fit(x_train, y_train)
-        score_max = max(score_max, clf.score(x_test, y_test))
-    return score_max
+    return MLPClassifier(solver='lbfgs', alpha=1e-5, hidden_layer_sizes=(15,), random_state=seed)
+
+
+def _fit_seed(seed: int, factor: str, restart: int) -> int:
+    """The seed of one fit, which depends only on the factor and restart so
+    that scores do not depend on how fits are scheduled"""
+    return int(np.random.SeedSequence([seed, zlib.crc32(factor.encode()), restart]).generate_state(1)[0])
+
+
+def _fit_score(lagged: LaggedSamples, factor: str, seed: int, train_test_split: float, within: bool) -> float:
+    """train one network, with the train/test split and initial weights given by `seed`"""
+    split = train_test_split_rows if within else train_test_split_samples
+    x_train, y_train, x_test, y_test = split(lagged, factor, train_test_split, random.Random(seed))
+    clf = _classifier(seed)
+    clf.fit(x_train, y_train)
+    return clf.score(x_test, y_test)
+
+
+def auto_correlation_scores(lagged: LaggedSamples, factors: List[str], train_test_split: float = .8,
+                            starts: int = 10, within: bool = False, n_jobs: int = 1,
+                            seed: Optional[int] = None, threshold: Optional[float] = None) -> Dict[str, float]:
+    """get the auto correlation score for each of the factors of prepared samples, where rows
+    are split into train and test rows either by sample or (within) by row. The score of a factor
+    is the best score of `starts` fits, and its remaining fits are skipped once a fit reaches
+    `threshold`. With more than one job, fits run in a pool of processes; -1 uses all CPUs."""
+    _classifier()
+    if seed is None:
+        seed = random.getrandbits(32)
+    fits = [(f, _fit_seed(seed, f, restart)) for f in factors for restart in range(starts)]
+    scores = {f: 0.0 for f in factors}
+
+    def record(factor: str, score: float) -> bool:
+        scores[factor] = max(scores[factor], score)
+        return threshold is not None and scores[factor] >= threshold
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(fits) <= 1:
+        done = set()
+        for f, fit_seed in fits:
+            if f not in done and record(f, _fit_score(lagged, f, fit_seed, train_test_split, within)):
+                done.add(f)
+        return scores
+
+    # Forked processes inherit the prepared samples instead of receiving a
+    # copy with every fit. Without fork, fall back to threads.
+    forking = 'fork' in get_all_start_methods()
+    executor: Executor
+    if forking:
+        executor = ProcessPoolExecutor(min(n_jobs, len(fits)), mp_context=get_context('fork'),
+                                       initializer=_set_worker_samples, initargs=(lagged,))
+    else:
+        executor = ThreadPoolExecutor(min(n_jobs, len(fits)))
+    with executor:
+        futures = {}
+        for f, fit_seed in fits:
+            if forking:
+                future = executor.submit(_fit_score_in_worker, f, fit_seed, train_test_split, within)
+            else:
+                future = executor.submit(_fit_score, lagged, f, fit_seed, train_test_split, within)
+            futures[future] = f
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            if record(futures[future], future.result()):
+                for other, f in futures.items():
+                    if f == futures[future]:
+                        other.cancel()
+    return scores
+
+
+# The prepared samples for a forked worker process, inherited from the parent.
+_worker_samples = cast(Optional[LaggedSamples], None)
+
+def _set_worker_samples(lagged: LaggedSamples) -> None:
+    global _worker_samples
+    _worker_samples = lagged
+
+def _fit_score_in_worker(factor: str, seed: int, train_test_split: float, within: bool) -> float:
+    return _fit_score(cast(LaggedSamples, _worker_samples), factor, seed, train_test_split, within)
+
+
+def auto_correlation_score_factor_within(sample: dict, factor: str, train_test_split: float = .8,
+                                         k: int = 10, starts: int = 10, one_hot: bool = False,
+                                         n_jobs: int = 1, seed: Optional[int] = None,
+                                         threshold: Optional[float] = None) -> float:
+    """get the auto correlation score for a single factor for a samples (within)"""
+    return auto_correlation_scores(LaggedSamples([sample], k, one_hot), [factor], train_test_split,
+                                   starts, True, n_jobs, seed, threshold)[factor]
 
 
 def auto_correlation_score_factor_between(samples: list, factor: str, train_test_split: float = .8,
-                                          k: int = 10, starts: int = 10) -> float:
+                                          k: int = 10, starts: int = 10, one_hot: bool = False,
+                                          n_jobs: int = 1, seed: Optional[int] = None,
+                                          threshold: Optional[float] = None) -> float:
     """get the auto correlation score for a single factor for a list of samples (between)"""
-    try:
-        from sklearn.neural_network import MLPClassifier
-    except ImportError as e:
-        raise Exception(
-            'To use a auto correlation test, please install the scikit-learn package: pip install scikit-learn\n')
-    samples_converted = convert_samples(samples)
-    score_max = 0
-    for i in range(starts):
-        x_train, y_train, x_test, y_test = create_x_y_train_test_samples(samples_converted, factor, train_test_split, k)
-        clf = MLPClassifier(solver='lbfgs', alpha=1e-5, hidden_layer_sizes=(15,), random_state=1)
-        clf.fit(x_train, y_train)
-        score_max = max(score_max, clf.score(x_test, y_test))
-    return score_max
+    return auto_correlation_scores(LaggedSamples(samples, k, one_hot), [factor], train_test_split,
+                                   starts, False, n_jobs, seed, threshold)[factor]
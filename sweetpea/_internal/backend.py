@@ -3,6 +3,7 @@
 
 from typing import List
 
+from sweetpea._internal.instrumentation import span
 from sweetpea._internal.logic import And, cnf_to_json
 from sweetpea._internal.core import Var
 from sweetpea._internal.core.generate.utility import GenerationRequest, AssertionType
@@ -64,7 +65,8 @@ class BackendRequest:
         self.solution_count = -1
 
     def get_cnfs_as_json(self):
-        return cnf_to_json(self.cnfs)
+        with span('convert_cnf', formulas=len(self.cnfs)):
+            return cnf_to_json(self.cnfs)
 
     def get_requests_as_json(self):
         return list(map(lambda r: r.to_dict(), self.ll_requests))
@@ -2,11 +2,29 @@
 
 
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import Any, Callable, List, Optional, Tuple
 
 from sweetpea._internal.primitive import Factor
 
 
+class CompiledCheck:
+    """A compiled form of :func:`.Constraint.potential_sample_conforms`, which
+    checks a batch of samples at once. The check reads only `factors` from
+    samples in which each factor's levels are coded as a NumPy integer array
+    of shape (samples, trials), holding indices into the factor's levels, with
+    -1 for a trial that has no level. It returns a boolean array with whether
+    each sample conforms, or one boolean for all of them. Without a check,
+    every sample conforms.
+    """
+
+    def __init__(self, factors: List[Factor], check: Optional[Callable[[dict], Any]] = None):
+        self.factors = factors
+        self.check = check
+
+
+CONFORMS = CompiledCheck([])
+
+
 class Constraint(ABC):
     """Generic interface for constraints."""
 
@@ -51,6 +69,14 @@ class Constraint(ABC):
         """
         pass
 
+    def compile_check(self, block) -> Optional[CompiledCheck]:
+        """Compiles :func:`.Constraint.potential_sample_conforms` for a block,
+        so that a sample can be checked with array operations. Returns None
+        when the constraint has no compiled form, in which case
+        :func:`.Constraint.potential_sample_conforms` is used instead.
+        """
+        return None
+
     def init_within_block(self, within_block) -> None:
         pass
 
@@ -3,23 +3,28 @@ a factorial experimental design.
 """
 
 from abc import abstractmethod
+from contextlib import contextmanager
 from functools import reduce
 from itertools import accumulate, combinations, product, repeat
-from typing import List, Union, Tuple, Optional, cast, Any, Dict, Set, Callable, TypeVar
+from typing import List, Union, Tuple, Optional, cast, Any, Dict, Set, Callable, Iterator, TypeVar
 from math import ceil
 from itertools import chain
-from networkx import has_path
 import inspect
+import os
+import random
 # import time
 
 from sweetpea._internal.backend import BackendRequest
+from sweetpea._internal.instrumentation import span
 from sweetpea._internal.level import get_all_levels
 from sweetpea._internal.primitive import (
     DerivedFactor, DerivedLevel, ElseLevel, Factor, SimpleLevel, Level, ContinuousFactor, ContinuousFactorWindow
 )
 from sweetpea._internal.logic import to_cnf_tseitin
 from sweetpea._internal.base_constraint import Constraint
+from sweetpea._internal.constraint_checker import ConstraintChecker
 from sweetpea._internal.design_graph import DesignGraph
+from sweetpea._internal.distribution import CustomDistribution
 from sweetpea._internal.iter import chunk_dict
 from sweetpea._internal.weight import combination_weight
 from sweetpea._internal.argcheck import argcheck, make_islistof
@@ -80,11 +85,56 @@ class Block:
         self._variables_per_trial = None
         self.__validate(who)
         self._cached_previous_count = cast(Dict[Tuple[Factor, int], int], {})
+        self._constraint_checker = cast(Optional[ConstraintChecker], None)
+        self._encodings = cast(Optional[Dict[str, Any]], None)
         for count in crossing_sustain_counts:
             # round min trials up to multiple of sustain
             if (self.min_trials//count) * count != self.min_trials:
                 self.min_trials = ((self.min_trials//count) + 1) * count
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # The compiled checker holds closures, and is compiled again on demand
+        state = self.__dict__.copy()
+        state['_constraint_checker'] = None
+        return state
+
+    def constraint_checker(self) -> ConstraintChecker:
+        """Returns the checker for this block's constraints, compiling them the
+        first time."""
+        if self._constraint_checker is None:
+            self._constraint_checker = ConstraintChecker(self)
+        return self._constraint_checker
+
+    def keep_encodings(self) -> None:
+        """Makes this block keep the encodings that sampling builds from it,
+        such as its backend request and CNF, so that later samplings reuse
+        them instead of building them again. The block must not be changed
+        afterward."""
+        if self._encodings is None:
+            self._encodings = {}
+
+    @contextmanager
+    def keeping_encodings(self) -> Iterator[None]:
+        """Keeps the block's encodings while the enclosed code runs, and
+        discards them afterward unless the block already kept them."""
+        if self._encodings is not None:
+            yield
+            return
+        self._encodings = {}
+        try:
+            yield
+        finally:
+            self._encodings = None
+
+    def cached_encoding(self, name: str, build: Callable[[], T]) -> T:
+        """Returns `build()`, which is kept as `name` if the block keeps its
+        encodings."""
+        if self._encodings is None:
+            return build()
+        if name not in self._encodings:
+            self._encodings[name] = build()
+        return cast(T, self._encodings[name])
+
     def sep_continuous_factors(self, 
                              design: List[Factor])->List[Factor]:
         discret_design = []
@@ -107,78 +157,149 @@ class Block:
     # This stores values for continuousfactor
     # Trial Number, Factor Name, List of values
     # self.continuous_factor_samples = {}
-    def sample_continuous(self, trial_num, trial):
-        meet_constraints = False
+    #
+    # When continuous constraints fail, the default "targeted" mode resamples
+    # only the violating trials, along with the trials whose values depend on
+    # them through windows or cumulative sums; the "sequence" mode resamples
+    # every trial. Either way, sampling gives up with an error after
+    # `max_attempts` resampling rounds. The defaults can be changed with the
+    # SWEETPEA_CONTINUOUS_RESAMPLING and SWEETPEA_CONTINUOUS_MAX_ATTEMPTS
+    # environment variables.
+    def sample_continuous(self, trial_num, trial, mode: Optional[str] = None, max_attempts: Optional[int] = None):
+        if mode is None:
+            mode = os.getenv("SWEETPEA_CONTINUOUS_RESAMPLING", "targeted")
+        if mode not in ("targeted", "sequence"):
+            raise ValueError("Continuous resampling mode must be 'targeted' or 'sequence', got {}".format(mode))
+        if max_attempts is None:
+            max_attempts = int(os.getenv("SWEETPEA_CONTINUOUS_MAX_ATTEMPTS", "100000"))
+        continuous_samples = self._sample_continuous(trial_num, trial)
+        violations = self._constraint_violations(continuous_samples)
         continue_counter = 0
-        max_attempts = 10000000
-        # start_time = time.time()
-        # time_limit = 60
-        while not meet_constraints:
-            # if time.time() - start_time >= time_limit:
-            #     raise TimeoutError("Sampling process exceeded the time limit of {} seconds to meet continuous constraints.".format(time_limit)) 
+        while violations:
             if continue_counter >= max_attempts:
-                # raise RuntimeError("Exceeded the maximum number of resampling attempts ({}) to meet continuous constraints.".format(max_attempts))
-                print('Trial: {}, Sampling count {} exceeds max attempts. Consider modify continuous constraints.'.format(trial_num, continue_counter), end="\r", flush=True)  
-            elif continue_counter>0:
-                print('Trial: {}, Sampling count to meet continuous constraints: {}'.format(trial_num, continue_counter), end="\r", flush=True)  
-            continuous_samples = self._sample_continuous(trial_num, trial)
-            # Check if constraints are met.
-            meet_constraints = self._check_constraints(continuous_samples)
-            continue_counter+=1
-        # Should add Constraints here such that Not only Specific trial is resampled OR during the above function
-        if continue_counter>1:
+                print()
+                raise RuntimeError("Could not meet continuous constraints for experiment {} after {} resampling attempts; "
+                                   "trials {} still fail. Consider modifying the continuous constraints."
+                                   .format(trial_num, continue_counter, violations))
+            continue_counter += 1
+            print('Trial: {}, Sampling count to meet continuous constraints: {}'.format(trial_num, continue_counter), end="\r", flush=True)
+            if mode == "sequence":
+                continuous_samples = self._sample_continuous(trial_num, trial)
+            else:
+                self._resample_continuous_trials(violations, continuous_samples, trial)
+            violations = self._constraint_violations(continuous_samples)
+        if continue_counter>0:
             print()
         return continuous_samples
 
     def _sample_continuous(self, trial_num, trial):
+        import numpy as np
         # samples per trial
         continuous_output = {}
         self.continuous_factor_samples[trial_num] = continuous_output
+        # Seeded from `random`, so that `random.seed` still makes sampling repeatable
+        rng = np.random.default_rng(random.getrandbits(64))
         for cFactor in self.continuous_factors:
             dist = cFactor.get_distribution()
             if hasattr(dist, "reset"):
                 dist.reset()
+            if self._samples_by_column(cFactor):
+                columns = [self._dependent_column(dependent, continuous_output, trial)
+                           for dependent in cFactor.get_levels()]
+                continuous_output[cFactor.name] = dist.sample_n(self._trials_per_sample, rng, columns).tolist()
+                continue
             # sample for current cfactor
             continuous_samples = []
             continuous_output[cFactor.name] = continuous_samples
             for i in range(self._trials_per_sample):
-                sample_input = []
-                # Get dependent factors for current factor
-                dependents = cFactor.get_levels()
-                for j, dependent in enumerate(dependents):
-                    if isinstance(dependent, ContinuousFactorWindow):
-                        sample_input.append(dependent.get_window_val(i, continuous_output))
-                    elif isinstance(dependent, ContinuousFactor):
-                        sample_input.append(continuous_output[dependent.name][i])
-                    elif isinstance(dependent, (int, float)):
-                        sample_input.append(dependent)
-                    elif isinstance(dependent, Factor) and dependent.name in trial:
-                        sample_input.append(trial[dependent.name][i])
-                    else:  
-                        raise RuntimeError("Dependency {} is not continuous factor or number or factor in the design".format(dependent))
-                c_value = cFactor.generate(sample_input)
+                c_value = cFactor.generate(self._trial_input(cFactor, i, continuous_output, trial))
                 continuous_samples.append(c_value)
             continuous_output[cFactor.name] = continuous_samples
         return continuous_output
 
-    def _check_constraints(self, continuous_samples):
+    def _trial_input(self, cFactor: ContinuousFactor, i: int, continuous_output, trial) -> list:
+        sample_input = []
+        # Get dependent factors for current factor
+        dependents = cFactor.get_levels()
+        for j, dependent in enumerate(dependents):
+            if isinstance(dependent, ContinuousFactorWindow):
+                sample_input.append(dependent.get_window_val(i, continuous_output))
+            elif isinstance(dependent, ContinuousFactor):
+                sample_input.append(continuous_output[dependent.name][i])
+            elif isinstance(dependent, (int, float)):
+                sample_input.append(dependent)
+            elif isinstance(dependent, Factor) and dependent.name in trial:
+                sample_input.append(trial[dependent.name][i])
+            else:  
+                raise RuntimeError("Dependency {} is not continuous factor or number or factor in the design".format(dependent))
+        return sample_input
+
+    def _resample_continuous_trials(self, violations: List[int], continuous_output, trial) -> None:
+        """Resamples every continuous factor at the given trials, in place.
+        A factor is also recomputed at trials whose window covers a changed
+        value of a factor it depends on, and a cumulative factor keeps its
+        other increments while its running sum is recomputed."""
+        num_trials = cast(int, self._trials_per_sample)
+        changed = cast(Dict[str, Set[int]], {})
+        for cFactor in self.continuous_factors:
+            trials = set(violations)
+            for dependent in cFactor.get_levels():
+                if isinstance(dependent, ContinuousFactorWindow):
+                    for f in dependent.factors:
+                        for i in changed.get(f.name, set()):
+                            trials.update(range(i, min(i + dependent.width, num_trials)))
+                elif isinstance(dependent, ContinuousFactor):
+                    trials.update(changed.get(dependent.name, set()))
+            changed[cFactor.name] = trials
+            values = continuous_output[cFactor.name]
+            dist = cFactor.get_distribution()
+            if isinstance(dist, CustomDistribution) and dist.cumulative:
+                increments = [v - p for v, p in zip(values, [0.] + values[:-1])]
+                for i in trials:
+                    increments[i] = dist.func(*self._trial_input(cFactor, i, continuous_output, trial))
+                first = min(trials)
+                total = values[first - 1] if first > 0 else 0.
+                for i in range(first, num_trials):
+                    total += increments[i]
+                    values[i] = total
+                # Every later running sum changes, so its dependents must too
+                changed[cFactor.name] = set(range(first, num_trials))
+            else:
+                for i in sorted(trials):
+                    values[i] = cFactor.generate(self._trial_input(cFactor, i, continuous_output, trial))
+
+    def _constraint_violations(self, continuous_samples) -> List[int]:
+        import numpy as np
         from sweetpea._internal.constraint import ContinuousConstraint
-        continue_constraints = []
+        failed = cast(Set[int], set())
         for c in self.constraints:
             if isinstance(c, ContinuousConstraint):
-                continue_constraints.append(c)
-        if len(continue_constraints)==0:
-            return True
-        for c in continue_constraints:
-            _factors = c.factors
-            _function = c.constraint_function 
-            num_trials = len(continuous_samples[_factors[0].name])
-            for i in range(num_trials):
-                inputs = [continuous_samples[f.name][i] for f in _factors]
-                if not _function(*inputs):
-                    return False
-        return True
-        
+                ok = c.check_columns([continuous_samples[f.name] for f in c.factors])
+                failed.update(np.flatnonzero(~ok).tolist())
+        return sorted(failed)
+
+    @staticmethod
+    def _samples_by_column(cFactor: ContinuousFactor) -> bool:
+        """A factor's values can be drawn as one column unless each value
+        depends on the values before it, through a cumulative distribution or
+        a window over other continuous factors."""
+        dist = cFactor.get_distribution()
+        if isinstance(dist, CustomDistribution) and dist.cumulative:
+            return False
+        return not any(isinstance(dependent, ContinuousFactorWindow) for dependent in cFactor.get_levels())
+
+    def _dependent_column(self, dependent, continuous_output, trial) -> list:
+        if isinstance(dependent, ContinuousFactor):
+            return continuous_output[dependent.name]
+        elif isinstance(dependent, (int, float)):
+            return [dependent] * cast(int, self._trials_per_sample)
+        elif isinstance(dependent, Factor) and dependent.name in trial:
+            return trial[dependent.name]
+        raise RuntimeError("Dependency {} is not continuous factor or number or factor in the design".format(dependent))
+
+    def _check_constraints(self, continuous_samples):
+        return not self._constraint_violations(continuous_samples)
+
     def show_errors(self) -> bool:
         failed = False
         if self.errors:
@@ -511,14 +632,19 @@ class Block:
         """Apply all constraints to build a :class:`.BackendRequest`. Formerly
         known as ``__desugar``.
         """
+        return self.cached_encoding('backend_request', self.__build_backend_request)
+
+    def __build_backend_request(self) -> BackendRequest:
         fresh = 1 + self.variables_per_sample()
         backend_request = BackendRequest(fresh)
 
         from sweetpea._internal.constraint import MinimumTrials
-        for c in self.constraints:
-            if isinstance(c, MinimumTrials):
-                continue
-            c.apply(self, backend_request)
+        with span('build_backend_request'):
+            for c in self.constraints:
+                if isinstance(c, MinimumTrials):
+                    continue
+                with span('apply_constraint', constraint=type(c).__name__):
+                    c.apply(self, backend_request)
 
         return backend_request
 
@@ -0,0 +1,87 @@
+import json
+import os
+
+from typing import Dict, Iterable, List, Optional, Tuple, cast
+
+import numpy as np
+
+from sweetpea._internal.primitive import ContinuousFactor, Factor
+
+
+"""
+Columnar export of experiments, for tools that load many experiments at once.
+Each factor becomes one array of shape (experiments, trials): for a factor with
+levels, the array holds indices into the factor's level names, with -1 for a
+trial without a level, and for a continuous factor, the array holds values. A
+manifest lists every column as
+
+    {
+    'name': '<factor name>',
+    'key': '<array name>',
+    'levels': ['<level name>', ...] or None for a continuous factor
+    }
+
+and records the column order. Experiments are coded one at a time, so they can
+come from a generator such as `enumerate_trials`.
+"""
+MANIFEST = 'manifest'
+
+
+def experiment_columns(factors: List[Factor], experiments: Iterable[dict]) -> Tuple[List[dict], List[np.ndarray]]:
+    manifest = cast(List[dict], [])
+    codes = cast(List[Optional[Dict[str, int]]], [])
+    for i, f in enumerate(factors):
+        if isinstance(f, ContinuousFactor):
+            manifest.append({'name': f.name, 'key': f'factor_{i}', 'levels': None})
+            codes.append(None)
+        else:
+            levels = [l.name for l in f.levels]
+            manifest.append({'name': f.name, 'key': f'factor_{i}', 'levels': levels})
+            index = {'': -1}
+            for code, name in enumerate(levels):
+                index.setdefault(name, code)
+            codes.append(index)
+    dtypes = [np.float64 if coding is None else _code_type(len(coding)) for coding in codes]
+    rows = cast(List[List[np.ndarray]], [[] for f in factors])
+    for experiment in experiments:
+        for f, coding, dtype, column in zip(factors, codes, dtypes, rows):
+            values = experiment[f.name]
+            if coding is None:
+                column.append(np.asarray(values, dtype=dtype))
+            else:
+                column.append(np.fromiter((coding[v] for v in values), dtype=dtype, count=len(values)))
+    columns = [np.stack(column) if column else np.empty((0, 0), dtype=dtype)
+               for column, dtype in zip(rows, dtypes)]
+    return manifest, columns
+
+
+def save_npz(filename: str, manifest: List[dict], columns: List[np.ndarray]) -> None:
+    arrays = {entry['key']: column for entry, column in zip(manifest, columns)}
+    np.savez_compressed(filename, **{MANIFEST: np.array(json.dumps(manifest))}, **arrays)
+
+
+def save_npy(directory: str, manifest: List[dict], columns: List[np.ndarray]) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for entry, column in zip(manifest, columns):
+        np.save(os.path.join(directory, entry['key'] + '.npy'), column)
+    with open(os.path.join(directory, MANIFEST + '.json'), 'w') as f:
+        json.dump(manifest, f)
+
+
+def load(path: str) -> Dict[str, Tuple[np.ndarray, Optional[list]]]:
+    """Loads the columns saved by `save_npz` or, memory mapped, by `save_npy`."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, MANIFEST + '.json')) as f:
+            manifest = json.load(f)
+        return {entry['name']: (np.load(os.path.join(path, entry['key'] + '.npy'), mmap_mode='r'), entry['levels'])
+                for entry in manifest}
+    with np.load(path) as data:
+        manifest = json.loads(str(data[MANIFEST]))
+        return {entry['name']: (data[entry['key']], entry['levels']) for entry in manifest}
+
+
+def _code_type(count: int) -> type:
+    for dtype, limit in [(np.int8, 127), (np.int16, 32767)]:
+        if count <= limit:
+            return dtype
+    return np.int32
@@ -3,12 +3,12 @@
 import operator as op
 from abc import abstractmethod
 from copy import deepcopy
-from typing import List, Tuple, Any, Union, cast, Dict, Callable, Optional
+from typing import TYPE_CHECKING, List, Tuple, Any, Union, cast, Dict, Callable, Optional, Sequence
 from itertools import chain, product
 from math import ceil
 import inspect
 
-from sweetpea._internal.base_constraint import Constraint
+from sweetpea._internal.base_constraint import Constraint, CompiledCheck, CONFORMS
 from sweetpea._internal.iter import chunk, chunk_list
 from sweetpea._internal.block import Block, BlockGeometry
 from sweetpea._internal.cross_block import MultiCrossBlockRepeat
@@ -19,6 +19,9 @@ from sweetpea._internal.argcheck import argcheck, make_istuple, make_islistof
 from sweetpea._internal.weight import combination_weight
 from sweetpea._internal.beforestart import BeforeStart
 
+if TYPE_CHECKING:
+    import numpy as np
+
 def validate_factor(block: Block, factor: Factor) -> None:
     if not block.has_factor(factor):
         raise ValueError(("A factor with name '{}' wasn't found in the design. "
@@ -85,6 +88,9 @@ class Consistency(Constraint):
         # conformance by construction in combinatoric
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        return CONFORMS
+
 class Cross(Constraint):
     """We represent the fully crossed constraint by allocating additional
     boolean variables to represent each unique state. Only factors in crossing
@@ -202,6 +208,9 @@ class Cross(Constraint):
         # conformance by construction or direct checking in combinatoric
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        return CONFORMS
+
 class Sustain(Constraint):
     """A sustain constraint forces consecutive trials to have the same variable assignments"""
 
@@ -380,6 +389,9 @@ class Derivation(Constraint):
     def potential_sample_conforms(self, sample: dict, block: Block) -> bool:
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        return CONFORMS
+
 
 class _KInARow(Constraint):
     def __init__(self, k, level):
@@ -486,6 +498,38 @@ class _KInARow(Constraint):
 
         return all(block.map_block_trial_ranges(self.within_block, check_sequence))
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        import numpy as np
+        factor = self.level.factor
+        index = _level_index(factor, self.level)
+        ranges = block.map_block_trial_ranges(self.within_block, lambda start, end: (start, end))
+
+        def check(coded: dict) -> 'np.ndarray':
+            matches = coded[factor] == index
+            conforms = np.ones(len(matches), dtype=bool)
+            for start, end in ranges:
+                rows, counts = _run_lengths(matches[:, start:end])
+                conforms &= self._counts_conform(rows, counts, len(matches))
+            return conforms
+        return CompiledCheck([factor], check)
+
+    def _counts_conform(self, rows: 'np.ndarray', counts: 'np.ndarray', sample_count: int) -> 'np.ndarray':
+        """Like `_potential_counts_conform` for each of `sample_count` samples,
+        given the sample and length of each run in order. Subclasses check the
+        runs of all samples at once."""
+        import numpy as np
+        bounds = np.searchsorted(rows, np.arange(sample_count + 1))
+        return np.array([self._potential_counts_conform(counts[bounds[i]:bounds[i + 1]].tolist())
+                         for i in range(sample_count)], dtype=bool)
+
+    def _each_count_conforms(self, rows: 'np.ndarray', counts: 'np.ndarray', conforms: 'np.ndarray',
+                             sample_count: int) -> 'np.ndarray':
+        # For checks of each run on its own, given whether each run conforms
+        import numpy as np
+        result = np.ones(sample_count, dtype=bool)
+        result[rows[~conforms]] = False
+        return result
+
     @abstractmethod
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         pass
@@ -535,6 +579,9 @@ class AtMostKInARow(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return self._potential_counts_conform_individually(counts, op.le)
 
+    def _counts_conform(self, rows: 'np.ndarray', counts: 'np.ndarray', sample_count: int) -> 'np.ndarray':
+        return self._each_count_conforms(rows, counts, counts <= self.k, sample_count)
+
 
 class AtLeastKInARow(_KInARow):
     """This is more complicated that AtMostKInARow. We collect all the boolean
@@ -594,6 +641,9 @@ class AtLeastKInARow(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return self._potential_counts_conform_individually(counts, op.ge)
 
+    def _counts_conform(self, rows: 'np.ndarray', counts: 'np.ndarray', sample_count: int) -> 'np.ndarray':
+        return self._each_count_conforms(rows, counts, counts >= self.k, sample_count)
+
 
 class ExactlyK(_KInARow):
     """Requires that if the given level exists at all, it must exist in a trial
@@ -621,6 +671,10 @@ class ExactlyK(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return sum(counts) == self.k
 
+    def _counts_conform(self, rows: 'np.ndarray', counts: 'np.ndarray', sample_count: int) -> 'np.ndarray':
+        import numpy as np
+        return np.bincount(rows, weights=counts, minlength=sample_count) == self.k
+
     def init_within_block(self, within_block: BlockGeometry) -> None:
         super().init_within_block(within_block)
 
@@ -681,6 +735,9 @@ class ExactlyKInARow(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return self._potential_counts_conform_individually(counts, op.eq)
 
+    def _counts_conform(self, rows: 'np.ndarray', counts: 'np.ndarray', sample_count: int) -> 'np.ndarray':
+        return self._each_count_conforms(rows, counts, counts == self.k, sample_count)
+
 
 class ExactlyKMultipleInARow(_KInARow):
     def apply_to_backend_request(
@@ -746,6 +803,9 @@ class ExactlyKMultipleInARow(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return all(c % self.k == 0 for c in counts)
 
+    def _counts_conform(self, rows: 'np.ndarray', counts: 'np.ndarray', sample_count: int) -> 'np.ndarray':
+        return self._each_count_conforms(rows, counts, counts % self.k == 0, sample_count)
+
 
 def filter_level(who, level, factor_ok: bool = False):
     if factor_ok and isinstance(level, Factor):
@@ -852,6 +912,12 @@ class Exclude(Constraint):
                 return False
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        import numpy as np
+        factor = self.factor
+        index = _level_index(factor, self.level)
+        return CompiledCheck([factor], lambda coded: ~np.any(coded[factor] == index, axis=1))
+
 class Pin(Constraint):
     def __init__(self, index, level):
         level = filter_level("Pin", level)
@@ -916,6 +982,15 @@ class Pin(Constraint):
         else:
             return False
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        import numpy as np
+        factor = self.factor
+        index = _level_index(factor, self.level)
+        trial_nos = block.get_trial_numbers(self.factor, self.index, self.within_block)
+        if not trial_nos:
+            return CompiledCheck([], lambda coded: False)
+        return CompiledCheck([factor], lambda coded: np.all(coded[factor][:, trial_nos] == index, axis=1))
+
 class Reify(Constraint):
     """The only purpose of this constraint is to make a factor
     non-implied, so that it's exposed to a constraint solver."""
@@ -937,6 +1012,9 @@ class Reify(Constraint):
     def potential_sample_conforms(self, sample: dict, block: Block) -> bool:
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        return CONFORMS
+
     def desugar(self, replacements: dict) -> List:
         factor = replacements.get(self.factor, [self.factor, self.factor])[1]
         return [Reify(factor)]
@@ -974,6 +1052,9 @@ class MinimumTrials(Constraint):
     def potential_sample_conforms(self, sample: dict, block: Block) -> bool:
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        return CONFORMS
+
     def sustain_within_block(self, sustain_count: int) -> None:
         self.trials *= sustain_count
 
@@ -994,6 +1075,8 @@ class ContinuousConstraint(Constraint):
         #argcheck(who, constraint_function, Callable, "constraint function")
         if not isinstance(constraint_function, Callable):
             raise ValueError(f"{who}: expected constraint function, given {constraint_function}")
+        # Whether the function works on whole columns; None until it is first tried
+        self.__vectorized = cast(Optional[bool], None)
         # TODO: validation
 
     def validate(self, block: Block) -> None:
@@ -1006,6 +1089,27 @@ class ContinuousConstraint(Constraint):
                 raise RuntimeError("Continuous factor {} not defined in the design".format(f))
 
 
+    def check_columns(self, columns: List[Sequence[Any]]) -> 'np.ndarray':
+        """Checks every trial at once, given one column of values for each
+        factor, and returns whether each trial meets the constraint. The
+        constraint function is first called on whole NumPy columns; if it
+        does not produce one boolean per trial, it is called trial by trial."""
+        import numpy as np
+        arrays = [np.asarray(column) for column in columns]
+        num_trials = len(arrays[0]) if arrays else 0
+        if self.__vectorized is not False:
+            try:
+                with np.errstate(all='ignore'):
+                    ok = np.asarray(self.constraint_function(*arrays))
+                if ok.dtype == bool and ok.shape == (num_trials,):
+                    self.__vectorized = True
+                    return ok
+            except Exception:
+                pass
+            self.__vectorized = False
+        return np.array([bool(self.constraint_function(*[column[i] for column in columns]))
+                         for i in range(num_trials)], dtype=bool)
+
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
@@ -1021,6 +1125,9 @@ class ContinuousConstraint(Constraint):
     def potential_sample_conforms(self, sample: dict, block: Block) -> bool:
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        return CONFORMS
+
     def apply(self, block: Block, backend_request: BackendRequest) -> None:
         """Do nothing."""
 
@@ -1181,6 +1288,51 @@ class LatinSquare(Constraint):
 
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        import numpy as np
+        if len(self.factors) == 1:
+            return CONFORMS
+
+        (diagonal_length, main_factor_idx) = self._get_shape()
+        sustain_count = block.sustain_count(self.factors[0])
+        preamble_size = block.factor_preamble_size(self.factors[0])
+        num_trials = block.trials_per_sample()
+        main_factor = self.factors[main_factor_idx]
+
+        # The checked trials, the segment of each, and each factor's rotation there
+        trials = []
+        segments = []
+        factor_rotations = cast(List[List[int]], [[] for f in self.factors])
+        i = preamble_size
+        rotations = self._make_rotations()
+        while i < num_trials:
+            for j in range(0, diagonal_length):
+                if i+j < num_trials:
+                    trials.append(i+j)
+                    segments.append(i)
+                    for idx in range(len(self.factors)):
+                        factor_rotations[idx].append(rotations[idx])
+            self._step_rotations(rotations, main_factor_idx)
+            i += diagonal_length * sustain_count
+        trial_nos = np.array(trials, dtype=int)
+        segment_nos = np.array(segments, dtype=int)
+        expected_rotations = [np.array(r, dtype=int) for r in factor_rotations]
+        level_counts = [len(f.levels) for f in self.factors]
+        # Numbers each pair of a segment and a main-factor level, including -1
+        pair_base = segment_nos * (len(main_factor.levels) + 1) + 1
+
+        def check(coded: dict) -> 'np.ndarray':
+            main = coded[main_factor][:, trial_nos]
+            # A trial without a main-factor level is checked as its first level
+            k = np.where(main < 0, 0, main)
+            conforms = np.ones(len(main), dtype=bool)
+            for f, rotation, count in zip(self.factors, expected_rotations, level_counts):
+                conforms &= np.all(coded[f][:, trial_nos] == (k + rotation) % count, axis=1)
+            # Make sure main-factor selections are unique
+            pairs = np.sort(pair_base + main, axis=1)
+            return conforms & np.all(pairs[:, 1:] != pairs[:, :-1], axis=1)
+        return CompiledCheck(list(self.factors), check)
+
     def derivable_factors(self, block: Block) -> Tuple[List[Factor], List[Factor]]:
         (diagonal_length, main_factor_idx) = self._get_shape()
         return (self.factors[:main_factor_idx] + self.factors[main_factor_idx+1:],
@@ -1257,6 +1409,17 @@ class Sequential(Constraint):
 
         return True
 
+    def compile_check(self, block: Block) -> CompiledCheck:
+        import numpy as np
+        sustain_count = block.sustain_count(self.factor)
+        preamble_size = block.factor_preamble_size(self.factor)
+        num_trials = block.trials_per_sample()
+        f = self.factor
+
+        trial_nos = np.arange(preamble_size, num_trials, sustain_count)
+        expected = (trial_nos - preamble_size) % len(f.levels)
+        return CompiledCheck([f], lambda coded: np.all(coded[f][:, trial_nos] == expected, axis=1))
+
     def __eq__(self, other):
         return (isinstance(other, Sequential) and
                 self.factor == other.factor)
@@ -1267,6 +1430,23 @@ class Sequential(Constraint):
     def derivable_factors(self, block: Block) -> Tuple[List[Factor], List[Factor]]:
         return ([self.factor], [])
 
+def _level_index(factor: Factor, level: Level) -> int:
+    for i, l in enumerate(factor.levels):
+        if l is level:
+            return i
+    return -1
+
+def _run_lengths(matches: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """The runs of true values in each row of a boolean array, as the row and
+    the length of each run, in order."""
+    import numpy as np
+    padded = np.zeros((matches.shape[0], matches.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = matches
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+    return rows, ends - starts
+
 def _val_name(x):
     # Works for Level objects or plain strings
     return getattr(x, "name", x)
@@ -0,0 +1,85 @@
+from itertools import chain, repeat
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, cast
+
+from sweetpea._internal.base_constraint import Constraint
+from sweetpea._internal.primitive import Factor
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+"""
+Checks samples against a block's constraints. Each constraint is compiled
+once, through :func:`.Constraint.compile_check`, into a check over a batch of
+samples whose levels are coded as NumPy integer arrays, one of shape
+(samples, trials) per factor, so that the cost of each array operation is
+shared by every sample in the batch. Checking samples one at a time, as
+RandomGen would for each candidate, spends more on array operations than the
+plain Python check, so callers pass as many samples as they have.
+
+Constraints that hold for every sample are skipped, and a constraint without a
+compiled form falls back to :func:`.Constraint.potential_sample_conforms`.
+"""
+class ConstraintChecker:
+
+    def __init__(self, block):
+        self.block = block
+        self.checks = cast(List[Tuple[Constraint, Optional[Callable[[dict], Any]]]], [])
+        # Levels are coded by identity, since samples hold the factors' own levels
+        self.level_codes = cast(Dict[Factor, Dict[int, int]], {})
+        for constraint in block.constraints:
+            compiled = constraint.compile_check(block)
+            if compiled is None:
+                self.checks.append((constraint, None))
+            elif compiled.check is not None:
+                self.checks.append((constraint, compiled.check))
+                for f in compiled.factors:
+                    if f not in self.level_codes:
+                        self.level_codes[f] = {id(l): i for i, l in enumerate(f.levels)}
+
+    def encode(self, samples: Sequence[dict]) -> Dict[Factor, 'np.ndarray']:
+        """Codes the levels of the factors that compiled checks read, given
+        samples with the same number of trials that map factors to lists of
+        levels, as one array of shape (samples, trials) per factor."""
+        import numpy as np
+        coded = {}
+        for f, codes in self.level_codes.items():
+            levels = chain.from_iterable(sample[f] for sample in samples)
+            values = np.array(list(map(codes.get, map(id, levels), repeat(-1))), dtype=np.int64)
+            coded[f] = values.reshape(len(samples), -1)
+        return coded
+
+    def conforming(self, samples: Sequence[dict]) -> 'np.ndarray':
+        """Returns whether each of the samples conforms to every constraint."""
+        import numpy as np
+        coded = self.encode(samples)
+        conforms = np.ones(len(samples), dtype=bool)
+        for constraint, check in self.checks:
+            conforms &= self.__conforming(constraint, check, samples, coded)
+        return conforms
+
+    def mismatches(self, sample: dict) -> List[Constraint]:
+        """Returns the constraints that a sample does not conform to."""
+        coded = self.encode([sample])
+        return [constraint for constraint, check in self.checks
+                if not self.__conforming(constraint, check, [sample], coded)[0]]
+
+    def conforms(self, sample: dict) -> bool:
+        return bool(self.conforming([sample])[0])
+
+    @staticmethod
+    def describe(constraint: Constraint) -> str:
+        """The name of a constraint as reported in a sample's mismatches."""
+        pretty_name = constraint.__class__.__name__
+        if hasattr(constraint, 'k'):
+            pretty_name += f', {constraint.k}'  # type: ignore
+        if hasattr(constraint, 'level'):
+            pretty_name += f', {constraint.level}'  # type: ignore
+        return pretty_name
+
+    def __conforming(self, constraint: Constraint, check, samples: Sequence[dict], coded: dict) -> 'np.ndarray':
+        import numpy as np
+        if check is None:
+            return np.array([constraint.potential_sample_conforms(sample, self.block) for sample in samples],
+                            dtype=bool)
+        return np.broadcast_to(check(coded), (len(samples),))
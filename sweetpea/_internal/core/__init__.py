@@ -46,6 +46,7 @@ Functions
   * :func:`~sweetpea.core.generate.is_satisfiable.cnf_is_satisfiable`
   * :func:`~sweetpea.core.generate.sample_non_uniform.sample_non_uniform`
   * :func:`~sweetpea.core.generate.sample_non_uniform.sample_non_uniform_from_specification`
+  * :func:`~sweetpea.core.generate.sample_non_uniform.iterate_non_uniform`
   * :func:`~sweetpea.core.generate.sample_uniform.sample_uniform`
   * :func:`~sweetpea.core.generate.utility.combine_cnf_with_requests`
 
@@ -60,9 +61,23 @@ Classes
   * :class:`~sweetpea.core.generate.utility.Solution`
 """
 
+from typing import TYPE_CHECKING
+
 from .cnf import Clause, CNF, Var
-from .generate import (
-    AssertionType, GenerationRequest, Solution,
-    cnf_is_satisfiable, sample_non_uniform, sample_non_uniform_from_specification, sample_uniform,
-    combine_cnf_with_requests
-)
+from .generate import AssertionType, GenerationRequest, Solution, combine_cnf_with_requests
+
+if TYPE_CHECKING:
+    from .generate import (
+        cnf_is_satisfiable, sample_non_uniform, sample_non_uniform_from_specification, sample_uniform,
+        iterate_non_uniform
+    )
+
+
+def __getattr__(name: str):
+    # The solving functions are imported on first use, as in `.generate`.
+    from . import generate
+    if name not in generate._LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = generate._load(name)
+    globals()[name] = value
+    return value
@@ -6,10 +6,41 @@ SweetPea offers three mechanisms for CNF interaction:
 #. Sampling solutions from a CNF formula *non*-uniformly via
    :func:`sample_non_uniform`.
 #. Determining whether a CNF formula is satisfiable via :func:`is_satisfiable`.
+
+The solving functions are imported on first use, so that the solver tools they
+call on are only loaded when a formula is solved or sampled.
 """
 
 
-from .is_satisfiable import cnf_is_satisfiable
-from .sample_non_uniform import sample_non_uniform, sample_non_uniform_from_specification
-from .sample_uniform import sample_uniform
+from importlib import import_module
+from typing import TYPE_CHECKING
+
 from .utility import AssertionType, GenerationRequest, SampleType, ProblemSpecification, Solution, combine_cnf_with_requests
+
+if TYPE_CHECKING:
+    from .is_satisfiable import cnf_is_satisfiable
+    from .sample_non_uniform import sample_non_uniform, sample_non_uniform_from_specification, iterate_non_uniform
+    from .sample_uniform import sample_uniform
+
+
+# The module that defines each function that is imported on first use.
+_LAZY = {
+    'cnf_is_satisfiable': '.is_satisfiable',
+    'sample_non_uniform': '.sample_non_uniform',
+    'sample_non_uniform_from_specification': '.sample_non_uniform',
+    'iterate_non_uniform': '.sample_non_uniform',
+    'sample_uniform': '.sample_uniform',
+}
+
+
+def _load(name: str):
+    """Imports one of the functions that are imported on first use."""
+    value = getattr(import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _load(name)
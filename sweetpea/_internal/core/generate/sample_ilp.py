@@ -3,6 +3,7 @@ from typing import List, Optional
 from pathlib import Path
 
 from ..cnf import CNF, Var
+from ...instrumentation import span
 from .utility import GenerationRequest, Solution, combine_and_save_opb, temporary_cnf_file
 
 
@@ -42,7 +43,8 @@ def compute_solutions(filename: Path,
             if count == 0:
                 return solutions
             model = gp.read(filename.name, env)
-            model.optimize()
+            with span('solver_call', solver='Gurobi'):
+                model.optimize()
             
             # TODO: Look into more error codes?
             # https://www.gurobi.com/documentation/9.5/refman/optimization_status_codes.html
@@ -59,7 +61,7 @@ def compute_solutions(filename: Path,
             solutions += [solution]
 
 def update_file(filename: Path, solution: List[int]):
-    with open(filename, 'a') as opb_file:
+    with span('file_io', operation='update_opb'), open(filename, 'a') as opb_file:
         false_count = len(list(v for v in solution if v < 0))
         opb_file.write('\n' + ' '.join(map(lambda x :  '-1 v' + str(abs(x)) \
                                                     if str(x)[0] == '-' \
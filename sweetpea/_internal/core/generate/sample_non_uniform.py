@@ -14,14 +14,22 @@
 
 
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 from ..cnf import CNF
-from .tools.cryptominisat import DEFAULT_DOCKER_MODE_ON, cryptominisat_solve
-from .utility import GenerationRequest, ProblemSpecification, Solution, combine_and_save_cnf, temporary_cnf_file
+from ...instrumentation import span
+from ...progress import report, should_stop
+from .tools.cryptominisat import DEFAULT_DOCKER_MODE_ON, HAS_PYCRYPTOSAT, cryptominisat_solve
+from .utility import (
+    GenerationRequest, ProblemSpecification, Solution,
+    combine_and_save_cnf, combine_cnf_with_requests, save_cnf, temporary_cnf_file
+)
 
+if HAS_PYCRYPTOSAT:
+    import pycryptosat
 
-__all__ = ['sample_non_uniform', 'sample_non_uniform_from_specification']
+
+__all__ = ['sample_non_uniform', 'sample_non_uniform_from_specification', 'iterate_non_uniform']
 
 
 def sample_non_uniform(count: int,
@@ -53,6 +61,45 @@ def sample_non_uniform_from_specification(spec: ProblemSpecification) -> List[So
     return sample_non_uniform(spec.sample_count, spec.cnf, spec.fresh, spec.support, spec.requests)
 
 
+def iterate_non_uniform(initial_cnf: CNF,
+                        fresh: int,
+                        support: int,
+                        generation_requests: List[GenerationRequest]
+                        ) -> Iterator[Solution]:
+    """Lazily enumerates every solution to a CNF problem that is distinct on
+    its first ``support`` variables.
+
+    When the ``pycryptosat`` library is available, a single incremental solver
+    is kept alive and a blocking clause is added after each solution, so the
+    problem is encoded only once. Otherwise, the problem file is re-solved
+    with a growing header of blocking clauses, as in :func:`compute_solutions`.
+    """
+    combined_cnf = combine_cnf_with_requests(initial_cnf, fresh, support, generation_requests)
+    if HAS_PYCRYPTOSAT:
+        solver = pycryptosat.Solver()
+        for clause in combined_cnf.as_list_of_list_of_ints():
+            solver.add_clause(clause)
+        while True:
+            with span('solver_call', solver='pycryptosat'):
+                sat, assignment = solver.solve()
+            if not sat:
+                return
+            solution = [var if assignment[var] else -var for var in range(1, support + 1)]
+            solver.add_clause([-var for var in solution])
+            yield Solution(solution, 1)
+    else:
+        with temporary_cnf_file() as cnf_file:
+            save_cnf(cnf_file, combined_cnf, fresh, support)
+            while True:
+                with span('solver_call', solver='CryptoMiniSat'):
+                    full_solution = cryptominisat_solve(cnf_file)
+                if not full_solution:
+                    return
+                solution = full_solution[:support]
+                update_file(cnf_file, solution)
+                yield Solution(solution, 1)
+
+
 def compute_solutions(filename: Path,
                       support: int,
                       count: int,
@@ -62,22 +109,24 @@ def compute_solutions(filename: Path,
     """Attempts to solve a CNF problem ``count`` times with CryptoMiniSAT. Each
     time a solution is generated, it is added to the problem file's header so
     new solutions may be generated. If at any point CryptoMiniSAT fails to
-    generate a solution, execution terminates and the existing list of
-    solutions will be returned.
+    generate a solution, or if sampling is cancelled, execution terminates
+    and the existing list of solutions will be returned.
     """
     # TODO: Implement iteratively instead of recursively.
     while True:
         if solutions is None:
             solutions = []
-        if count == 0:
+        if count == 0 or should_stop():
             return solutions
-        solution = cryptominisat_solve(filename, use_docker)
+        with span('solver_call', solver='CryptoMiniSat'):
+            solution = cryptominisat_solve(filename, use_docker)
         if not solution:
             return solutions
         solution = solution[:support]
         update_file(filename, solution)
         count -= 1
         solutions += [solution]
+        report('sample', len(solutions), requested=len(solutions) + count)
 
 
 def update_file(filename: Path, solution: List[int]):
@@ -94,10 +143,11 @@ def update_file(filename: Path, solution: List[int]):
     def add_clause_to_header(clause: str) -> str:
         return update_header(1, clause)
 
-    lines = filename.read_text().strip().splitlines()
-    updated_header = add_clause_to_header(lines[0])
-    negated_solution = [-1 * var for var in solution]
-    negated_solution_str = ' '.join(str(var) for var in negated_solution + [0])
-    updated_lines = [updated_header] + lines[1:] + [negated_solution_str]
-    updated_contents = '\n'.join(updated_lines)
-    filename.write_text(updated_contents)
+    with span('file_io', operation='update_cnf'):
+        lines = filename.read_text().strip().splitlines()
+        updated_header = add_clause_to_header(lines[0])
+        negated_solution = [-1 * var for var in solution]
+        negated_solution_str = ' '.join(str(var) for var in negated_solution + [0])
+        updated_lines = [updated_header] + lines[1:] + [negated_solution_str]
+        updated_contents = '\n'.join(updated_lines)
+        filename.write_text(updated_contents)
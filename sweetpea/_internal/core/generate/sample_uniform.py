@@ -6,6 +6,7 @@
 from typing import List
 
 from ..cnf import CNF
+from ...instrumentation import span
 from .tools.unigen import DEFAULT_DOCKER_MODE_ON, call_unigen
 from .utility import GenerationRequest, Solution, combine_and_save_cnf, temporary_cnf_file
 
@@ -28,7 +29,8 @@ def sample_uniform(sample_count: int,
         combine_and_save_cnf(cnf_file, initial_cnf, fresh, support, generation_requests)
         solver_name = "UniGen" if not use_cmsgen else "CMSGen"
         print(f"Running {solver_name}...")
-        solution_str = call_unigen(sample_count, cnf_file, docker_mode=use_docker, use_cmsgen=use_cmsgen)
+        with span('solver_call', solver=solver_name):
+            solution_str = call_unigen(sample_count, cnf_file, docker_mode=use_docker, use_cmsgen=use_cmsgen)
         # TODO: Validate that skipping the comments is the intended
         #       functionality. The Haskell code doesn't appear to need to do
         #       this, but this could be due to the Unigen upgrade or something
@@ -61,8 +61,6 @@ from os import chmod, environ
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 from typing import Any, Dict, Iterator, List, Optional, Tuple
-from urllib.request import Request, urlopen
-from zipfile import ZipFile, ZipInfo
 
 
 __all__ = [
@@ -172,6 +170,7 @@ def _get_release_from_url(url: str) -> List[JSONDict]:
     """Queries the GitHub API to get the assets corresponding to a release
     specified by the given URL.
     """
+    from urllib.request import urlopen
     response = urlopen(url)
     response_bytes = response.read()
     response_text = response_bytes.decode()
@@ -239,6 +238,8 @@ def download_and_extract_asset_zip_for_release(to_bin_dir: Path,
     machine from the indicated tag, or else use the automatically deduced
     system and machine from the latest release.
     """
+    from urllib.request import Request, urlopen
+    from zipfile import ZipFile, ZipInfo
     asset_url = get_asset_url_for_release(system, machine, tag)
     ensure_dir_path_exists(to_bin_dir)
     request = Request(asset_url)
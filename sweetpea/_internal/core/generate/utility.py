@@ -13,6 +13,7 @@ from typing import Any, Dict, Iterator, List, NamedTuple, Optional
 from uuid import uuid4 as generate_uuid
 
 from ..cnf import CNF, Var
+from ...instrumentation import span
 
 
 __all__ = [
@@ -137,15 +138,16 @@ def combine_cnf_with_requests(initial_cnf: CNF,
     given :class:`GenerationRequests <.GenerationRequest>`.
     """
     fresh_cnf = CNF.from_fresh(fresh)
-    for request in generation_requests:
-        if request.assertion_type is AssertionType.EQ:
-            fresh_cnf.assert_k_of_n(request.k, request.boolean_values)
-        elif request.assertion_type is AssertionType.LT:
-            fresh_cnf.assert_k_less_than_n(request.k, request.boolean_values)
-        elif request.assertion_type is AssertionType.GT:
-            fresh_cnf.assert_k_greater_than_n(request.k, request.boolean_values)
-        else:
-            raise ValueError(f"invalid assertion type: {request.assertion_type}")
+    with span('encode_cardinality', requests=len(generation_requests)):
+        for request in generation_requests:
+            if request.assertion_type is AssertionType.EQ:
+                fresh_cnf.assert_k_of_n(request.k, request.boolean_values)
+            elif request.assertion_type is AssertionType.LT:
+                fresh_cnf.assert_k_less_than_n(request.k, request.boolean_values)
+            elif request.assertion_type is AssertionType.GT:
+                fresh_cnf.assert_k_greater_than_n(request.k, request.boolean_values)
+            else:
+                raise ValueError(f"invalid assertion type: {request.assertion_type}")
     final_cnf = fresh_cnf + initial_cnf
     return final_cnf  # TODO: Does this still work right?
 
@@ -155,7 +157,8 @@ def save_cnf(filename: Path,
              fresh: Optional[int] = None,
              support: Optional[int] = None):
     """Writes a CNF formula to a file at the given path."""
-    filename.write_text(cnf.as_unigen_string(support_set_length=support))
+    with span('file_io', operation='save_cnf'):
+        filename.write_text(cnf.as_unigen_string(support_set_length=support))
 
 
 def combine_and_save_cnf(filename: Path,
@@ -177,7 +180,7 @@ def combine_and_save_opb(filename: Path,
                          generation_requests: List[GenerationRequest]):
     print("Encoding experiment constraints...")
 
-    with open(filename, 'a') as opb_file:
+    with span('file_io', operation='save_opb'), open(filename, 'a') as opb_file:
         opb_file.write(cnf.as_opb_string())
 
         for request in generation_requests:
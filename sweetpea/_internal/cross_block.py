@@ -7,7 +7,6 @@ from functools import reduce
 from itertools import accumulate, combinations, product, repeat, chain
 from typing import List, Union, Tuple, Optional, cast, Any, Dict, Set, Sequence, Callable, TypeVar
 from math import ceil
-from networkx import has_path
 import copy
 from itertools import permutations
 
@@ -20,6 +19,7 @@ from sweetpea._internal.primitive import (
 )
 from sweetpea._internal.logic import to_cnf_tseitin
 from sweetpea._internal.base_constraint import Constraint
+from sweetpea._internal.constraint_checker import ConstraintChecker
 from sweetpea._internal.design_graph import DesignGraph
 from sweetpea._internal.iter import chunk_list
 from sweetpea._internal.weight import combination_weight
@@ -161,16 +161,16 @@ class MultiCrossBlockRepeat(Block):
         self.__validate_crossing(who)
 
     def __validate_crossing(self, who: str):
-        dg = DesignGraph(self.design).graph
+        dg = DesignGraph(self.design)
         warnings = []
         template = " '{}' depends on '{}'"
         for crossing in self.crossings:
             combos = combinations(crossing, 2)
 
             for c in combos:
-                if has_path(dg, c[0].name, c[1].name):
+                if dg.has_path(c[0].name, c[1].name):
                     warnings.append(template.format(c[0].name, c[1].name))
-                elif has_path(dg, c[1].name, c[0].name):
+                elif dg.has_path(c[1].name, c[0].name):
                     warnings.append(template.format(c[1].name, c[0].name))
 
         if warnings:
@@ -255,6 +255,26 @@ class MultiCrossBlockRepeat(Block):
         :class:`Exclude` constraint may prevent multiple crossings, depending
         on the derivation function used.
         """
+        excluded_crossings = self.excluded_combinations(crossing)
+
+        if len(excluded_crossings) != 0:
+            if self.require_complete_crossing:
+                er = "Complete crossing unsatisfiable"
+            else:
+                er = "WARNING: crossing incomplete"
+            er += " due to excluded or impossible combinations:"
+            for c in excluded_crossings:
+                names = ', '.join([f"'{l.name}'" for l in c])
+                er += "\n " + names
+            self.errors.add(er)
+
+        return sum([combination_weight(c) for c in excluded_crossings])
+
+    def excluded_combinations(self, crossing: List[Factor]) -> Set[Tuple[Level, ...]]:
+        """The combinations of levels, one for each factor in order, that are
+        removed from the crossing by :class:`Exclude` constraints or that are
+        impossible based on a derived level's definition. The crossing
+        argument must be one of the block's crossings."""
         from sweetpea._internal.constraint import Exclude
 
         excluded_crossings = cast(Set[Tuple[Level, ...]], set())
@@ -264,7 +284,7 @@ class MultiCrossBlockRepeat(Block):
         all_crossings = list(product(*levels_lists))
 
         # Get the exclude constraints.
-        exclusions = list(filter(lambda c: isinstance(c, Exclude), self.constraints))
+        exclusions = cast(List[Exclude], list(filter(lambda c: isinstance(c, Exclude), self.constraints)))
 
         # Check for impossible combinations
         for c in all_crossings:
@@ -312,18 +332,7 @@ class MultiCrossBlockRepeat(Block):
                                                                              self.act_design)])))):
                         excluded_crossings.add(tuple(c))
 
-        if len(excluded_crossings) != 0:
-            if self.require_complete_crossing:
-                er = "Complete crossing unsatisfiable"
-            else:
-                er = "WARNING: crossing incomplete"
-            er += " due to excluded or impossible combinations:"
-            for c in excluded_crossings:
-                names = ', '.join([f"'{l.name}'" for l in c])
-                er += "\n " + names
-            self.errors.add(er)
-
-        return sum([combination_weight(c) for c in excluded_crossings])
+        return excluded_crossings
 
     def __excluded_derived(self, excluded_level, c):
         """Given the complete crossing and an exclude constraint, returns true
@@ -437,17 +446,9 @@ class MultiCrossBlockRepeat(Block):
 
     def sample_mismatch_constraints(self, sample: dict) -> list:
         """Test if the factors in a given sequence meet the criteria defined for this constraints"""
-        res = []
         sample_objects = convert_sample_from_names_to_objects(sample, self.design)
-        for constraint in self.constraints:
-            if not constraint.potential_sample_conforms(sample_objects, self):
-                pretty_name = constraint.__class__.__name__
-                if hasattr(constraint, 'k'):
-                    pretty_name += f', {constraint.k}'  # type: ignore
-                if hasattr(constraint, 'level'):
-                    pretty_name += f', {constraint.level}'  # type: ignore
-                res.append(pretty_name)
-        return res
+        return [ConstraintChecker.describe(constraint)
+                for constraint in self.constraint_checker().mismatches(sample_objects)]
 
     def sample_mismatch_crossing(self, sample: dict, acceptable_error_per_crossing: int = 0) -> list:
         """Test if a given sequence meet the criteria defined for the crossings"""
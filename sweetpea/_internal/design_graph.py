@@ -3,29 +3,33 @@ relationships between factors in a given design.
 """
 
 
-from typing import List
+from typing import Dict, List, Union
 
-import networkx as nx
+from sweetpea._internal.primitive import DerivedFactor, Factor, HiddenName
 
-from sweetpea._internal.primitive import DerivedFactor, Factor
+
+Name = Union[str, HiddenName]
 
 
 class DesignGraph():
     """Builds a directed graph representing the relationship between all
     factors in the design. Primary intent is to facilitate preventing invalid
     crossings.
+
+    Paths are checked on the graph's edges directly, so that networkx is only
+    imported for :attr:`graph` and :meth:`draw`.
     """
 
     def __init__(self, design: List[Factor]) -> None:
         self.design = design
-        self.graph = self.__build_graph(design)
+        self.edges = self.__build_edges(design)
 
-    def __build_graph(self, design: List[Factor]) -> nx.DiGraph:
-        g = nx.DiGraph()
+    def __build_edges(self, design: List[Factor]) -> Dict[Name, List[Name]]:
+        edges = {}  # type: Dict[Name, List[Name]]
 
         for f in design:
             # Add the factor as a node.
-            g.add_node(f.name)
+            edges.setdefault(f.name, [])
 
             # Simple factors (not derived) are the leaves.
             if not isinstance(f, DerivedFactor):
@@ -34,12 +38,40 @@ class DesignGraph():
             # Add directed edges between this factor and all factors that it depends on.
             for l in f.levels:
                 for depended_on_factor in l.window.factors:
-                    g.add_edge(f.name, depended_on_factor.name)
-
+                    edges.setdefault(depended_on_factor.name, [])
+                    if depended_on_factor.name not in edges[f.name]:
+                        edges[f.name].append(depended_on_factor.name)
+
+        return edges
+
+    def has_path(self, source: Name, target: Name) -> bool:
+        """Whether `source` depends on `target`, directly or indirectly."""
+        seen = {source}
+        pending = [source]
+        while pending:
+            name = pending.pop()
+            if name == target:
+                return True
+            for next_name in self.edges.get(name, []):
+                if next_name not in seen:
+                    seen.add(next_name)
+                    pending.append(next_name)
+        return False
+
+    @property
+    def graph(self):
+        """The graph as a :class:`networkx.DiGraph`."""
+        import networkx as nx
+        g = nx.DiGraph()
+        for name, depended_on in self.edges.items():
+            g.add_node(name)
+            for depended_on_name in depended_on:
+                g.add_edge(name, depended_on_name)
         return g
 
     def draw(self):
         import matplotlib as plt
+        import networkx as nx
         nx.draw(self.graph, with_labels=True)
         plt.show()
 
@@ -1,8 +1,13 @@
-from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union, cast, Literal
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, Union, cast, Literal
 
 import random
 from abc import ABC, abstractmethod
 
+if TYPE_CHECKING:
+    import numpy as np
+
 class Distribution(ABC):
     """Base class for different  distributions."""
     
@@ -10,6 +15,15 @@ class Distribution(ABC):
     def sample(self, factor_values: List[Any] = []) -> float:
         pass  # Must be implemented by subclasses
 
+    def sample_n(self, n: int, rng: np.random.Generator,
+                 factor_values: Optional[List[Sequence[Any]]] = None) -> np.ndarray:
+        """Draws `n` samples at once. `factor_values` has one column of
+        `n` values for each dependency. By default, this calls `sample` once
+        per row; built-in distributions draw from `rng` in a single call."""
+        import numpy as np
+        columns = factor_values or []
+        return np.array([self.sample([column[i] for column in columns]) for i in range(n)], dtype=float)
+
     def get_init(self) ->List[Any]:
         return []
 
@@ -25,6 +39,10 @@ class UniformDistribution(Distribution):
     def sample(self, factor_values: List[Any] = []) -> float:
         return random.uniform(self.low, self.high)
 
+    def sample_n(self, n: int, rng: np.random.Generator,
+                 factor_values: Optional[List[Sequence[Any]]] = None) -> np.ndarray:
+        return rng.uniform(self.low, self.high, n)
+
 class GaussianDistribution(Distribution):
     def __init__(self, mean: float, sigma: float):
         self.mean = mean
@@ -33,6 +51,10 @@ class GaussianDistribution(Distribution):
     def sample(self, factor_values: List[Any] = []) -> float:
         return random.gauss(self.mean, self.sigma)
 
+    def sample_n(self, n: int, rng: np.random.Generator,
+                 factor_values: Optional[List[Sequence[Any]]] = None) -> np.ndarray:
+        return rng.normal(self.mean, self.sigma, n)
+
 class ExponentialDistribution(Distribution):
     def __init__(self, rate: float):
         self.rate = rate
@@ -40,6 +62,10 @@ class ExponentialDistribution(Distribution):
     def sample(self, factor_values: List[Any] = []) -> float:
         return random.expovariate(self.rate)
 
+    def sample_n(self, n: int, rng: np.random.Generator,
+                 factor_values: Optional[List[Sequence[Any]]] = None) -> np.ndarray:
+        return rng.exponential(1 / self.rate, n)
+
 class LogNormalDistribution(Distribution):
     def __init__(self, mean: float, sigma: float):
         self.mean = mean
@@ -48,6 +74,10 @@ class LogNormalDistribution(Distribution):
     def sample(self, factor_values: List[Any] = []) -> float:
         return random.lognormvariate(self.mean, self.sigma)
 
+    def sample_n(self, n: int, rng: np.random.Generator,
+                 factor_values: Optional[List[Sequence[Any]]] = None) -> np.ndarray:
+        return rng.lognormal(self.mean, self.sigma, n)
+
 class CustomDistribution(Distribution):
     """Allows users to provide a custom distribution with any parameters."""
     
@@ -84,6 +114,19 @@ class CustomDistribution(Distribution):
             self.sum+= self.func(*factor_values)
             return self.sum
 
+    def sample_n(self, n: int, rng: np.random.Generator,
+                 factor_values: Optional[List[Sequence[Any]]] = None) -> np.ndarray:
+        import numpy as np
+        columns = factor_values or []
+        if len(columns) != len(self.dependents):
+            raise RuntimeError(f"Mismatched input length: {len(columns)} columns vs {len(self.dependents)} dependents")
+        values = np.array([self.func(*row) for row in zip(*columns)] if columns
+                          else [self.func() for _ in range(n)], dtype=float)
+        if self.cumulative:
+            values = self.sum + np.cumsum(values)
+            self.sum = float(values[-1]) if n else self.sum
+        return values
+
     def get_init(self) ->List[Any]:
         return self.dependents
 
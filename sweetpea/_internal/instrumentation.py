@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import time
+from typing import Any, Callable, Iterator, List, Optional, cast
+
+
+"""
+Instrumentation of the sampling pipeline. The steps that sampling strategies
+take, from validating a block and applying its constraints through encoding,
+solving, and decoding, are timed as spans of this form:
+
+    {
+    'name': '<span name>',
+    'start': <seconds since the epoch>,
+    'time': <duration in seconds>,
+    'track': '<thread of execution>',
+    'args': {...}
+    }
+
+Spans are recorded by the active `Instrumentation`, which a strategy starts
+with `instrumented()` and reports as `metrics['spans']` in its sampling result.
+A strategy that runs within another strategy's sampling, or within a caller's
+`instrumented()`, adds its spans to the active one. When no instrumentation is
+active, or the active one is disabled, `span` does nothing.
+
+The span names used across strategies are 'validate_block',
+'build_backend_request', 'apply_constraint', 'convert_cnf',
+'encode_cardinality', 'file_io', 'solve', 'solver_call', and 'decode', along
+with steps of particular strategies, such as RandomGen's 'count_solutions' and
+SMGen's 'encode_design'.
+"""
+MAIN_TRACK = 'main'
+
+
+class Instrumentation:
+
+    def __init__(self, enabled: bool = True, callback: Optional[Callable[[dict], None]] = None):
+        self.enabled = enabled
+        self.callback = callback
+        self.spans = cast(List[dict], [])
+
+    @contextmanager
+    def span(self, name: str, track: str = MAIN_TRACK, **args: Any) -> Iterator[dict]:
+        """Times the enclosed code as a span, whose arguments can be extended
+        through the dictionary that is produced."""
+        start = time()
+        try:
+            yield args
+        finally:
+            self.record({'name': name, 'start': start, 'time': time() - start, 'track': track, 'args': args})
+
+    def record(self, span: dict) -> None:
+        self.spans.append(span)
+        if self.callback is not None:
+            self.callback(span)
+
+    def with_spans(self, metrics: dict) -> dict:
+        """Adds the spans recorded so far to a sampling result's metrics."""
+        metrics['spans'] = list(self.spans)
+        return metrics
+
+
+class _NoSpan:
+    def __enter__(self) -> dict:
+        return {}
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+_active = cast(ContextVar[Optional[Instrumentation]], ContextVar('sweetpea_instrumentation', default=None))
+
+
+@contextmanager
+def instrumented(enabled: bool = True, callback: Optional[Callable[[dict], None]] = None) -> Iterator[Instrumentation]:
+    """Makes a new instrumentation active for the enclosed code, unless one is
+    already active, in which case that one continues."""
+    current = _active.get()
+    if current is not None:
+        yield current
+        return
+    instrumentation = Instrumentation(enabled, callback)
+    token = _active.set(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        _active.reset(token)
+
+
+def span(name: str, **args: Any):
+    """Times the enclosed code as a span of the active instrumentation, if any."""
+    current = _active.get()
+    if current is None or not current.enabled:
+        return _NO_SPAN
+    return current.span(name, **args)
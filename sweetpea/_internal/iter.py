@@ -2,7 +2,7 @@
 
 
 from itertools import islice, tee, chain, repeat
-from typing import Any, Tuple, List, Dict, Iterator, Iterable
+from typing import Any, Callable, Tuple, List, Dict, Iterator, Iterable
 
 
 def chunk(it: Iterable[Any], size: int) -> Iterator[Tuple[Any, ...]]:
@@ -30,6 +30,21 @@ def chunk_dict(it: Iterable[Any], size: int) -> List[Dict[int, Any]]:
             break
     return r
 
+def lazy_product(*generators: Callable[[], Iterable[Any]]) -> Iterator[Tuple[Any, ...]]:
+    """Like :func:`itertools.product`, but each argument is a thunk that
+    produces a fresh iterable. Unlike :func:`itertools.product`, no argument
+    is ever materialized, so memory use stays proportional to the number of
+    arguments rather than the size of each argument.
+    """
+    if not generators:
+        yield ()
+        return
+    first, rest = generators[0], generators[1:]
+    for item in first():
+        for items in lazy_product(*rest):
+            yield (item,) + items
+
+
 def pairwise(iterable):
     """Helper recipe from:
     https://docs.python.org/3/library/itertools.html#itertools-recipes
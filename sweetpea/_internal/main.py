@@ -1,12 +1,19 @@
-# Everything in `__all_` is exported from the `sweetpea` module.
+# Everything in `__all_` is exported from the `sweetpea` module, which loads
+# each name from the module that defines it on first use (see `_EXPORTS` in
+# `sweetpea/__init__.py`). Modules that need numpy, networkx, or the solver
+# tools are imported by the functions that use them.
 
 __all__ = [
-    'synthesize_trials', 'sample_mismatch_experiment',
+    'synthesize_trials', 'enumerate_trials', 'sample_mismatch_experiment', 'validate_samples',
+    'synthesize_trials_async', 'iterate_trials_async',
 
     'auto_correlation_scores_sample_within', 'auto_correlation_scores_samples_between',
+    'predictability_scores',
 
     'print_experiments', 'tabulate_experiments',
     'save_experiments_csv', 'experiments_to_tuples', 'experiments_to_dicts',
+    'save_experiments_npz', 'save_experiments_npy', 'load_experiments_columns',
+    'TrialMatrix', 'CancellationToken', 'SamplingService',
 
     'Block', 'CrossBlock', 'MultiCrossBlock', 
     'Repeat', 'Nest', 'Merge',
@@ -26,14 +33,14 @@ __all__ = [
     'Gen', 'RandomGen', 'IterateSATGen',
     'CMSGen', 'UniGen', 'IterateILPGen',
     'UniformGen', 'IterateGen',
-    'SMGen',
+    'SMGen', 'AutoGen',
 
     'UniformDistribution', 'GaussianDistribution', 
     'ExponentialDistribution', 'LogNormalDistribution', 'CustomDistribution'
 ]
 
 from functools import reduce
-from typing import Dict, List, Optional, Tuple, Any, Union, cast
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Any, Union, cast
 from itertools import product
 import csv, os
 import time
@@ -55,27 +62,38 @@ from sweetpea._internal.constraint import (
     LatinSquare,
     Sequential
 )
+from sweetpea._internal.instrumentation import instrumented, span
+from sweetpea._internal.progress import CancellationToken, report, reporting
 from sweetpea._internal.sampling_strategy.base import Gen
-from sweetpea._internal.sampling_strategy.uniform import UniformGen
 from sweetpea._internal.sampling_strategy.iterate import IterateGen
-from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
-from sweetpea._internal.sampling_strategy.unigen import UniGen
-from sweetpea._internal.sampling_strategy.cmsgen import CMSGen
-from sweetpea._internal.sampling_strategy.random import RandomGen
-from sweetpea._internal.sampling_strategy.smgen import SMGen
-from sweetpea._internal.sampling_strategy.iterate_ilp import IterateILPGen
-from sweetpea._internal.server import build_cnf
 from sweetpea._internal.core.cnf import Var
 from sweetpea._internal.argcheck import argcheck, make_islistof
 
-from sweetpea._internal.distribution import (
-    UniformDistribution, GaussianDistribution, 
-    ExponentialDistribution, LogNormalDistribution, CustomDistribution
-)
-
-
-from sweetpea._internal.auto_correlation_score import (auto_correlation_score_factor_within,
-                                                       auto_correlation_score_factor_between)
+if TYPE_CHECKING:
+    from sweetpea._internal.sampling_strategy.uniform import UniformGen
+    from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
+    from sweetpea._internal.sampling_strategy.unigen import UniGen
+    from sweetpea._internal.sampling_strategy.cmsgen import CMSGen
+    from sweetpea._internal.sampling_strategy.random import RandomGen
+    from sweetpea._internal.sampling_strategy.smgen import SMGen
+    from sweetpea._internal.sampling_strategy.iterate_ilp import IterateILPGen
+    from sweetpea._internal.sampling_strategy.auto import AutoGen
+    from sweetpea._internal.trial_matrix import TrialMatrix
+    from sweetpea._internal.async_synthesis import synthesize_trials_async, iterate_trials_async
+    from sweetpea._internal.sampling_service import SamplingService
+
+    from sweetpea._internal.distribution import (
+        UniformDistribution, GaussianDistribution,
+        ExponentialDistribution, LogNormalDistribution, CustomDistribution
+    )
+
+
+def __getattr__(name: str):
+    # Exported names that are not imported above load as they do from `sweetpea`
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import sweetpea
+    return getattr(sweetpea, name)
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -313,47 +331,86 @@ def tabulate_experiments(block: Optional[Block] = None,
         print(reduce(lambda a, b: a + format_str.format(*b), transposed, ''))
 
 
-def _experiments_to_csv(experiments: List[dict],
+def _experiments_to_csv(experiments: Iterable[dict],
                         csv_columns: List[str],
                         file_prefix: str = "experiment"):
-    """Exports a list of experiments to CSV files. Each experiment will be
-    saved to a separate ``.csv`` file.
+    """Exports experiments to CSV files. Each experiment will be
+    saved to a separate ``.csv`` file as soon as it is produced.
 
     :param experiments:
-        A list of experiments as :class:`dicts <dict>`. These are produced by
-        a call to :func:`.synthesize_trials`.
+        An iterable of experiments as :class:`dicts <dict>`. These are
+        produced by :func:`.synthesize_trials` or :func:`.enumerate_trials`.
 
     :param file_prefix:
         A prefix to attach to each output ``.csv`` file.
     """
     for idx, experiment in enumerate(experiments):
 
-        dict = experiment
-        num_rows = len(dict[csv_columns[0]])
-
         csv_file = file_prefix + "_" + str(idx) + ".csv"
         try:
             with open(csv_file, 'w') as csvfile:
                 writer = csv.writer(csvfile)
                 writer.writerow(csv_columns)
-                for row_idx in range(num_rows):
-                    row = list()
-                    for column in csv_columns:
-                        row.append(dict[column][row_idx])
-                    writer.writerow(row)
+                writer.writerows(zip(*[experiment[column] for column in csv_columns]))
         except IOError:
             print("I/O error")
 
 
 def save_experiments_csv(block: Block,
-                         experiments: List[dict],
+                         experiments: Iterable[dict],
                          file_prefix: str = "experiment"):
     return _experiments_to_csv(experiments, [cast(str, f.name) for f in __filter_hidden(block.design)], file_prefix)
 
 
+def __columnar_factors(block: Block) -> List[Factor]:
+    factors = __filter_hidden(block.design)
+    names = [f.name for f in factors]
+    return factors + [f for f in block.continuous_factors if f.name not in names]
+
+
+def __experiment_columns(block: Block, experiments: Iterable[dict]) -> Tuple[List[dict], list]:
+    from sweetpea._internal import columnar
+    from sweetpea._internal.trial_matrix import TrialMatrix
+    if isinstance(experiments, TrialMatrix):
+        return experiments.as_columnar()
+    return columnar.experiment_columns(__columnar_factors(block), experiments)
+
+
+def save_experiments_npz(block: Block, experiments: Iterable[dict], filename: str) -> None:
+    """Saves experiments to a compressed NumPy ``.npz`` file with one integer
+    array of level indices per factor. See the documentation for the layout.
+    """
+    from sweetpea._internal import columnar
+    manifest, columns = __experiment_columns(block, experiments)
+    columnar.save_npz(filename, manifest, columns)
+
+
+def save_experiments_npy(block: Block, experiments: Iterable[dict], directory: str) -> None:
+    """Saves experiments to a directory with one memory-mappable NumPy ``.npy``
+    file of level indices per factor. See the documentation for the layout.
+    """
+    from sweetpea._internal import columnar
+    manifest, columns = __experiment_columns(block, experiments)
+    columnar.save_npy(directory, manifest, columns)
+
+
+def load_experiments_columns(path: str) -> Dict[str, Tuple[Any, Optional[list]]]:
+    """Loads experiments saved by :func:`.save_experiments_npz` or
+    :func:`.save_experiments_npy`, mapping each factor name to its array
+    and its level names.
+    """
+    from sweetpea._internal import columnar
+    return columnar.load(path)
+
+
 def synthesize_trials(block: Block,
                       samples: int = 10,
-                      sampling_strategy=IterateGen
+                      sampling_strategy=IterateGen,
+                      as_matrix: bool = False,
+                      instrument: bool = True,
+                      on_span: Optional[Callable[[dict], None]] = None,
+                      on_progress: Optional[Callable[[dict], None]] = None,
+                      cancellation: Optional[CancellationToken] = None
                       ):
     """Given an experiment described with a :class:`.Block`, randomly generates
     multiple sets of trials for that experiment.
@@ -384,48 +441,166 @@ def synthesize_trials(block: Block,
         The strategy to use for trial generation. The default is
         :class:`.NonUniformGen`.
 
+    :param as_matrix:
+        Whether to return the trial sets as a :class:`.TrialMatrix`, which
+        stores levels as small integer codes and converts each trial set to
+        the dictionary form only when it is accessed. Each trial set that
+        the sampling strategy produces is finished and coded in turn, and
+        then released, but the strategy itself still produces every trial
+        set in the dictionary form first, so peak memory during synthesis
+        is not reduced below that of the strategy's list.
+
+        Default is ``False``.
+
+    :param instrument:
+        Whether to time the steps of trial generation as spans, which the
+        sampling strategy reports in its metrics. With ``False``, steps are
+        not timed.
+
+        Default is ``True``.
+
+    :param on_span:
+        A function that is called with each span as it is recorded, including
+        the spans of the steps that follow sampling. A span is a
+        :class:`dict` with ``'name'``, ``'start'`` (seconds since the epoch),
+        ``'time'`` (duration in seconds), ``'track'``, and ``'args'`` keys.
+
+    :param on_progress:
+        A function that is called as sampling progresses, such as after each
+        sample and, for some strategies, after each trial or batch of
+        rejected candidates. It is called with a :class:`dict` with
+        ``'stage'``, ``'samples'`` (the number produced so far), and
+        ``'elapsed'`` (seconds since sampling started) keys, along with details
+        of the stage. The last call has the stage ``'done'`` and a
+        ``'cancelled'`` key.
+
+    :param cancellation:
+        A :class:`.CancellationToken` that stops sampling when it is cancelled
+        or its timeout passes. RandomGen, GuidedGen, IterateSATGen, and SMGen
+        then stop and produce the samples that they have completed, and the
+        token's ``stopped`` attribute is set to ``True``.
+
     :returns:
-        A :class:`list` of trial sets.
+        A :class:`list` of trial sets, or a :class:`.TrialMatrix`.
     """
 
     def starting(who):
         # type: (Any) -> None
         print("Sampling {} trial sequences using {}.".format(samples, who))
 
-    if isinstance(sampling_strategy, type):
-        assert issubclass(sampling_strategy, Gen)
-        starting(sampling_strategy.class_name())
-        sampling_result = sampling_strategy.sample(block, samples)
-    else:
-        starting(sampling_strategy)
-        sampling_result = sampling_strategy.sample_object(block, samples)
-
-    # DW: I am not sure if I need to fix this. Need to discuss with Matthew
-    raw_samples = sampling_result.samples[:samples]
-
-    trialss = []
-    for e in raw_samples:
-        with_implied = block.add_implied_levels(e)
+    with instrumented(instrument, on_span), reporting(on_progress, cancellation) as progress:
+        if isinstance(sampling_strategy, type):
+            assert issubclass(sampling_strategy, Gen)
+            starting(sampling_strategy.class_name())
+            sampling_result = sampling_strategy.sample(block, samples)
+        else:
+            starting(sampling_strategy)
+            sampling_result = sampling_strategy.sample_object(block, samples)
+
+        # DW: I am not sure if I need to fix this. Need to discuss with Matthew
+        raw_samples = sampling_result.samples[:samples]
+        del sampling_result
+        if progress.stopped:
+            print("Sampling stopped after {} of {} trial sequences.".format(len(raw_samples), samples))
+        report('done', len(raw_samples), requested=samples, cancelled=progress.stopped)
+
+        if as_matrix:
+            from sweetpea._internal.trial_matrix import TrialMatrix
+            with span('convert_samples'):
+                return TrialMatrix.from_experiments(__columnar_factors(block),
+                                                    __finished_samples(block, raw_samples))
+
+        with span('add_implied_levels'):
+            with_implieds = [block.add_implied_levels(e) for e in raw_samples]
         # Run mismatch check BEFORE filtering hidden keys
         if os.getenv("SWEETPEA_CHECK_SYNTHESIZED"):
-            mismatches = sample_mismatch_experiment(block, with_implied)
+            with span('validate_samples'):
+                mismatch_reports = validate_samples(block, with_implieds)
+            for with_implied, mismatches in zip(with_implieds, mismatch_reports):
+                if mismatches:
+                    print_experiments(block, [with_implied])
+                    print(mismatches)
+                    raise RuntimeError("synthesized trials has mismatches")
+
+        # Now filter hidden keys for the returned trials
+        trialss = [__filter_hidden_keys(with_implied) for with_implied in with_implieds]
+
+        # Sampling for ContinuousFactor
+        if block.continuous_factors:
+            with span('sample_continuous'):
+                for num_trial, trials in enumerate(trialss):
+                    continuous_samples = block.sample_continuous(num_trial, trialss[num_trial])
+                    for k in continuous_samples:
+                        trials[k] = continuous_samples[k]
+            # Restore ContinuousFactor to the design
+
+    return trialss
+
+def __finished_samples(block: Block, raw_samples: List[dict]) -> Iterator[dict]:
+    # Takes each sample out of `raw_samples` and finishes it as
+    # `synthesize_trials` does, so that only one sample's finished form is
+    # held at a time
+    validator = None
+    if os.getenv("SWEETPEA_CHECK_SYNTHESIZED"):
+        from sweetpea._internal.sample_validator import SampleValidator
+        validator = SampleValidator(block)
+    raw_samples.reverse()
+    num_trial = 0
+    while raw_samples:
+        with_implied = block.add_implied_levels(raw_samples.pop())
+        if validator is not None:
+            mismatches = validator.validate([with_implied])[0]
             if mismatches:
                 print_experiments(block, [with_implied])
                 print(mismatches)
                 raise RuntimeError("synthesized trials has mismatches")
-
-        # Now filter hidden keys for the returned trials
-        trialss.append(__filter_hidden_keys(with_implied))
-
-    # Sampling for ContinuousFactor
-    if block.continuous_factors:
-        for num_trial, trials in enumerate(trialss):
-            continuous_samples = block.sample_continuous(num_trial, trialss[num_trial])
+        trials = __filter_hidden_keys(with_implied)
+        del with_implied
+        if block.continuous_factors:
+            continuous_samples = block.sample_continuous(num_trial, trials)
             for k in continuous_samples:
                 trials[k] = continuous_samples[k]
-        # Restore ContinuousFactor to the design
+        num_trial += 1
+        yield trials
+
+def _enumerates_combinatorially(block: Block) -> bool:
+    # Cross, Consistency, and Derivation constraints hold by construction for
+    # the combinatorial enumerator, so only the design's own constraints matter.
+    return (isinstance(block, MultiCrossBlockRepeat)
+            and len(block.crossings) == 1
+            and not any(c.is_complex_for_combinatoric() for c in block.orig_constraints)
+            and not any(f.has_complex_window for f in block.crossings[0]))
+
+def enumerate_trials(block: Block) -> Iterator[dict]:
+    """Given an experiment described with a :class:`.Block`, lazily produces
+    every valid set of trials for that experiment, one at a time.
+
+    Unlike :func:`.synthesize_trials`, the sets are produced in a fixed order
+    instead of randomly, and they are never collected into a list, so
+    memory use does not grow with the number of sets produced. Stopping the
+    iteration early is cheap. Designs with a single crossing and without
+    complex windows or constraints are enumerated combinatorially, while
+    other designs are enumerated with an incremental SAT solver that blocks
+    each solution once it is found.
+
+    Values for :class:`.ContinuousFactor` factors are not included.
 
-    return trialss
+    :param block:
+        An experimental description as a :class:`.Block`.
+
+    :returns:
+        An iterator of trial sets in the same form as the elements of the
+        :class:`list` produced by :func:`.synthesize_trials`.
+    """
+    from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
+    from sweetpea._internal.sampling_strategy.random import RandomGen
+    if _enumerates_combinatorially(block):
+        raw_samples = RandomGen.enumerate(block)
+    else:
+        raw_samples = IterateSATGen.enumerate(block)
+
+    for e in raw_samples:
+        yield __filter_hidden_keys(block.add_implied_levels(e))
 
 def sample_mismatch_experiment(block: Block, sample: dict) -> dict:
     """Given an experiment described with a :class:`.Block`, tests if :class:`list`
@@ -462,15 +637,44 @@ def sample_mismatch_experiment(block: Block, sample: dict) -> dict:
             res['crossings'] = crossing_errors
     return res
 
+def validate_samples(block: Block, samples: Sequence[dict], workers: int = 1) -> List[dict]:
+    """Like :func:`.sample_mismatch_experiment`, but checks a whole batch of
+    samples at once. The samples are coded once as integer arrays, so that
+    derived levels, constraints, and crossings are checked with array
+    operations instead of trial by trial, which makes this function suitable
+    for validating large archived sets of samples.
+
+    :param block:
+        An experimental description as a :class:`.Block`.
+
+    :param samples:
+        A :class:`list` of samples, each in the form produced by
+        :func:`.synthesize_trials`, or a :class:`.TrialMatrix`, whose
+        codes are checked without converting the samples.
+
+    :param workers:
+        The number of processes that validate parts of the batch in parallel.
+        Where processes cannot be forked, threads are used instead.
+
+    :returns:
+        A :class:`list` with a mismatch :class:`dict` for each sample, in the
+        same form as the result of :func:`.sample_mismatch_experiment`.
+    """
+    from sweetpea._internal.sample_validator import SampleValidator
+    return SampleValidator(block).validate(samples, workers)
+
+
 
 def auto_correlation_scores_samples_between(samples: list, factor_names: List[str] = [],
-                                            number_trials: int = 10, starts: int = 10) -> dict:
+                                            number_trials: int = 10, starts: int = 10,
+                                            one_hot: bool = False, n_jobs: int = 1, seed: Optional[int] = None,
+                                            threshold: Optional[float] = None) -> dict:
     """Given a number of samples given as :class:`list` of trial sets, calculates
     a auto correlation score representing if a level can be predicted from the k
     proceeding levels. This is done by creating a neural network that is trained on
     predicting a factor based on the levels in all factors of the preceding trials.
     The number of preceding trials taken into account is the minimum between number_trials
-    and half the sequence length.
+    and half the length of the shortest sequence.
 
 
     :param samples:
@@ -484,21 +688,31 @@ def auto_correlation_scores_samples_between(samples: list, factor_names: List[st
     :param starts:
         A :class int that indicates how many times a new neural network is created. The final score is the
         max prediction score of theses networks.
+    :param one_hot:
+        A :class bool that indicates whether preceding levels are given to the networks as one
+        indicator per level instead of as a single number per factor and trial.
+    :param n_jobs:
+        A :class int that indicates how many networks are trained in parallel processes; -1 uses
+        all CPUs.
+    :param seed:
+        An optional :class int that determines the train/test split and initial weights of each
+        network, so that scores are reproducible whatever the number of jobs.
+    :param threshold:
+        An optional :class float score; once a network for a factor reaches it, the remaining
+        networks for that factor are skipped.
     :returns:
         A :class:`dict` describing the auto correlation of each factor.
     """
-    res = {}
-    if not factor_names:
-        for f in samples[0].keys():
-            res[f] = auto_correlation_score_factor_between(samples, f, k=number_trials, starts=starts)
-    else:
-        for f in factor_names:
-            res[f] = auto_correlation_score_factor_between(samples, f, k=number_trials, starts=starts)
-    return res
+    from sweetpea._internal.auto_correlation_score import LaggedSamples, auto_correlation_scores
+    lagged = LaggedSamples(samples, k=number_trials, one_hot=one_hot)
+    return auto_correlation_scores(lagged, factor_names or lagged.factors, starts=starts,
+                                   n_jobs=n_jobs, seed=seed, threshold=threshold)
 
 
 def auto_correlation_scores_sample_within(sample: dict, factor_names: List[str] = [],
-                                          number_trials: int = 10, starts: int = 10) -> dict:
+                                          number_trials: int = 10, starts: int = 10,
+                                          one_hot: bool = False, n_jobs: int = 1, seed: Optional[int] = None,
+                                          threshold: Optional[float] = None) -> dict:
     """Given a samples given as :class:`dict` of a trial set, calculates
     a auto correlation score representing if a level can be predicted from the k
     proceeding levels. This is done by creating a neural network that is trained on
@@ -517,17 +731,55 @@ def auto_correlation_scores_sample_within(sample: dict, factor_names: List[str]
     :param starts:
         A :class int that indicates how many times a new neural network is created. The final score is the
         max prediction score of theses networks.
+    :param one_hot:
+        A :class bool that indicates whether preceding levels are given to the networks as one
+        indicator per level instead of as a single number per factor and trial.
+    :param n_jobs:
+        A :class int that indicates how many networks are trained in parallel processes; -1 uses
+        all CPUs.
+    :param seed:
+        An optional :class int that determines the train/test split and initial weights of each
+        network, so that scores are reproducible whatever the number of jobs.
+    :param threshold:
+        An optional :class float score; once a network for a factor reaches it, the remaining
+        networks for that factor are skipped.
     :returns:
         A :class:`dict` describing the auto correlation of each factor.
     """
-    res = {}
-    if not factor_names:
-        for f in sample.keys():
-            res[f] = auto_correlation_score_factor_within(sample, f, k=number_trials, starts=starts)
-    else:
-        for f in factor_names:
-            res[f] = auto_correlation_score_factor_within(sample, f, k=number_trials, starts=starts)
-    return res
+    from sweetpea._internal.auto_correlation_score import LaggedSamples, auto_correlation_scores
+    lagged = LaggedSamples([sample], k=number_trials, one_hot=one_hot)
+    return auto_correlation_scores(lagged, factor_names or lagged.factors, starts=starts, within=True,
+                                   n_jobs=n_jobs, seed=seed, threshold=threshold)
+
+
+def predictability_scores(samples: list, factor_names: List[str] = [], number_trials: int = 1) -> dict:
+    """Given a number of samples given as :class:`list` of trial sets, calculates for each factor
+    a score representing how well a level can be predicted from the levels of the same factor in
+    the k preceding trials, where k is the minimum between number_trials and half the length of
+    the shortest sequence. The score is the fraction of the factor's entropy that is explained by the preceding
+    levels, estimated by counting sequences of levels over all samples: 0 when the preceding
+    levels carry no information and 1 when they determine the level.
+
+    Unlike :func:`.auto_correlation_scores_samples_between`, no neural networks are trained and
+    scikit-learn is not needed, so the score takes milliseconds and can be used to screen every
+    result of :func:`.synthesize_trials` before a slower auto correlation test. Scores are
+    inflated when there are few trials for each combination of preceding levels, so compare
+    them with scores of samples known to be good, or keep number_trials small.
+
+    :param samples:
+        A :class:`list` of trial sets. Each set is represented as a :class:`dictionary <dict>`
+        mapping each factor name to a list of levels, where each such list contains
+        to one level per trial.
+    :param factor_names:
+        A :class`list` of string. The factors to be tested (if None, all factors in samples are tested)
+    :param number_trials:
+        A :class int that indicates how many trials before the predicted trial to use for the prediction
+    :returns:
+        A :class:`dict` mapping each factor to its score.
+    """
+    from sweetpea._internal.auto_correlation_score import predictability_score_factor
+    return {f: predictability_score_factor(samples, f, number_trials)
+            for f in (factor_names or list(samples[0].keys()))}
 
 
 # TODO: This function isn't called anywhere, so it should be removed.
@@ -560,5 +812,6 @@ def __generate_cnf(block: Block) -> str:
         The given :class:`.Block` rendered as a Unigen-specific
         DIMACS-formatted string.
     """
+    from sweetpea._internal.server import build_cnf
     cnf = build_cnf(block)
     return cnf.as_unigen_string(sampled_variables=[Var(n) for n in block.support_variables()])
@@ -441,6 +441,9 @@ class Factor:
     def _process_initial_levels(self, initial_levels: Sequence[Level]) -> Sequence[Level]:
         raise NotImplementedError
 
+    def __getnewargs__(self) -> Tuple[Any, ...]:
+        return (self.name, [])
+
     def __deepcopy__(self, memo: Dict):
         cls = self.__class__
         new_instance = cls.__new__(cls, self.name, [])
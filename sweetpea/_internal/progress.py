@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Event
+from time import time
+from typing import Any, Callable, Iterator, Optional, cast
+
+
+"""
+Progress reporting and cancellation for sampling. A caller starts reporting
+with `reporting()`, usually through `synthesize_trials`, and the sampling
+strategies' long-running loops (RandomGen's rejection loop, GuidedGen's
+per-trial loop, IterateSATGen's solution loop, and SMGen's backtracking)
+report their progress as events of this form:
+
+    {
+    'stage': '<step of sampling>',
+    'samples': <samples produced so far>,
+    'elapsed': <seconds since reporting started>,
+    ...
+    }
+
+along with details of the stage, such as the number of rejected candidates.
+Between steps, those loops call `should_stop`, and when the caller's token is
+cancelled or its deadline has passed, they stop and return the samples that
+they have produced so far, with `metrics['cancelled']` set.
+
+When reporting is not active, `report` does nothing and `should_stop` is
+always false.
+"""
+
+
+class CancellationToken:
+    """Stops a synthesis that is in progress, either when :meth:`cancel` is
+    called, such as from another thread or a progress callback, or once
+    `timeout` seconds have passed since the token was created.
+
+    After a synthesis, :attr:`stopped` reports whether it stopped early, in
+    which case it produced fewer samples than requested.
+    """
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.deadline = None if timeout is None else time() + timeout
+        self.stopped = False
+        self._cancelled = Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the token has been cancelled or its deadline has passed."""
+        return self._cancelled.is_set() or (self.deadline is not None and time() >= self.deadline)
+
+
+class Progress:
+
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None,
+                 token: Optional[CancellationToken] = None) -> None:
+        self.callback = callback
+        self.token = token
+        self.start = time()
+        self.stopped = False
+
+    def report(self, stage: str, samples: int, **info: Any) -> None:
+        if self.callback is not None:
+            self.callback({'stage': stage, 'samples': samples, 'elapsed': time() - self.start, **info})
+
+    def should_stop(self) -> bool:
+        """Whether sampling should stop, which stays true once it is."""
+        if not self.stopped and self.token is not None and self.token.cancelled:
+            self.stopped = True
+            self.token.stopped = True
+        return self.stopped
+
+
+_active = cast(ContextVar[Optional[Progress]], ContextVar('sweetpea_progress', default=None))
+
+
+@contextmanager
+def reporting(callback: Optional[Callable[[dict], None]] = None,
+              token: Optional[CancellationToken] = None) -> Iterator[Progress]:
+    """Makes progress reporting active for the enclosed code, unless it is
+    already active, in which case that reporting continues."""
+    current = _active.get()
+    if current is not None:
+        yield current
+        return
+    progress = Progress(callback, token)
+    reset = _active.set(progress)
+    try:
+        yield progress
+    finally:
+        _active.reset(reset)
+
+
+@contextmanager
+def suspended() -> Iterator[None]:
+    """Makes progress reporting inactive for the enclosed code, such as a
+    trial run whose samples are not the caller's."""
+    reset = _active.set(None)
+    try:
+        yield
+    finally:
+        _active.reset(reset)
+
+
+def report(stage: str, samples: int, **info: Any) -> None:
+    """Reports progress to the active reporting, if any."""
+    current = _active.get()
+    if current is not None:
+        current.report(stage, samples, **info)
+
+
+def should_stop() -> bool:
+    """Whether the active reporting's token asks sampling to stop."""
+    current = _active.get()
+    return current is not None and current.should_stop()
+
+
+def with_cancelled(metrics: dict) -> dict:
+    """Marks a sampling result's metrics when sampling stopped early."""
+    current = _active.get()
+    if current is not None and current.stopped:
+        metrics['cancelled'] = True
+    return metrics
@@ -0,0 +1,268 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from typing import Any, Dict, List, Optional, Sequence, cast
+
+import numpy as np
+
+from sweetpea._internal.constraint_checker import ConstraintChecker
+from sweetpea._internal.cross_block import AlignmentMode
+from sweetpea._internal.iter import chunk_dict
+from sweetpea._internal.primitive import DerivedFactor, DerivedLevel, Factor, HiddenName
+from sweetpea._internal.sample_conversion import convert_sample_from_names_to_objects
+from sweetpea._internal.trial_matrix import TrialMatrix
+
+
+# Codes for a trial without a level and for a window position before the first trial.
+_NO_LEVEL = -1
+_BEFORE_START = -2
+
+
+"""
+Validates a batch of samples against a block, producing the same mismatch
+report as `sample_mismatch_experiment` for each sample. The samples are coded
+once as integer arrays of level indices, one array of shape (samples, trials)
+per factor, and then:
+
+  * derived levels are checked by evaluating each level's predicate once per
+    distinct combination of argument levels found in the batch;
+  * constraints are checked with the block's compiled constraint checks;
+  * crossings are checked by counting the combinations in each crossing window
+    for all samples at once with `np.bincount`.
+"""
+class SampleValidator:
+
+    def __init__(self, block):
+        self.block = block
+        self.trial_count = block.trials_per_sample()
+        self.checker = cast(ConstraintChecker, block.constraint_checker())
+        # Level names map to their first level, as in `convert_sample_from_names_to_objects`
+        self.level_codes = cast(Dict[Factor, Dict[str, int]], {})
+        for f in block.design:
+            codes = {'': _NO_LEVEL}
+            for i, l in enumerate(f.levels):
+                codes.setdefault(l.name, i)
+            self.level_codes[f] = codes
+
+    def validate(self, samples: Sequence[dict], workers: int = 1) -> List[dict]:
+        """Returns a mismatch report for each sample, in order."""
+        if isinstance(samples, TrialMatrix) and samples.trial_count == self.trial_count:
+            if workers > 1 and len(samples) > 1:
+                return self.__validate_in_workers(samples, workers)
+            return self.validate_full_length(samples)
+        reports = [self.__trial_count_report(sample) for sample in samples]
+        indices = [i for i, report in enumerate(reports) if not report]
+        if workers > 1 and len(indices) > 1:
+            results = self.__validate_in_workers([samples[i] for i in indices], workers)
+        else:
+            results = self.validate_full_length([samples[i] for i in indices])
+        for i, report in zip(indices, results):
+            reports[i] = report
+        return reports
+
+    def validate_full_length(self, samples: Sequence[dict]) -> List[dict]:
+        """Like `validate`, but for samples that all have the block's number of trials."""
+        if not len(samples):
+            return []
+        coded = self.encode(samples)
+        reports = cast(List[dict], [{} for _ in range(len(samples))])
+        factor_errors = self.factor_mismatches(coded)
+        constraint_errors = self.constraint_mismatches(samples, coded)
+        for i in range(len(samples)):
+            if factor_errors[i]:
+                reports[i]['factors'] = factor_errors[i]
+            if constraint_errors[i]:
+                reports[i]['constraints'] = constraint_errors[i]
+        for i, crossing_errors in enumerate(self.crossing_mismatches(coded)):
+            if crossing_errors:
+                reports[i]['crossings'] = crossing_errors
+        return reports
+
+    def encode(self, samples: Sequence[dict]) -> Dict[Factor, np.ndarray]:
+        """Codes each design factor in the samples as an array of level indices
+        with one row per sample."""
+        if isinstance(samples, TrialMatrix):
+            return self.__encode_matrix(samples)
+        coded = {}
+        size = len(samples) * self.trial_count
+        for f, codes in self.level_codes.items():
+            if cast(str, f.name) not in samples[0]:
+                continue
+            names = (name for sample in samples for name in sample[f.name])
+            try:
+                values = np.fromiter((codes[name] for name in names), dtype=np.int64, count=size)
+            except KeyError as e:
+                raise ValueError(f"Level {e.args[0]} is not a level of factor {f.name}")
+            coded[f] = values.reshape(len(samples), self.trial_count)
+        return coded
+
+    def __encode_matrix(self, matrix: TrialMatrix) -> Dict[Factor, np.ndarray]:
+        # Translates the matrix's codes, which may index a different list of level names
+        coded = {}
+        for f, codes in self.level_codes.items():
+            levels = matrix.levels(cast(str, f.name)) if f.name in matrix.columns else None
+            if levels is None:
+                continue
+            try:
+                table = np.array([codes[name] for name in levels] + [_NO_LEVEL], dtype=np.int64)
+            except KeyError as e:
+                raise ValueError(f"Level {e.args[0]} is not a level of factor {f.name}")
+            coded[f] = table[matrix.codes(cast(str, f.name))]
+        return coded
+
+    def factor_mismatches(self, coded: Dict[Factor, np.ndarray]) -> List[List[str]]:
+        """For each sample, the names of derived factors that have a level whose
+        derivation does not hold for a trial."""
+        count = len(next(iter(coded.values())))
+        errors = cast(List[List[str]], [[] for _ in range(count)])
+        for factor in self.block.design:
+            if isinstance(factor.name, HiddenName) or not isinstance(factor, DerivedFactor):
+                continue
+            bad = self.__derivation_failures(factor, coded)
+            for i in np.flatnonzero(bad):
+                errors[i].append(factor.name)
+        return errors
+
+    def __derivation_failures(self, factor: DerivedFactor, coded: Dict[Factor, np.ndarray]) -> np.ndarray:
+        sustain_count = self.block.sustain_count(factor)
+        trials = np.arange(0, self.trial_count, sustain_count)
+        bad = np.zeros(len(coded[factor]), dtype=bool)
+        for level_index, level in enumerate(factor.levels):
+            rows, columns = np.nonzero(coded[factor][:, trials] == level_index)
+            if len(rows) == 0:
+                continue
+            arguments = self.__argument_codes(cast(DerivedLevel, level), coded, rows, trials[columns], sustain_count)
+            combinations, inverse = np.unique(arguments, axis=0, return_inverse=True)
+            holds = np.array([self.__predicate_holds(cast(DerivedLevel, level), combination)
+                              for combination in combinations], dtype=bool)
+            bad[rows[~holds[inverse.reshape(-1)]]] = True
+        return bad
+
+    @staticmethod
+    def __argument_codes(level: DerivedLevel, coded: Dict[Factor, np.ndarray],
+                         rows: np.ndarray, trials: np.ndarray, sustain_count: int) -> np.ndarray:
+        # One column per predicate argument, in the order of `DerivedLevel._trial_arguments`
+        window = level.window
+        columns = []
+        for f in window.factors:
+            for j in range(window.width):
+                idx = trials + (j - (window.width - 1)) * sustain_count
+                columns.append(np.where(idx >= 0, coded[f][rows, np.maximum(idx, 0)], _BEFORE_START))
+        return np.stack(columns, axis=1)
+
+    @staticmethod
+    def __predicate_holds(level: DerivedLevel, combination: np.ndarray) -> bool:
+        window = level.window
+        args = cast(List[Any], [])
+        position = 0
+        for f in window.factors:
+            for j in range(window.width):
+                code = combination[position]
+                position += 1
+                if code == _BEFORE_START:
+                    args.append(None)
+                elif code == _NO_LEVEL:
+                    args.append('')
+                else:
+                    args.append(f.levels[code].name)
+        if window.width > 1:
+            args = list(chunk_dict(args, window.width))
+        return bool(window.predicate(*args))
+
+    def constraint_mismatches(self, samples: Sequence[dict], coded: Dict[Factor, np.ndarray]) -> List[List[str]]:
+        """For each sample, the names of the constraints that it does not conform to."""
+        objects = cast(Optional[List[dict]], None)
+        errors = cast(List[List[str]], [[] for _ in range(len(samples))])
+        for constraint, check in self.checker.checks:
+            if check is None:
+                # Only constraints without a compiled check need the samples themselves
+                if objects is None:
+                    objects = [convert_sample_from_names_to_objects(samples[i], self.block.design)
+                               for i in range(len(samples))]
+                conforms = np.array([constraint.potential_sample_conforms(o, self.block) for o in objects],
+                                    dtype=bool)
+            else:
+                conforms = np.broadcast_to(check(coded), (len(samples),))
+            for i in np.flatnonzero(~conforms):
+                errors[i].append(ConstraintChecker.describe(constraint))
+        return errors
+
+    def crossing_mismatches(self, coded: Dict[Factor, np.ndarray]) -> List[List[str]]:
+        """For each sample, the crossings whose combinations do not occur with
+        the expected frequencies in every crossing window."""
+        block = self.block
+        count = len(next(iter(coded.values())))
+        errors = cast(List[List[str]], [[] for _ in range(count)])
+        for i, crossing in enumerate(block.crossings):
+            if block.alignment is AlignmentMode.POST_PREAMBLE:
+                start = block.preamble_size()
+            else:
+                start = block.preamble_sizes[i]
+            c_weight = block.crossing_weight(crossing)
+            c_crossing_size = block.crossing_sizes[i] * c_weight
+            c_sustain_weight = c_weight * block.crossing_sustain_count(crossing)
+            combinations, expected = self.__combinations(crossing, coded)
+            size = len(expected)
+            offsets = np.arange(count)[:, None] * size
+            bad = np.zeros(count, dtype=np.int64)
+            while start < self.trial_count:
+                end = min(start + c_crossing_size, self.trial_count)
+                window = (combinations[:, start:end] + offsets).reshape(-1)
+                counts = np.bincount(window, minlength=count * size).reshape(count, size)
+                delta = counts - expected * c_sustain_weight
+                if start + c_crossing_size > self.trial_count:
+                    delta = np.maximum(delta, 0)
+                # Only combinations that occur are compared to their expected counts
+                bad += np.where(counts > 0, np.abs(delta), 0).sum(axis=1)
+                start += c_crossing_size
+            for i in np.flatnonzero(bad > 0):
+                errors[i].append(str(crossing))
+        return errors
+
+    @staticmethod
+    def __combinations(crossing: List[Factor], coded: Dict[Factor, np.ndarray]):
+        """Numbers each trial's combination of crossing levels, where the last
+        number for each factor stands for a trial without a level, and returns
+        those numbers with each combination's weight."""
+        combinations = np.zeros(coded[crossing[0]].shape, dtype=np.int64)
+        expected = np.ones(1, dtype=np.int64)
+        for f in crossing:
+            radix = len(f.levels) + 1
+            codes = coded[f]
+            combinations = combinations * radix + np.where(codes == _NO_LEVEL, radix - 1, codes)
+            weights = np.array([l.weight for l in f.levels] + [1], dtype=np.int64)
+            expected = np.multiply.outer(expected, weights).reshape(-1)
+        return combinations, expected
+
+    def __trial_count_report(self, sample: dict) -> dict:
+        report = {}
+        for key in sample:
+            if len(sample[key]) != self.trial_count:
+                report['trial_count'] = [key, len(sample[key]), self.trial_count]
+        return report
+
+    def __validate_in_workers(self, samples: Sequence[dict], workers: int) -> List[dict]:
+        # Forked processes inherit the block, whose derivations may hold
+        # predicates that cannot be pickled. Without fork, fall back to threads.
+        chunk_size = (len(samples) + workers - 1) // workers
+        chunks = [samples[i:i + chunk_size] for i in range(0, len(samples), chunk_size)]
+        forking = 'fork' in get_all_start_methods()
+        executor: Executor
+        if forking:
+            executor = ProcessPoolExecutor(len(chunks), mp_context=get_context('fork'),
+                                           initializer=_set_worker_validator, initargs=(self,))
+        else:
+            executor = ThreadPoolExecutor(len(chunks))
+        with executor as pool:
+            fn = _validate_in_worker if forking else self.validate_full_length
+            return [report for reports in pool.map(fn, chunks) for report in reports]
+
+
+# The validator for a forked worker process, inherited from the parent.
+_worker_validator = cast(Optional[SampleValidator], None)
+
+def _set_worker_validator(validator: SampleValidator) -> None:
+    global _worker_validator
+    _worker_validator = validator
+
+def _validate_in_worker(samples: Sequence[dict]) -> List[dict]:
+    return cast(SampleValidator, _worker_validator).validate_full_length(samples)
@@ -0,0 +1,289 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import stat
+import threading
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import BaseServer, ThreadingMixIn, UnixStreamServer
+from typing import Any, Dict, Optional, Set, Tuple, cast
+
+from sweetpea._internal.block import Block
+from sweetpea._internal.progress import CancellationToken
+
+
+"""
+A long-running local service that samples trials for designs, so that each
+request does not pay for starting Python, importing sweetpea, building the
+design's block, and encoding it.
+
+A design is sent as the source of a SweetPea program that assigns its block
+to `block`, since derived levels are Python functions and so can only be sent
+as code. The service runs the program, so it listens only on localhost or on
+a Unix socket, and it must only be used by trusted clients:
+
+  * Over TCP, each request must carry the server's secret token, as
+    `Authorization: Bearer <token>`, and a Host header of `127.0.0.1:<port>` or
+    `localhost:<port>`, which rejects requests through DNS rebinding.
+  * A Unix socket is created with permissions for only its owner, so no
+    token is needed.
+  * Requests with an Origin header, which browsers add to cross-site
+    requests, are rejected, as are POST requests whose Content-Type is not
+    `application/json`, which a page cannot send without a preflight.
+
+Designs are keyed
+by a fingerprint of their source, and the blocks of the most recently used
+designs are kept, each with the encodings that sampling builds from it: the
+backend request and CNF, and RandomGen's solution enumerator with its counting
+memos. No solver state is kept between requests: the SAT solvers are
+executables that read a CNF file and exit, and that have no interface for
+keeping a warm instance, so each call runs them as a new process with the
+kept CNF.
+
+Requests are served concurrently, each in its own thread, as JSON over HTTP:
+
+    POST /sample  {"design": "<program>", "samples": 10, "strategy": "RandomGen", "timeout": 60}
+              ->  {"fingerprint": "<sha256>", "trials": [...], "cancelled": false}
+    GET /status   ->  {"designs": ["<sha256>", ...], "cache_size": 16, "hits": 3, "misses": 1}
+
+A request with an invalid design or parameters, or without a valid
+Content-Length, gets a 400 response, one whose body is larger than
+SWEETPEA_SERVICE_MAX_REQUEST bytes, or else 1 MiB, gets a 413 response, and
+one whose sampling fails gets a 500 response. A request without the token gets a
+401 response, one from a browser or with another Host gets a 403 response,
+and one with another Content-Type gets a 415 response. All error responses
+have an "error" message.
+"""
+
+
+# Hosts that the service listens on over TCP.
+_LOCAL_HOSTS = ['127.0.0.1', 'localhost']
+
+# The largest request body that the service reads, in bytes.
+_MAX_REQUEST_SIZE = int(os.environ.get('SWEETPEA_SERVICE_MAX_REQUEST', str(1 << 20)))
+
+# Strategies that can be named in a request, all of which sample a block with
+# no further arguments.
+_STRATEGIES = ['RandomGen', 'IterateGen', 'IterateSATGen', 'IterateILPGen',
+               'UniformGen', 'UniGen', 'CMSGen', 'SMGen']
+
+
+class _Design():
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.block = cast(Optional[Block], None)
+
+
+class SamplingService():
+    """Samples trials for designs sent as SweetPea programs, keeping the
+    blocks and encodings of the `cache_size` most recently used designs.
+    """
+
+    def __init__(self, cache_size: Optional[int] = None) -> None:
+        if cache_size is None:
+            cache_size = int(os.environ.get('SWEETPEA_SERVICE_CACHE_SIZE', '16'))
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__designs = cast('OrderedDict[str, _Design]', OrderedDict())
+
+    @staticmethod
+    def fingerprint(design: str) -> str:
+        return hashlib.sha256(design.encode('utf-8')).hexdigest()
+
+    def block(self, design: str) -> Tuple[str, Block]:
+        """Returns the fingerprint of a design and its block, running the
+        design's program only if the block is not kept."""
+        key = SamplingService.fingerprint(design)
+        with self.__lock:
+            entry = self.__designs.get(key)
+            if entry is None:
+                self.misses += 1
+                entry = _Design()
+                self.__designs[key] = entry
+                while len(self.__designs) > max(self.cache_size, 1):
+                    self.__designs.popitem(last=False)
+            else:
+                self.hits += 1
+                self.__designs.move_to_end(key)
+        with entry.lock:
+            if entry.block is None:
+                try:
+                    entry.block = SamplingService.__compile(design)
+                except BaseException:
+                    with self.__lock:
+                        if self.__designs.get(key) is entry:
+                            del self.__designs[key]
+                    raise
+            return key, entry.block
+
+    def sample(self, design: str, samples: int = 10, strategy: str = 'IterateGen',
+               timeout: Optional[float] = None) -> dict:
+        """Samples `samples` sets of trials for a design with the named
+        strategy, stopping early if `timeout` seconds pass."""
+        import sweetpea
+        if not isinstance(design, str):
+            raise TypeError("A design must be the source of a SweetPea program")
+        if strategy not in _STRATEGIES:
+            raise ValueError(f"Unknown sampling strategy: {strategy}")
+        if not isinstance(samples, int) or samples < 0:
+            raise ValueError(f"The number of samples must be a non-negative integer, not {samples!r}")
+        key, block = self.block(design)
+        token = CancellationToken(timeout)
+        trials = sweetpea.synthesize_trials(block, samples, getattr(sweetpea, strategy), cancellation=token)
+        return {'fingerprint': key, 'trials': trials, 'cancelled': token.stopped}
+
+    def status(self) -> dict:
+        with self.__lock:
+            return {'designs': list(self.__designs), 'cache_size': self.cache_size,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def make_server(self, host: str = '127.0.0.1', port: int = 8765, path: Optional[str] = None,
+                    token: Optional[str] = None) -> BaseServer:
+        """Returns a server for this service, which listens on the Unix socket
+        at `path` if it is given, and otherwise on `host` and `port`. Over
+        TCP, requests must carry `token`, which defaults to the
+        SWEETPEA_SERVICE_TOKEN environment variable, or else a new random
+        token, and is the server's `token` attribute. The server runs until
+        its `shutdown` method is called."""
+        handler = cast(Any, type('_Handler', (_Handler,), {'service': self}))
+        if path is None:
+            if host not in _LOCAL_HOSTS:
+                raise ValueError(f"The service only listens on {' or '.join(_LOCAL_HOSTS)}, not {host}")
+            tcp_server = _TCPHTTPServer((host, port), handler)
+            tcp_server.token = token or os.environ.get('SWEETPEA_SERVICE_TOKEN') or secrets.token_urlsafe(32)
+            bound_port = cast(Tuple[str, int], tcp_server.server_address)[1]
+            tcp_server.allowed_hosts = {f"{h}:{bound_port}" for h in _LOCAL_HOSTS}
+            return tcp_server
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            # Left by a server that did not shut down
+            os.unlink(path)
+        # Bound with permissions for only the owner, rather than changed to
+        # them afterward, so that others can never connect
+        umask = os.umask(0o177)
+        try:
+            return _UnixHTTPServer(path, handler)
+        finally:
+            os.umask(umask)
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8765, path: Optional[str] = None,
+              token: Optional[str] = None) -> None:
+        """Serves requests until the process is interrupted."""
+        server = self.make_server(host, port, path, token)
+        if path is None:
+            bound_port = cast(Tuple[str, int], server.server_address)[1]
+            print(f"Serving samples on http://{host}:{bound_port} with token {cast(_TCPHTTPServer, server).token}")
+        else:
+            print(f"Serving samples on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    @staticmethod
+    def __compile(design: str) -> Block:
+        namespace = {'__name__': '__sweetpea_design__'}  # type: Dict[str, Any]
+        try:
+            exec(compile(design, '<design>', 'exec'), namespace)
+        except Exception as e:
+            raise ValueError(f"The design failed with {type(e).__name__}: {e}") from e
+        block = namespace.get('block')
+        if not isinstance(block, Block):
+            raise ValueError("A design must assign its block to `block`")
+        block.keep_encodings()
+        return block
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    token = cast(Optional[str], None)
+    allowed_hosts = cast(Optional[Set[str]], None)
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    token = cast(Optional[str], None)
+    allowed_hosts = cast(Optional[Set[str]], None)
+
+    def server_close(self) -> None:
+        super().server_close()
+        path = cast(str, self.server_address)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = cast(SamplingService, None)
+
+    def do_GET(self) -> None:
+        if not self.__permitted():
+            return
+        if self.path == '/status':
+            self.__respond(200, self.service.status())
+        else:
+            self.__respond(404, {'error': f"Not found: {self.path}"})
+
+    def do_POST(self) -> None:
+        if not self.__permitted():
+            return
+        if self.path != '/sample':
+            self.__respond(404, {'error': f"Not found: {self.path}"})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self.__respond(415, {'error': "The Content-Type must be application/json"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.__respond(400, {'error': "A valid Content-Length is required"})
+            return
+        if length > _MAX_REQUEST_SIZE:
+            self.__respond(413, {'error': f"The request is larger than {_MAX_REQUEST_SIZE} bytes"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length))
+            args = (request['design'], request.get('samples', 10), request.get('strategy', 'IterateGen'),
+                    request.get('timeout'))  # type: Tuple[str, int, str, Optional[float]]
+            result = self.service.sample(*args)
+        except (ValueError, KeyError, TypeError) as e:
+            self.__respond(400, {'error': f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self.__respond(500, {'error': f"{type(e).__name__}: {e}"})
+        else:
+            self.__respond(200, result)
+
+    def __permitted(self) -> bool:
+        # Responds with an error and returns false for a request that may not
+        # come from a trusted local client
+        server = cast(Any, self.server)
+        if 'Origin' in self.headers:
+            self.__respond(403, {'error': "Requests from browsers are not accepted"})
+            return False
+        if server.allowed_hosts is not None and self.headers.get('Host') not in server.allowed_hosts:
+            self.__respond(403, {'error': f"Unexpected Host: {self.headers.get('Host')}"})
+            return False
+        if server.token is not None:
+            expected = f"Bearer {server.token}".encode('utf-8')
+            given = self.headers.get('Authorization', '').encode('utf-8')
+            if not hmac.compare_digest(given, expected):
+                self.__respond(401, {'error': "A valid token is required"})
+                return False
+        return True
+
+    def address_string(self) -> str:
+        # A Unix socket's client has no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    def __respond(self, code: int, body: dict) -> None:
+        data = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
@@ -0,0 +1,169 @@
+from time import time
+from typing import Dict, Tuple, Type
+
+from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
+from sweetpea._internal.block import Block
+from sweetpea._internal.instrumentation import instrumented, span
+from sweetpea._internal.progress import suspended
+
+"""
+This strategy selects RandomGen, SMGen, CMSGen, or IterateSATGen for each
+block by estimating the time that each would take from short pilot runs:
+
+  * RandomGen generates candidate sequences for the pilot time, or until it
+    has accepted as many as requested, to estimate the time per candidate and
+    the fraction of candidates that it rejects for complex windows and
+    constraints.
+  * SMGen produces one sequence within the pilot time, and is not a choice if
+    it cannot, such as for a design that it does not support.
+  * For the SAT-based strategies, the block's CNF is built and solved once,
+    along with a trivial CNF to measure the solver's start-up time.
+    IterateSATGen starts the solver for each sequence, while CMSGen produces
+    every sequence in one run with a slower, randomized search.
+
+The pilots run in that order, and once a strategy is expected to finish
+within the pilot time, it is chosen without running the later pilots, which
+also avoids building a large CNF when sampling is quick. Otherwise, the
+strategy with the lowest estimate is chosen. The choice and the estimates are
+recorded in the result's metrics as 'auto'.
+"""
+
+
+# Seconds for each pilot run.
+DEFAULT_PILOT_TIME = 0.25
+
+# The slowdown of CMSGen's randomized search for one sequence compared to
+# one plain solve of the same CNF.
+CMSGEN_SLOWDOWN = 2.0
+
+
+class AutoGen(Gen):
+
+    def __init__(self, pilot_time: float = DEFAULT_PILOT_TIME):
+        self.pilot_time = pilot_time
+
+    def __str__(self):
+        return AutoGen.class_name()
+
+    @staticmethod
+    def class_name():
+        return 'AutoGen'
+
+    @staticmethod
+    def sample(block: Block, sample_count: int) -> SamplingResult:
+        return AutoGen.__sample(block, sample_count, DEFAULT_PILOT_TIME)
+
+    def sample_object(self, block: Block, sample_count: int) -> SamplingResult:
+        return AutoGen.__sample(block, sample_count, self.pilot_time)
+
+    @staticmethod
+    def __sample(block: Block, sample_count: int, pilot_time: float) -> SamplingResult:
+        from sweetpea._internal.sampling_strategy.cmsgen import CMSGen
+        from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
+        from sweetpea._internal.sampling_strategy.random import RandomGen
+        from sweetpea._internal.sampling_strategy.smgen import SMGen
+        strategies = {'RandomGen': RandomGen, 'SMGen': SMGen,
+                      'CMSGen': CMSGen, 'IterateSATGen': IterateSATGen}  # type: Dict[str, Type[Gen]]
+
+        block.trials_per_sample()
+        if block.show_errors():
+            return SamplingResult([], {})
+
+        # Kept so that the chosen strategy reuses the encodings built for its pilot
+        with instrumented() as instrumentation, block.keeping_encodings():
+            with span('estimate_costs'):
+                estimates, costs = AutoGen.__estimate(block, sample_count, pilot_time)
+            # Without an estimate, IterateSATGen reports why the block cannot be sampled
+            choice = min(costs, key=lambda name: costs[name]) if costs else 'IterateSATGen'
+            print(f"Selected {choice} to sample.")
+            result = strategies[choice].sample(block, sample_count)
+            instrumentation.with_spans(result.metrics)
+        result.metrics['auto'] = {'strategy': choice, 'costs': costs, 'estimates': estimates}
+        return result
+
+    @staticmethod
+    def __estimate(block: Block, sample_count: int, pilot_time: float) -> Tuple[Dict[str, dict], Dict[str, float]]:
+        estimates = {}  # type: Dict[str, dict]
+        costs = {}  # type: Dict[str, float]
+
+        estimate = AutoGen.__random_pilot(block, sample_count, pilot_time)
+        estimates['RandomGen'] = estimate
+        if 'error' not in estimate:
+            costs['RandomGen'] = AutoGen.__random_cost(estimate, sample_count)
+            if costs['RandomGen'] < pilot_time:
+                return estimates, costs
+
+        estimate = AutoGen.__smgen_pilot(block, pilot_time)
+        estimates['SMGen'] = estimate
+        if 'error' not in estimate:
+            costs['SMGen'] = estimate['time'] * sample_count
+            if costs['SMGen'] < pilot_time:
+                return estimates, costs
+
+        estimate = AutoGen.__sat_pilot(block)
+        estimates['SAT'] = estimate
+        if 'error' not in estimate:
+            startup = min(estimate['startup_time'], estimate['solve_time'])
+            costs['IterateSATGen'] = estimate['solve_time'] * sample_count
+            costs['CMSGen'] = startup + (estimate['solve_time'] - startup) * CMSGEN_SLOWDOWN * sample_count
+        return estimates, costs
+
+    @staticmethod
+    def __random_pilot(block: Block, sample_count: int, pilot_time: float) -> dict:
+        from sweetpea._internal.sampling_strategy.random import RandomGen
+        try:
+            with span('pilot', strategy='RandomGen'):
+                return RandomGen.pilot(block, pilot_time, max_accepted=sample_count)
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+
+    @staticmethod
+    def __random_cost(estimate: dict, sample_count: int) -> float:
+        if estimate['candidates'] == 0:
+            # No sequences are possible, which RandomGen finds immediately
+            return 0.0
+        time_per_candidate = estimate['time'] / estimate['candidates']
+        if estimate['candidates'] == estimate['possible_sequences']:
+            # Every candidate was tried, so sampling tries them again at most
+            return time_per_candidate * estimate['possible_sequences']
+        # Smoothed, so that a pilot without accepted candidates gives a finite cost
+        acceptance = (estimate['accepted'] + 1) / (estimate['candidates'] + 2)
+        return time_per_candidate * sample_count / acceptance
+
+    @staticmethod
+    def __smgen_pilot(block: Block, pilot_time: float) -> dict:
+        from sweetpea._internal.sampling_strategy.smgen import SMGen
+        start = time()
+        try:
+            with span('pilot', strategy='SMGen'), suspended():
+                result = SMGen(time_budget=pilot_time).sample_object(block, 1)
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+        if not result.samples:
+            return {'error': "No sequence was produced"}
+        return {'time': time() - start}
+
+    @staticmethod
+    def __sat_pilot(block: Block) -> dict:
+        from sweetpea._internal.core import CNF, cnf_is_satisfiable
+        from sweetpea._internal.core.cnf import Clause, Var
+        from sweetpea._internal.server import build_cnf
+        try:
+            with span('pilot', strategy='SAT'):
+                cnf = build_cnf(block)
+                start = time()
+                cnf_is_satisfiable(CNF(Clause(Var(1))))
+                startup_time = time() - start
+                start = time()
+                satisfiable = cnf_is_satisfiable(cnf)
+                solve_time = time() - start
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+        clauses = cnf.as_list_of_list_of_ints()
+        return {
+            'variables': max((abs(v) for clause in clauses for v in clause), default=0),
+            'clauses': len(clauses),
+            'satisfiable': satisfiable,
+            'startup_time': startup_time,
+            'solve_time': solve_time
+        }
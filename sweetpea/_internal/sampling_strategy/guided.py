@@ -1,17 +1,26 @@
 import os
+import threading
 import numpy as np
 
-from functools import reduce
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import reduce, partial
 from itertools import product, chain
 from time import time
-from typing import List, cast
+from typing import Any, Dict, List, Optional, Tuple, cast
 
 from sweetpea._internal.block import Block
 from sweetpea._internal.core import CNF, cnf_is_satisfiable
+from sweetpea._internal.core.generate.tools.cryptominisat import HAS_PYCRYPTOSAT
+from sweetpea._internal.instrumentation import instrumented
 from sweetpea._internal.logic import And, cnf_to_json
+from sweetpea._internal.progress import report, should_stop, with_cancelled
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.server import build_cnf
 
+if HAS_PYCRYPTOSAT:
+    import pycryptosat
+
 
 """
 This strategy gradually constructs samples in memory, with the aid of a SAT solver to
@@ -19,53 +28,101 @@ guide the choices it makes.
 
 While sufficient in some cases, this strategy isn't guaranteed to produce uniform results
 because trial selections early on can prune the remaining search space unevenly.
+
+Candidate trials are checked concurrently when `workers` is greater than 1 (or when
+the SWEETPEA_GUIDED_WORKERS environment variable is set for the static `sample`).
+
+The allowed trials for each committed prefix are cached across samples, up to
+`cache_size` prefixes (or SWEETPEA_GUIDED_CACHE_SIZE for the static `sample`), so
+early trials are not re-checked for every sample. A size of 0 disables the cache.
 """
 class GuidedGen(Gen):
 
+    def __init__(self, workers: int = 1, cache_size: int = 1024):
+        self.workers = workers
+        self.cache_size = cache_size
+
     @staticmethod
     def class_name():
         return 'GuidedGen'
 
     @staticmethod
     def sample(block: Block, sample_count: int) -> SamplingResult:
+        return GuidedGen.__sample(block, sample_count,
+                                  GuidedGen.__default_workers(), GuidedGen.__default_cache_size())
+
+    def sample_object(self, block: Block, sample_count: int) -> SamplingResult:
+        return GuidedGen.__sample(block, sample_count, self.workers, self.cache_size)
+
+    @staticmethod
+    def __sample(block: Block, sample_count: int, workers: int, cache_size: int) -> SamplingResult:
+        with instrumented() as instrumentation:
+            result = GuidedGen.__generate(block, sample_count, workers, cache_size)
+            instrumentation.with_spans(result.metrics)
+            return result
+
+    @staticmethod
+    def __generate(block: Block, sample_count: int, workers: int, cache_size: int) -> SamplingResult:
 
         samples = cast(List[dict], [])
         metrics = cast(dict, {
-            'sample_metrics': []
+            'sample_metrics': [],
+            'workers': workers
         })
 
         overall_start = time()
+        metrics['start'] = overall_start
 
         # Build the full CNF for this block
         cnf = build_cnf(block)
+        metrics['cnf_time'] = time() - overall_start
 
         metrics['solver_call_count'] = 0
-        for _ in range(sample_count):
-            sample_metrics = cast(dict, {})
-            t_start = time()
-            samples.append(GuidedGen.__generate_sample(block, cnf, sample_metrics))
-            sample_metrics['time'] = time() - t_start
-            metrics['sample_metrics'].append(sample_metrics)
-            metrics['solver_call_count'] += sample_metrics['solver_call_count']
+        metrics['cache_hits'] = 0
+        checker = _CandidateChecker(cnf, workers)
+        cache = _PrefixCache(cache_size)
+        try:
+            for _ in range(sample_count):
+                sample_metrics = cast(dict, {})
+                t_start = time()
+                sample_metrics['start'] = t_start
+                sample = GuidedGen.__generate_sample(block, checker, cache, sample_metrics, len(samples), sample_count)
+                if sample is None:
+                    break
+                samples.append(sample)
+                report('sample', len(samples), requested=sample_count)
+                sample_metrics['time'] = time() - t_start
+                metrics['sample_metrics'].append(sample_metrics)
+                metrics['solver_call_count'] += sample_metrics['solver_call_count']
+                metrics['cache_hits'] += sample_metrics['cache_hits']
+        finally:
+            checker.close()
 
         metrics['time'] = time() - overall_start
         GuidedGen.__compute_additional_metrics(metrics)
 
-        return SamplingResult(samples, metrics)
+        return SamplingResult(samples, with_cancelled(metrics))
 
 
     @staticmethod
-    def __generate_sample(block: Block, cnf: CNF, sample_metrics: dict) -> dict:
+    def __generate_sample(block: Block, checker: '_CandidateChecker', cache: '_PrefixCache',
+                          sample_metrics: dict, sampled: int, sample_count: int) -> Optional[dict]:
+        # Produces None when sampling is cancelled before the sample is complete
         sample_metrics['trials'] = []
 
         # Start a 'committed' list of CNFs
         committed = cast(List[And], [])
 
-        for trial_number in range(block.trials_per_sample()):
+        trial_count = block.trials_per_sample()
+        for trial_number in range(trial_count):
+            if should_stop():
+                return None
+            report('trial', sampled, requested=sample_count, trial=trial_number + 1, trials=trial_count)
             trial_start_time = time()
 
             trial_metrics = {
                 't': trial_number + 1,
+                'start': trial_start_time,
                 'solver_calls': []
             }
             solver_calls = cast(List[dict], trial_metrics['solver_calls'])
@@ -77,20 +134,23 @@ class GuidedGen(Gen):
 
             trial_metrics['potential_trials'] = len(potential_trials)
 
+            cached_trials = cache.lookup(committed)
+            if cached_trials is not None:
+                potential_trials = cached_trials
+                trial_metrics['cached'] = True
+                if GuidedGen.__prefilter_enabled():
+                    trial_metrics['prefiltered_out'] = 0
+
             # Use env var to switch between filtering and not
-            if GuidedGen.__prefilter_enabled():
+            elif GuidedGen.__prefilter_enabled():
                 # Flatten the list
                 flat_vars = list(chain(*variables))
 
                 # Check SAT for each one
                 unsat = []
-                for v in flat_vars:
-                    t_start = time()
-                    full_cnf = cnf + CNF(cnf_to_json(committed)) + CNF(cnf_to_json([And([v])]))
-                    allowed = cnf_is_satisfiable(full_cnf)
-                    duration_seconds = time() - t_start
-                    solver_calls.append({'time': duration_seconds, 'SAT': allowed})
-                    if not allowed:
+                for v, call in zip(flat_vars, checker.check(committed, [[fv] for fv in flat_vars])):
+                    solver_calls.append(call)
+                    if not call['SAT']:
                         unsat.append(v)
 
                 # TODO: Count filtering SAT calls separately?
@@ -107,17 +167,16 @@ class GuidedGen(Gen):
                 trial_metrics['prefiltered_out'] = len(potential_trials) - len(filtered_pts)
                 potential_trials = filtered_pts
 
-            allowed_trials = []
-            for potential_trial in potential_trials:
-                start_time = time()
-                full_cnf = cnf + CNF(cnf_to_json(committed)) + CNF(cnf_to_json([And(potential_trial)]))
-                allowed = cnf_is_satisfiable(full_cnf)
-                duration_seconds = time() - start_time
-
-                solver_calls.append({'time': duration_seconds, 'SAT': allowed})
+            if cached_trials is not None:
+                allowed_trials = cached_trials
+            else:
+                allowed_trials = []
+                for potential_trial, call in zip(potential_trials, checker.check(committed, potential_trials)):
+                    solver_calls.append(call)
 
-                if allowed:
-                    allowed_trials.append(potential_trial)
+                    if call['SAT']:
+                        allowed_trials.append(potential_trial)
+                cache.store(committed, allowed_trials)
 
             trial_metrics['allowed_trials'] = len(allowed_trials)
             trial_metrics['solver_call_count'] = len(solver_calls)
@@ -132,12 +191,19 @@ class GuidedGen(Gen):
 
         # Aggregate the total solver calls
         sample_metrics['solver_call_count'] = 0
+        sample_metrics['cache_hits'] = 0
         for tm in sample_metrics['trials']:
             sample_metrics['solver_call_count'] += tm['solver_call_count']
+            if tm.get('cached'):
+                sample_metrics['cache_hits'] += 1
 
         # Flatten the committed trials into a list of integers and decode it.
+        decode_start = time()
         solution = GuidedGen.__committed_to_solution(committed)
-        return Gen.decode(block, solution)
+        decoded = Gen.decode(block, solution)
+        sample_metrics['decode_start'] = decode_start
+        sample_metrics['decode_time'] = time() - decode_start
+        return decoded
 
     @staticmethod
     def __committed_to_solution(committed: List[And]) -> List[int]:
@@ -147,6 +213,14 @@ class GuidedGen(Gen):
     def __prefilter_enabled():
         return os.environ.get('SWEETPEA_GUIDED_PREFILTER_TRIALS') is not None
 
+    @staticmethod
+    def __default_workers() -> int:
+        return int(os.environ.get('SWEETPEA_GUIDED_WORKERS', '1'))
+
+    @staticmethod
+    def __default_cache_size() -> int:
+        return int(os.environ.get('SWEETPEA_GUIDED_CACHE_SIZE', '1024'))
+
     @staticmethod
     def print_summary(result: SamplingResult) -> None:
         metrics = result.metrics
@@ -154,6 +228,7 @@ class GuidedGen(Gen):
         print("Total SAT Solver Calls: {}".format(metrics['solver_call_count']))
         print("Mean SAT Time: {}".format(metrics['mean_sat_time']))
         print("Mean UNSAT Time: {}".format(metrics['mean_unsat_time']))
+        print("Cached Trials: {}".format(metrics['cache_hits']))
 
         if 'total_prefiltered_out' in metrics:
             print("Total Prefiltered Out: {}".format(metrics['total_prefiltered_out']))
@@ -175,8 +250,9 @@ class GuidedGen(Gen):
                         total_unsat += 1
                         total_unsat_time += sc['time']
 
-        metrics['mean_sat_time'] = total_sat_time / total_sat
-        metrics['mean_unsat_time'] = total_unsat_time / total_unsat
+        # There may be no calls of a kind, such as when sampling is cancelled early
+        metrics['mean_sat_time'] = total_sat_time / total_sat if total_sat else 0
+        metrics['mean_unsat_time'] = total_unsat_time / total_unsat if total_unsat else 0
 
         if GuidedGen.__prefilter_enabled():
             total_prefiltered_out = 0
@@ -186,6 +262,144 @@ class GuidedGen(Gen):
             metrics['total_prefiltered_out'] = total_prefiltered_out
 
 
+"""
+Checks candidate trials for satisfiability against a block's CNF plus a
+committed prefix of trials. Candidates for a trial are independent of each
+other, so they are distributed over a pool of workers.
+
+When pycryptosat is available, each worker keeps a warm incremental solver
+loaded with the block's CNF, and the committed prefix and candidate are passed
+as assumptions, so learned clauses carry over from call to call. Otherwise,
+each check runs the solver from scratch, and workers are threads that wait on
+solver processes.
+"""
+class _CandidateChecker():
+
+    def __init__(self, cnf: CNF, workers: int) -> None:
+        self.__cnf = cnf
+        self.__solver = None
+        self.__executor = cast(Optional[Executor], None)
+        if HAS_PYCRYPTOSAT:
+            clauses = cnf.as_list_of_list_of_ints()
+            if workers > 1:
+                self.__executor = ProcessPoolExecutor(workers,
+                                                      initializer=_start_warm_solver,
+                                                      initargs=(clauses,))
+            else:
+                self.__solver = _new_solver(clauses)
+        elif workers > 1:
+            self.__executor = ThreadPoolExecutor(workers)
+
+    def check(self, committed: List[And], candidates: List[List[int]]) -> List[dict]:
+        """Returns a `{'time': ..., 'SAT': ...}` record for each candidate, in order."""
+        if HAS_PYCRYPTOSAT:
+            prefix = reduce(lambda sol, clause: sol + clause.input_list, committed, cast(List[int], []))
+            fn = partial(_check_with_warm_solver, prefix, solver=self.__solver)
+        else:
+            prefix_cnf = self.__cnf + CNF(cnf_to_json(committed))
+            fn = partial(_check_with_fresh_solver, prefix_cnf)
+        if self.__executor is None:
+            return list(map(fn, candidates))
+        return list(self.__executor.map(fn, candidates))
+
+    def close(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown()
+
+
+"""
+A trie keyed by committed trials that records the allowed candidates for the
+next trial after each prefix. Since the allowed candidates depend only on the
+block's CNF and the prefix, they can be shared by all samples of a block.
+
+At most `budget` prefixes keep their allowed candidates; the least recently
+used one is dropped (along with any trie nodes left empty) when the budget
+is exceeded.
+"""
+class _PrefixCache():
+
+    class _Node():
+        def __init__(self, parent: Optional['_PrefixCache._Node'], key: Tuple[int, ...]) -> None:
+            self.parent = parent
+            self.key = key
+            self.children = cast(Dict[Tuple[int, ...], '_PrefixCache._Node'], {})
+            self.allowed = cast(Optional[List[List[int]]], None)
+
+    def __init__(self, budget: int) -> None:
+        self.__budget = budget
+        self.__root = _PrefixCache._Node(None, ())
+        self.__lru = cast('OrderedDict[int, _PrefixCache._Node]', OrderedDict())
+
+    def lookup(self, committed: List[And]) -> Optional[List[List[int]]]:
+        node = self.__find(committed, False)
+        if node is None or node.allowed is None:
+            return None
+        self.__lru.move_to_end(id(node))
+        return node.allowed
+
+    def store(self, committed: List[And], allowed: List[List[int]]) -> None:
+        if self.__budget <= 0:
+            return
+        node = cast(_PrefixCache._Node, self.__find(committed, True))
+        node.allowed = allowed
+        self.__lru[id(node)] = node
+        self.__lru.move_to_end(id(node))
+        while len(self.__lru) > self.__budget:
+            _, evicted = self.__lru.popitem(last=False)
+            self.__evict(evicted)
+
+    def __find(self, committed: List[And], create: bool) -> Optional['_PrefixCache._Node']:
+        node = self.__root
+        for trial in committed:
+            key = tuple(trial.input_list)
+            child = node.children.get(key)
+            if child is None:
+                if not create:
+                    return None
+                child = _PrefixCache._Node(node, key)
+                node.children[key] = child
+            node = child
+        return node
+
+    def __evict(self, node: '_PrefixCache._Node') -> None:
+        node.allowed = None
+        while node.parent is not None and not node.children and node.allowed is None:
+            del node.parent.children[node.key]
+            node = node.parent
+
+
+# The warm solver for a worker process.
+_warm_solver = cast(Any, None)
+
+
+def _new_solver(clauses: List[List[int]]):
+    solver = pycryptosat.Solver()
+    for clause in clauses:
+        solver.add_clause(clause)
+    return solver
+
+
+def _start_warm_solver(clauses: List[List[int]]) -> None:
+    global _warm_solver
+    _warm_solver = _new_solver(clauses)
+
+
+def _check_with_warm_solver(prefix: List[int], candidate: List[int], solver=None) -> dict:
+    start_time = time()
+    sat, _ = (solver or _warm_solver).solve(prefix + candidate)
+    return {'time': time() - start_time, 'SAT': sat, 'start': start_time, 'worker': _worker_id()}
+
+
+def _check_with_fresh_solver(prefix_cnf: CNF, candidate: List[int]) -> dict:
+    start_time = time()
+    allowed = cnf_is_satisfiable(prefix_cnf + CNF(cnf_to_json([And(candidate)])))
+    return {'time': time() - start_time, 'SAT': allowed, 'start': start_time, 'worker': _worker_id()}
+
+
+def _worker_id() -> str:
+    return '{}:{}'.format(os.getpid(), threading.get_ident())
+
+
 """
 Generates a static HTML file that will render a flamegraph showing the time breakdown for a given sampling.
 """
@@ -1,12 +1,11 @@
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
-from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
-from sweetpea._internal.sampling_strategy.random import RandomGen
 
 """
 This represents a strategy where we "sample" just by using some
 solver repeatedly to produce unique (but not necessarily uniform) samples.
-A specific strategy is selected automatically.
+A specific strategy is selected automatically, and its module is imported
+only then, since this strategy is the default of `synthesize_trials`.
 """
 class IterateGen(Gen):
     
@@ -16,6 +15,8 @@ class IterateGen(Gen):
 
     @staticmethod
     def sample(block: Block, sample_count: int) -> SamplingResult:
+        from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
+        from sweetpea._internal.sampling_strategy.random import RandomGen
         if block.complex_factors_or_constraints:
             return IterateSATGen.sample(block, sample_count)
         else:
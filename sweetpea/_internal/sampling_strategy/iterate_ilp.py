@@ -2,6 +2,7 @@ from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
 from sweetpea._internal.core import CNF
 from sweetpea._internal.core.generate.sample_ilp import sample_ilp_iterate
+from sweetpea._internal.instrumentation import instrumented, span
 
 class IterateILPGen(Gen):
 
@@ -11,14 +12,19 @@ class IterateILPGen(Gen):
 
     @staticmethod
     def sample(block: Block, sample_count: int) -> SamplingResult:
-        backend_request = block.build_backend_request()
-        if block.show_errors():
-            return SamplingResult([], {})
+        with instrumented() as instrumentation:
+            backend_request = block.build_backend_request()
+            with span('validate_block'):
+                if block.show_errors():
+                    return SamplingResult([], instrumentation.with_spans({}))
 
-        solutions = sample_ilp_iterate(sample_count,
-                                       CNF(backend_request.get_cnfs_as_json()),
-                                       block.variables_per_sample(),
-                                       backend_request.get_requests_as_generation_requests())
+            cnf = CNF(backend_request.get_cnfs_as_json())
+            with span('solve'):
+                solutions = sample_ilp_iterate(sample_count,
+                                               cnf,
+                                               block.variables_per_sample(),
+                                               backend_request.get_requests_as_generation_requests())
 
-        result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
-        return SamplingResult(result, {})
+            with span('decode'):
+                result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
+            return SamplingResult(result, instrumentation.with_spans({}))
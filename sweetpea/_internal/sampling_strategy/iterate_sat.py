@@ -1,8 +1,10 @@
-from typing import List, cast
+from typing import Iterator
 
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
-from sweetpea._internal.core import CNF, sample_non_uniform
+from sweetpea._internal.core import CNF, sample_non_uniform, iterate_non_uniform
+from sweetpea._internal.instrumentation import instrumented, span
+from sweetpea._internal.progress import with_cancelled
 
 """
 This represents a strategy where we "sample" just by using a SAT
@@ -16,16 +18,37 @@ class IterateSATGen(Gen):
 
     @staticmethod
     def sample(block: Block, sample_count: int) -> SamplingResult:
-        backend_request = block.build_backend_request()
-        if block.show_errors():
-            return SamplingResult([], {})
+        with instrumented() as instrumentation:
+            backend_request = block.build_backend_request()
+            with span('validate_block'):
+                if block.show_errors():
+                    return SamplingResult([], instrumentation.with_spans({}))
+
+            cnf = CNF(backend_request.get_cnfs_as_json())
+            with span('solve'):
+                solutions = sample_non_uniform(sample_count,
+                                               cnf,
+                                               backend_request.fresh - 1,
+                                               block.variables_per_sample(),
+                                               backend_request.get_requests_as_generation_requests())
+
+            with span('decode'):
+                result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
+            return SamplingResult(result, instrumentation.with_spans(with_cancelled({})))
 
-        solutions = sample_non_uniform(sample_count,
-                                       CNF(backend_request.get_cnfs_as_json()),
-                                       backend_request.fresh - 1,
-                                       block.variables_per_sample(),
-                                       backend_request.get_requests_as_generation_requests())
 
-        result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
-        return SamplingResult(result, {})
+    @staticmethod
+    def enumerate(block: Block) -> Iterator[dict]:
+        """Lazily produces every valid sequence for `block`, using a single
+        incremental solver with a blocking clause added per solution.
+        """
+        backend_request = block.build_backend_request()
+        if block.show_errors():
+            return
 
+        solutions = iterate_non_uniform(CNF(backend_request.get_cnfs_as_json()),
+                                        backend_request.fresh - 1,
+                                        block.variables_per_sample(),
+                                        backend_request.get_requests_as_generation_requests())
+        for s in solutions:
+            yield Gen.decode(block, s.assignment)
@@ -5,7 +5,8 @@ import numpy as np
 from functools import reduce
 from itertools import product
 from math import factorial, ceil
-from typing import List, cast, Tuple, Dict, Optional, Union, Any
+from time import time
+from typing import List, cast, Tuple, Dict, Iterator, Optional, Union, Any
 
 from sweetpea._internal.block import Block
 from sweetpea._internal.cross_block import CrossBlock
@@ -16,15 +17,22 @@ from sweetpea._internal.combinatorics import (
     PermutationMemo
 )
 from sweetpea._internal.design_partition import DesignPartitions
+from sweetpea._internal.instrumentation import instrumented, span
 from sweetpea._internal.logic import And
 from sweetpea._internal.primitive import SimpleLevel, Factor, DerivedFactor, Level
+from sweetpea._internal.progress import report, should_stop, with_cancelled
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.constraint import Exclude, _KInARow, ExactlyKInARow, AtMostKInARow
-from sweetpea._internal.iter import chunk
+from sweetpea._internal.iter import chunk, lazy_product
 from sweetpea._internal.weight import combination_weight
 from sweetpea._internal.check_mismatch import combinations_mismatched_weights
 
 
+# The most candidate runs that are generated and then checked against the
+# constraints together.
+MAX_CANDIDATE_BATCH = 256
+
+
 class RandomGen(Gen):
     """This strategy represents the ideal. Valid sequences are uniformly
     sampled via a bijection from natural numbers to valid trial sequences.
@@ -51,89 +59,233 @@ class RandomGen(Gen):
 
     @staticmethod
     def __sample(block: Block, sample_count: int, acceptable_error: int) -> SamplingResult:
+        with instrumented() as instrumentation:
+            result = RandomGen.__generate(block, sample_count, acceptable_error)
+            instrumentation.with_spans(result.metrics)
+            return result
+
+    @staticmethod
+    def __generate(block: Block, sample_count: int, acceptable_error: int) -> SamplingResult:
         # 1. Validate the block.
-        RandomGen.__validate(block)
+        with span('validate_block'):
+            RandomGen.__validate(block)
+            if block.show_errors():
+                return SamplingResult([], {})
         metrics = {}
 
-        if block.show_errors():
-            return SamplingResult([], {})
-
         # 2. Count how many solutions there are. The enumerator will note
         # the crossing size and minimum-trial request, and it will be prepared
         # to generate runs of a crossing-size length or "leftover" length.
         print("Counting possible configurations...")
-        enumerator = UCSolutionEnumerator(cast(CrossBlock, block))
-        metrics['solution_count'] = enumerator.solution_count()
+        with span('count_solutions'):
+            enumerator = block.cached_encoding('solution_enumerator',
+                                               lambda: UCSolutionEnumerator(cast(CrossBlock, block)))
+            metrics['solution_count'] = enumerator.solution_count()
 
         if (enumerator.solution_count() == 0):
             return SamplingResult([], metrics)
 
-        crossing_size = enumerator.crossing_size # includes crossing weight
-
         # 3. Generate samples.
         print("Generating samples...")
-        metrics['rejections'] = []
-        sampled = 0
-        rejected = 0
-        total_rejected = 0
+        with span('solve'):
+            metrics['rejections'] = []
+            sampled = 0
+            rejected = 0
+            total_rejected = 0
+            trials_per_run, rounds_per_run, leftover, possible_keys = RandomGen.__run_shape(block, enumerator)
+            samples = cast(List[dict], [])
+            used_keys = cast(Dict[Tuple[int, ...], bool], {})
+            while sampled < sample_count:
+                if len(used_keys) == possible_keys or should_stop():
+                    break
+
+                # Candidates are checked in batches, which are processed in order
+                # so that the rejections are the same as one at a time
+                batch_size = RandomGen.__batch_size(sample_count - sampled, sampled + total_rejected + rejected,
+                                                    sampled, possible_keys - len(used_keys))
+                runs = RandomGen.__random_runs(enumerator, trials_per_run, rounds_per_run, leftover, used_keys,
+                                               batch_size)
+                violations = RandomGen.__constraint_violations(cast(CrossBlock, block), runs, enumerator,
+                                                               rounds_per_run, leftover, acceptable_error)
+                for run, violated in zip(runs, violations):
+                    if sampled == sample_count or should_stop():
+                        break
+
+                    if violated:
+                        rejected += 1
+                        if rejected % 1000 == 0:
+                            report('reject', len(samples), requested=sample_count,
+                                   rejected=total_rejected + rejected)
+                        if rejected % 10000 == 0:
+                            if len(samples) > 0:
+                                accepts = f", accepted {len(samples)}"
+                            else:
+                                accepts = ""
+                            n = total_rejected + rejected
+                            print(f"Rejected {n} candidates so far (out of {possible_keys} choices){accepts}")
+                        continue
+
+                    metrics['rejections'].append(rejected)
+                    total_rejected += rejected
+                    rejected = 0
+                    sampled += 1
+
+                    with span('decode'):
+                        samples.append(enumerator.factors_and_levels_to_names(run))
+                    report('sample', len(samples), requested=sample_count, rejected=total_rejected)
+
+        metrics['sample_count'] = sample_count
+        metrics['total_rejected'] = total_rejected
+        metrics['avg_rejected'] = total_rejected / sample_count
+        if (total_rejected > 10000):
+            print("")
+
+        return SamplingResult(samples, with_cancelled(metrics))
+
+    @staticmethod
+    def pilot(block: Block, time_limit: float, max_accepted: Optional[int] = None,
+              acceptable_error: int = 0) -> dict:
+        """Generates distinct candidate sequences for `block` for about
+        `time_limit` seconds, or until `max_accepted` would be accepted,
+        without keeping them, to estimate the cost of sampling. Returns the
+        number of possible candidates, the number generated, how many of those
+        would be accepted, and the time taken.
+        """
+        RandomGen.__validate(block)
+        enumerator = block.cached_encoding('solution_enumerator',
+                                           lambda: UCSolutionEnumerator(cast(CrossBlock, block)))
+        estimate = {'possible_sequences': 0, 'candidates': 0, 'accepted': 0, 'time': 0.0}
+        if enumerator.solution_count() == 0:
+            return estimate
+
+        trials_per_run, rounds_per_run, leftover, possible_keys = RandomGen.__run_shape(block, enumerator)
+        estimate['possible_sequences'] = possible_keys
+        used_keys = cast(Dict[Tuple[int, ...], bool], {})
+        candidates = 0
+        accepted = 0
+        start = time()
+        while (len(used_keys) < possible_keys and (len(used_keys) == 0 or time() - start < time_limit)
+               and (max_accepted is None or accepted < max_accepted)):
+            needed = max_accepted - accepted if max_accepted is not None else MAX_CANDIDATE_BATCH
+            batch_size = RandomGen.__batch_size(needed, candidates, accepted, possible_keys - len(used_keys))
+            runs = RandomGen.__random_runs(enumerator, trials_per_run, rounds_per_run, leftover, used_keys,
+                                           batch_size)
+            for violated in RandomGen.__constraint_violations(cast(CrossBlock, block), runs, enumerator,
+                                                              rounds_per_run, leftover, acceptable_error):
+                if accepted == max_accepted:
+                    break
+                candidates += 1
+                accepted += not violated
+        estimate.update({'candidates': candidates, 'accepted': accepted, 'time': time() - start})
+        return estimate
+
+    @staticmethod
+    def __run_shape(block: Block, enumerator: 'UCSolutionEnumerator') -> Tuple[int, int, int, int]:
+        # The trials in a run, the number of crossing-sized rounds and the size of
+        # the leftover round that follow the preamble, and the number of distinct runs
+        crossing_size = enumerator.crossing_size # includes crossing weight
         trials_per_run = block.trials_per_sample()
         rounds_per_run = (trials_per_run - enumerator._preamble_size) // crossing_size
         leftover = (trials_per_run - enumerator._preamble_size) % crossing_size
-        samples = cast(List[dict], [])
-        used_keys = cast(Dict[Tuple[int, ...], bool], {})
         possible_keys = (enumerator.preamble_solution_count()
                          * pow(enumerator.solution_count(), rounds_per_run)
                          * enumerator.leftover_solution_count())
-        while sampled < sample_count:
-            if len(used_keys) == possible_keys:
-                break
+        return trials_per_run, rounds_per_run, leftover, possible_keys
 
-            solution_variabless = enumerator.generate_random_samples(rounds_per_run, leftover, used_keys)
-            used_keys[enumerator.extract_sequence_key(solution_variabless)] = True
+    @staticmethod
+    def __batch_size(needed: int, candidates: int, accepted: int, remaining_keys: int) -> int:
+        # Enough candidates for the needed acceptances at the acceptance rate so far
+        expected = -(-needed * (candidates + 1) // (accepted + 1))
+        return max(1, min(expected, MAX_CANDIDATE_BATCH, remaining_keys))
 
-            # Combine randomly selected crossing-sized runs plus a leftover-sized run
-            # into one complete run with the requested number of trials.
-            run = solution_variabless[0][1]  # the preamble solution, possibly empty
-            for round in range(0, rounds_per_run + (1 if leftover > 0 else 0)):
-                run = RandomGen.__combine_round(run, solution_variabless[round + 1][1])
+    @staticmethod
+    def __random_runs(enumerator: 'UCSolutionEnumerator', trials_per_run: int, rounds_per_run: int,
+                      leftover: int, used_keys: Dict[Tuple[int, ...], bool], count: int) -> List[dict]:
+        return [RandomGen.__random_run(enumerator, trials_per_run, rounds_per_run, leftover, used_keys)
+                for _ in range(count)]
 
-            run = enumerator.fill_in_nonpreamble_uncrossed_derived(run, trials_per_run)
+    @staticmethod
+    def __random_run(enumerator: 'UCSolutionEnumerator', trials_per_run: int, rounds_per_run: int,
+                     leftover: int, used_keys: Dict[Tuple[int, ...], bool]) -> dict:
+        solution_variabless = enumerator.generate_random_samples(rounds_per_run, leftover, used_keys)
+        used_keys[enumerator.extract_sequence_key(solution_variabless)] = True
 
-            if RandomGen.__are_constraints_violated(cast(CrossBlock, block), run, enumerator,
-                                                    rounds_per_run, leftover,
-                                                    acceptable_error):
-                rejected += 1
-                if rejected % 10000 == 0:
-                    if len(samples) > 0:
-                        accepts = f", accepted {len(samples)}"
-                    else:
-                        accepts = ""
-                    n = total_rejected + rejected
-                    print(f"Rejected {n} candidates so far (out of {possible_keys} choices){accepts}")
-                continue
+        # Combine randomly selected crossing-sized runs plus a leftover-sized run
+        # into one complete run with the requested number of trials.
+        run = solution_variabless[0][1]  # the preamble solution, possibly empty
+        for round in range(0, rounds_per_run + (1 if leftover > 0 else 0)):
+            run = RandomGen.__combine_round(run, solution_variabless[round + 1][1])
 
-            metrics['rejections'].append(rejected)
-            total_rejected += rejected
-            rejected = 0
-            sampled += 1
+        return enumerator.fill_in_nonpreamble_uncrossed_derived(run, trials_per_run)
 
-            samples.append(enumerator.factors_and_levels_to_names(run))
+    @staticmethod
+    def enumerate(block: Block) -> Iterator[dict]:
+        """Lazily produces every valid sequence for `block` by walking the
+        enumerator's indices in order, instead of choosing them randomly.
+        Sequences that violate a constraint are skipped, and only the current
+        choice of indices is kept in memory.
+        """
+        RandomGen.__validate(block)
+        if block.show_errors():
+            return
 
-        metrics['sample_count'] = sample_count
-        metrics['total_rejected'] = total_rejected
-        metrics['avg_rejected'] = total_rejected / sample_count
-        if (total_rejected > 10000):
-            print("")
+        enumerator = block.cached_encoding('solution_enumerator',
+                                           lambda: UCSolutionEnumerator(cast(CrossBlock, block)))
+        if (enumerator.solution_count() == 0):
+            return
+
+        crossing_size = enumerator.crossing_size
+        trials_per_run = block.trials_per_sample()
+        rounds_per_run = (trials_per_run - enumerator._preamble_size) // crossing_size
+        leftover = (trials_per_run - enumerator._preamble_size) % crossing_size
+
+        def preambles():
+            return range(enumerator.preamble_solution_count())
 
-        return SamplingResult(samples, metrics)
+        def rounds():
+            return enumerator.enumerate_components(enumerator._components_shape, crossing_size, 0)
+
+        def leftovers():
+            return enumerator.enumerate_components(enumerator._leftover_components_shape, leftover, leftover)
+
+        choices = lazy_product(preambles,
+                               *([rounds] * rounds_per_run),
+                               *([leftovers] if leftover > 0 else []))
+        for choice in choices:
+            run = enumerator.generate_preamble_sample(choice[0])
+            for components in choice[1:1 + rounds_per_run]:
+                run = RandomGen.__combine_round(run, enumerator.generate_sample_from_components(components))
+            if leftover > 0:
+                run = RandomGen.__combine_round(run, enumerator.generate_leftover_sample(choice[-1], leftover))
+
+            run = enumerator.fill_in_nonpreamble_uncrossed_derived(run, trials_per_run)
+
+            if RandomGen.__are_constraints_violated(cast(CrossBlock, block), run, enumerator,
+                                                    rounds_per_run, leftover, 0):
+                continue
+
+            yield enumerator.factors_and_levels_to_names(run)
 
     @staticmethod
     def __are_constraints_violated(block: CrossBlock, sample: dict, enumerator: 'UCSolutionEnumerator',
                                    rounds_per_run: int, leftover: int,
                                    acceptable_error: int) -> bool:
-        for ct in block.constraints:
-            if not ct.potential_sample_conforms(sample, block):
-                return True
+        return RandomGen.__constraint_violations(block, [sample], enumerator, rounds_per_run, leftover,
+                                                 acceptable_error)[0]
+
+    @staticmethod
+    def __constraint_violations(block: CrossBlock, samples: List[dict], enumerator: 'UCSolutionEnumerator',
+                                rounds_per_run: int, leftover: int,
+                                acceptable_error: int) -> List[bool]:
+        conforming = block.constraint_checker().conforming(samples)
+        return [not conforms or RandomGen.__are_crossings_violated(block, sample, enumerator, rounds_per_run,
+                                                                    leftover, acceptable_error)
+                for sample, conforms in zip(samples, conforming)]
+
+    @staticmethod
+    def __are_crossings_violated(block: CrossBlock, sample: dict, enumerator: 'UCSolutionEnumerator',
+                                 rounds_per_run: int, leftover: int,
+                                 acceptable_error: int) -> bool:
         if enumerator.has_crossed_complex_derived_factors or len(block.crossings) > 1:
             # Check whether the sample achieves each crossing in the run
             bad = 0
@@ -365,6 +517,27 @@ class UCSolutionEnumerator():
                 source_combination_indices,
                 independent_factor_combination_indices)
 
+    def enumerate_components(self, components_shape: RandomComponentsShape, trial_count: int,
+                             leftover: int) -> Iterator[Components]:
+        """Like `random_components`, but produces every valid choice of components in order."""
+        def indices(shapes: List[int]) -> Iterator[Tuple[int, ...]]:
+            return lazy_product(*[(lambda n=n: range(n)) for n in shapes])
+
+        for crossing_permutation_index in range(components_shape.crossings_shape):
+            if trial_count == len(self._crossing_instances) and self._crossing_is_unweighted:
+                combinations_shapes = components_shape.combinations_shapes
+            else:
+                permutation_indices = self.jth_permutation_indices(len(self._crossing_instances),
+                                                                   self.crossing_size if leftover == 0 else leftover,
+                                                                   crossing_permutation_index,
+                                                                   self._pmemo if leftover == 0 else self._leftover_pmemo)
+                combinations_shapes = [components_shape.combinations_shapes[p] for p in permutation_indices]
+            for source_combination_indices in indices(combinations_shapes):
+                for independent_factor_combination_indices in indices(components_shape.independent_shapes):
+                    yield (crossing_permutation_index,
+                           source_combination_indices,
+                           independent_factor_combination_indices)
+
     def extract_sequence_key(self, solution_variabless: List[Tuple[int, dict]]) -> Tuple[int, ...]:
         return tuple(map(lambda sv: sv[0], solution_variabless))
 
@@ -12,95 +12,33 @@
     The core algorithm thresholds play an important role in how efficiently a
     permutation can be completed. The thresholds should dynamically change for
     each experiment as there is not an ideal number for all cases.
-    The default time-out is 60 seconds which should be more than enough for
-    most normal experiments. If thresholds are configured correctly, the algorithm
-    should find a correct answer within a few seconds.
+    The default time-out is 60 seconds per answer which should be more than enough for
+    most normal experiments. The time-out is checked each time the search restarts,
+    so no timer thread or signal is needed. If thresholds are configured correctly, the algorithm
+    should find a correct answer within a few seconds. Cancellation of the synthesis is checked
+    at the same point, after which the answers completed so far are produced.
 
     By Sirus Shahini
     ~cyn
 
 '''
-
-from random import random
+import random
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from copy import copy
+from itertools import product
+from multiprocessing import get_all_start_methods, get_context
+from random import Random
 from time import time
-# from signal import signal,setitimer,ITIMER_REAL,SIGALRM
-
-# from signal import signal,setitimer,ITIMER_REAL,SIGALRM
-import threading
-
-# Module global variables
-##########################################################
-objects=[]
-primary_objects=[]
-transitions=[]
-within_trials=[]
-
-cross=[]
-
-weighted_objects=[]
-weights=[]
-weighted_objects_init=[]
-weights_init=[]
-wt_count=0
-trans_count=0
-c_counts = []
-c_objs_count=0
-trans_cells=[]
-trans_cell_start=-1
-wt_cells=[]
-obs_counts=[]
-comb_len =0
-all_weights=[]
-cross_weights=[]
-cross_counts=[]
-unweighted_experiment=True
-M=0
-M_raw=0
-L=0
-asg_vf={}
-asg_wt_vf={}
 
+from sweetpea._internal.progress import report, should_stop
+
+# Default time-out, in seconds, for producing a single answer.
 EXEC_TH=60
-##########################################################
-
-def reset_state():
-    global objects, primary_objects, transitions, within_trials, cross, weighted_objects, weights
-    global weighted_objects_init, weights_init, wt_count, trans_count, c_counts, c_objs_count
-    global trans_cells, trans_cell_start, wt_cells, obs_counts, comb_len, all_weights, cross_weights
-    global cross_counts, unweighted_experiment, M, M_raw, L, asg_vf, asg_wt_vf, EXEC_TH
-    
-    objects=[]
-    primary_objects=[]
-    transitions=[]
-    within_trials=[]
-    
-    
-    cross=[]
-    
-    weighted_objects=[]
-    weights=[]
-    weighted_objects_init=[]
-    weights_init=[]
-    wt_count=0
-    trans_count=0
-    c_counts = []
-    c_objs_count=0
-    trans_cells=[]
-    trans_cell_start=-1
-    wt_cells=[]
-    obs_counts=[]
-    comb_len =0
-    all_weights=[]
-    cross_weights=[]
-    cross_counts=[]
-    unweighted_experiment=True
-    M=0
-    M_raw=0
-    L=0
-    asg_vf={}
-    asg_wt_vf={}
-    
-    EXEC_TH=60    
+
+# Default starting threshold of back steps before the search restarts.
+SM_CORE_TH_DEFAULT=150
 
 def _cexit(m,*var):
     if len(var)>0:
@@ -108,7 +46,11 @@ def _cexit(m,*var):
             m+= " " + str(e)
     raise Exception(m)
 
-def shuffle_list(l):
+# Raised by the search when the synthesis is cancelled.
+class _Cancelled(Exception):
+    pass
+
+def shuffle_list(l,random):
     if len(l)==1:
         return
 
@@ -120,978 +62,1329 @@ def shuffle_list(l):
         l[i]=tmp
 
 '''
-    Calculate the direct index of the combination within the space of
-    the possible combinaitons in the cross.
+    Return the current active object for combination "ind" that
+    we are enumerating possible transitions to the neighboring cell.
 '''
-def comb_index(combs):
-    right_cross=1
-    r=0
-    for i in range(len(cross)-1,-1,-1):
-        if combs[cross[i]] >= cross_counts[i] : _cexit("invalid input")
-        r += combs[cross[i]] * right_cross
-        right_cross*=cross_counts[i]
+def get_states_ar_ind(nums,ind):
+    if nums[ind][0]<1:
+        _cexit("Invalid get state request")
+
+    return nums[ind][0]-1
+
+def get_wt_val(ar,perm):
+    cur=ar
+    for i in range(0,len(perm)-1):
+        cur=cur[perm[i]]
+    return cur[perm[-1]]
 
-    return r
 
 '''
-    Return the number of necessary copies of a given combination based on
-    the weights config.
-    We use the structures that we populate in the execute function to find the correct
-    number. The generation of a given combination is halted when we hit the cap that
-    is returned by this function.
+    Itermediate classes for the objects that we need to parse in this module.
+    These itermediary objects store only what we need to create our own encoding not
+    the entire information in the original objects.
+    SMGen does not recognize sweetpea classes. Any new class, object or structure
+    from sweetpea core that is going to be used in SMGen must be first defined for
+    the module.
+
 '''
-def get_cap(comb):
-    if unweighted_experiment:
-        return 1
-
-    r=1
-    for i in range(len(weighted_objects)):
-        w_obj = weighted_objects[i][0]
-        val=comb[w_obj]
-
-        for j in range(len(weighted_objects[i])-1):
-            weighted_level_ind=weighted_objects[i][j+1]
-            if val == weighted_level_ind:
-                r *= all_weights[w_obj][weighted_level_ind]
-                break
+class _Factor:
+    def __init__(self,name,initial_levels):
+        self.name=name
+        self.levels=initial_levels # initial_levels to match sweetpea naming convention
+        '''
+            cell_index is used to replace object arguments with the
+            corresponding indices. Since transitions cannot be arguments to
+            any factors, this member is not used for them but we set it anyways.
+        '''
+
+
+        self.cell_index=-1
+
+        primary_types=[str,int,float]
+        if type(self.levels[0]) in primary_types:
+            self.type=0
+        elif type(self.levels[0])==_DerivedLevel:
+            self.type=self.levels[0].type
+            self.args=self.levels[0].dr_level.args
+            self.weighted=False
+
+            for l in self.levels:
+                if l.weight>1:
+                    self.weighted=True
+                    break
+        else:
+            _cexit("Unsupported factor:",name)
+
+class _DerivedLevel:
+    def __init__(self,name,l,weight=1):
+        self.name=name
+        self.dr_level=l
+        self.weight=weight
+
+        if type(l)==_WithinTrial:
+            self.type=1
+        elif type(l)==_Transition:
+            self.type=2
+        else:
+            _cexit("Unsupported DerivedLevel")
+
+
+
+class _WithinTrial:
+    def __init__(self,func,args):
+        self.func=func
+        self.args=args
 
-    return r
+class _Transition:
+    def __init__(self,func,args):
+        self.func=func
+        self.args=args
+        #if len(args)!=1:
+        #    print("[!] Unsupported transition")
 
 '''
-    Return the number of cells that we need to fill to create a cross
-    based on the user constraints. This is an init function and the use
-    of sum() is fine here.
+    Intermediate classes for the trial constraints that the search enforces as
+    it places each trial. Trials are numbered as in the produced answer, so a
+    constraint sees the preamble trial when a transition is crossed. The
+    engine calls resolve() in prepare(), once cell indices are known.
 '''
-def perms_count(raw):
-    r=1
+class _LevelConstraint:
+    def __init__(self,factor,level):
+        self.factor=factor
+        self.level=level
+        self.cell=-1
+        self.inds=set()
+
+    def resolve(self,engine):
+        self.cell=self.factor.cell_index
+        self.inds={j for j,name in enumerate(engine.level_names(self.cell)) if name==self.level}
 
-    if unweighted_experiment or raw:
-        for i in range(len(cross_counts)):
-            r*=cross_counts[i]
-    else:
-        for i in range(len(cross_counts)):
-            r*= sum(cross_weights[i])
+class _Exclude(_LevelConstraint):
 
-    return r
+    def check(self,engine,pre,permut,t):
+        return engine.trial_value(pre,permut,t,self.cell) not in self.inds
+
+class _Pin(_LevelConstraint):
+    def __init__(self,factor,level,trials):
+        _LevelConstraint.__init__(self,factor,level)
+        self.trials=set(trials)
+
+    def check(self,engine,pre,permut,t):
+        return t not in self.trials or engine.trial_value(pre,permut,t,self.cell) in self.inds
 
 '''
-    Return a fresh row strcuture to the back-tracking function.
+    Lengths of the runs of a level within each trial range. A run that gets
+    longer than max_run fails as soon as it is placed, and a finished run must be
+    at least min_run long and a multiple of "multiple".
 '''
-def new_rows(w):
-    rows=[]
-    for i in range(w):
-        r=[0]*c_objs_count
-        r[-1]=-1
-        rows.append(r)
-    return rows
-
-def clear_single_row(ar):
-    for i in range(c_objs_count-1):
-        ar[i]=0
-    ar[-1]=-1
+class _RunLength(_LevelConstraint):
+    def __init__(self,factor,level,ranges,min_run=1,max_run=None,multiple=1):
+        _LevelConstraint.__init__(self,factor,level)
+        self.ranges=ranges
+        self.min_run=min_run
+        self.max_run=max_run
+        self.multiple=multiple
+
+    def run_length(self,engine,pre,permut,stop,start):
+        n=0
+        t=stop-1
+        while t>=start and engine.trial_value(pre,permut,t,self.cell) in self.inds:
+            n+=1
+            t-=1
+        return n
+
+    def finished_ok(self,n):
+        return n>=self.min_run and n%self.multiple==0
+
+    def check(self,engine,pre,permut,t):
+        for start,end in self.ranges:
+            if not start<=t<end:
+                continue
+            if engine.trial_value(pre,permut,t,self.cell) in self.inds:
+                n=self.run_length(engine,pre,permut,t+1,start)
+                if self.max_run is not None and n>self.max_run:
+                    return False
+                if t==end-1 and not self.finished_ok(n):
+                    return False
+            elif t>start and engine.trial_value(pre,permut,t-1,self.cell) in self.inds:
+                if not self.finished_ok(self.run_length(engine,pre,permut,t,start)):
+                    return False
+        return True
 
 '''
-    Clear object tracker to init the next round of permutation generation.
+    The total number of trials with a level within each trial range.
 '''
-def clear_nums(nums):
-    for i in range(M_raw):
-        nums[i][0]=0
-        if unweighted_experiment:
-            clear_single_row(nums[i][1][0])
-        else:
-            for j in range(len(nums[i][1])):
-                clear_single_row(nums[i][1][j])
+class _Count(_LevelConstraint):
+    def __init__(self,factor,level,ranges,count):
+        _LevelConstraint.__init__(self,factor,level)
+        self.ranges=ranges
+        self.count=count
+
+    def check(self,engine,pre,permut,t):
+        for start,end in self.ranges:
+            if not start<=t<end:
+                continue
+            matched=engine.trial_value(pre,permut,t,self.cell) in self.inds
+            if matched or t==end-1:
+                n=0
+                for s in range(start,t+1):
+                    if engine.trial_value(pre,permut,s,self.cell) in self.inds:
+                        n+=1
+                if n>self.count or (t==end-1 and n!=self.count):
+                    return False
+        return True
 
 '''
-    Return the current active object for combination "ind" that
-    we are enumerating possible transitions to the neighboring cell.
+    A crossing other than the one that the search is built around. From trial
+    "start" on, trials are split into windows of "size" trials, and no
+    combination of the crossed levels may appear in a window more often than
+    its quota. Since the quotas add up to the window size, a complete window
+    then has each combination exactly as often as required.
 '''
-def get_states_ar_ind(nums,ind):
-    if nums[ind][0]<1:
-        _cexit("Invalid get state request")
+class _Crossing:
+    def __init__(self,factors,start,size,quotas):
+        self.factors=factors
+        self.start=start
+        self.size=size
+        self.quotas=quotas
+        self.cells=[]
+        self.names=[]
+
+    def resolve(self,engine):
+        self.cells=[f.cell_index for f in self.factors]
+        self.names=[engine.level_names(cell) for cell in self.cells]
+
+    def combination(self,engine,pre,permut,t):
+        comb=[]
+        for cell,names in zip(self.cells,self.names):
+            v=engine.trial_value(pre,permut,t,cell)
+            comb.append(names[v] if v>=0 else None)
+        return tuple(comb)
+
+    def check(self,engine,pre,permut,t):
+        if t<self.start:
+            return True
+        comb=self.combination(engine,pre,permut,t)
+        quota=self.quotas.get(comb,0)
+        if quota==0:
+            return False
+        first=t-(t-self.start)%self.size
+        n=1
+        for s in range(first,t):
+            if self.combination(engine,pre,permut,s)==comb:
+                n+=1
+                if n>quota:
+                    return False
+        return True
 
-    return nums[ind][0]-1
+class PrimaryObject:
+    def __init__(self, name, levels, factor):
+        self.name = name
+        self.levels = levels
+        self.factor = factor
 
 '''
-    This is the core algorithm of this module. This algorithm randomly branches to a valid
-    combination for the cell to its right. It stops progression of the path by early detection
-    of the first cell that creates an invalid derived factor. A big number of paths that end up
-    in invalid permutations from the sample space are avoided. For a partial path of length l
-    that is discarded, (M-l)! permutations are eliminated from the sample space.
-    When we get to fill the last cell, a valid cross is guaranteed.
-    The algorithm does not depend on the sepcific characteristics of the default model that I have
-    assumed for the objects. As long as you can clearly define what you want the code
-    to look back and forward to form the basis of a "valid" next combination, it will
-    work to create a correct permutation for sweetpea experiments. For example, the current
-    code assumes that the window size for a Transition derived level is 2, meaning that we pass
-    the previous and the next values of the respective factor to know that which predicate
-    function is chosen. The window size can be larger, but it does need updating the code
-    to adapt to the new expectation.
+    Online tuning of the backtracking threshold from the back steps that each
+    answer needed. Until some answer needs a restart, the threshold has no
+    effect and the default is kept. After that, each candidate is tried once,
+    and then the candidate with the fewest back steps per answer so far is used.
 '''
-def sm_backtrack_random():
-    permut=[]
-    nums=[]
+class ThresholdTuner:
+    CANDIDATES=[SM_CORE_TH_DEFAULT,100,60,40,225]
 
-    for i in range(M):
-        line = [-1] * comb_len
-        permut.append(line)
+    def __init__(self,candidates=None):
+        self.candidates=list(candidates or ThresholdTuner.CANDIDATES)
+        self.backtracks={th:[] for th in self.candidates}
+        self.binding=False
 
-    weight=1
-    for i in range(M_raw):
-        if not unweighted_experiment:
-            weight=combs_weights[i]
+    def choose(self):
+        if not self.binding:
+            return self.candidates[0]
+        for th in self.candidates:
+            if not self.backtracks[th]:
+                return th
+        return min(self.candidates,key=lambda th: sum(self.backtracks[th])/len(self.backtracks[th]))
 
-        nums.append([0 , new_rows(weight)  ])
+    def record(self,th,backtracks,restarts):
+        self.backtracks[th].append(backtracks)
+        if restarts>0:
+            self.binding=True
 
 
-    back_steps=0
-    total_bck=0
+'''
+    The scattered-map engine. All of the state for one experiment lives in an
+    engine object, so separate engines can run in parallel threads.
+    Use encode_experiment() and define_cross() to describe the experiment, then
+    execute() to produce answers. An engine is meant to be used for a single
+    experiment.
+'''
+class ScatteredMapEngine:
+    def __init__(self, seed=None, exec_th=EXEC_TH, time_budget=None, tuner=None):
+        # Without a seed, share the random module so that random.seed() still applies.
+        self.random=Random(seed).random if seed is not None else random.random
+
+        self.objects=[]
+        self.primary_objects=[]
+        self.transitions=[]
+        self.within_trials=[]
+
+        self.cross=[]
+
+        self.weighted_objects=[]
+        self.weights=[]
+        self.weighted_objects_init=[]
+        self.weights_init=[]
+        self.wt_count=0
+        self.trans_count=0
+        self.c_counts = []
+        self.c_objs_count=0
+        self.trans_cells=[]
+        self.trans_cell_start=-1
+        self.wt_cells=[]
+        self.obs_counts=[]
+        self.comb_len =0
+        self.all_weights=[]
+        self.cross_weights=[]
+        self.cross_counts=[]
+        self.unweighted_experiment=True
+        self.M=0
+        self.M_raw=0
+        self.L=0
+        self.asg_vf={}
+        self.asg_wt_vf={}
+        self.combs_weights=[]
+        self.trans_in_crossing=False
+        self.trial_constraints=[]
+        self.excluded_names=set()
+        self.excluded=[]
+
+        self.EXEC_TH=exec_th
+        self.time_budget=time_budget
+        self.deadline=None
+        self.deadline_message=""
+
+        self.tuner=tuner or ThresholdTuner()
+        self.last_run={}
+        # Per-answer statistics: back steps, restarts, threshold and time
+        self.stats=[]
+        self.prepared=False
 
     '''
-        Chossing these threasholds needs more work.
-        SM_CORE_TH changes dynamically.
-        When an experiment starts to get problematic, we generally benefit from
-        reducing SM_CORE_TH to smaller numbers (like 30-40). But for most difficult
-        experiments 100-150 works overall better.
-        Generally, if we choose something tens of units greater or smaller than the
-        ideal threashold for the current experiment, efficiency is notably hurt.
-
+        Calculate the direct index of the combination within the space of
+        the possible combinaitons in the cross.
     '''
-    SM_CORE_TH_MIN=100
-    SM_CORE_TH_RNG=100
-    SM_CORE_TH_RET=150
-    SM_CORE_TH_MAX=150
-    SM_CORE_TH=SM_CORE_TH_MAX
+    def comb_index(self, combs):
+        right_cross=1
+        r=0
+        for i in range(len(self.cross)-1,-1,-1):
+            if combs[self.cross[i]] >= self.cross_counts[i] : _cexit("invalid input")
+            r += combs[self.cross[i]] * right_cross
+            right_cross*=self.cross_counts[i]
 
-    loc=0
-    pre=[]
+        return r
 
     '''
-        Main loops.
-        Outer loop: Start with forming the initial states and take it from there.
-        Each group of factors are handled separately. We enumerate through the primary
-        objects and then fill the dependent cells which are WithinTrials and Transitions.
-        The primary target cells constitute the main elements of the back-tracking logic.
-        Note that the value for a dependent cell is looked up in O(1) using the init maps
-        instead on actually calling the predicate functions.
-        We reference the nums structure to track the objects in combination selection process.
+        Return the number of necessary copies of a given combination based on
+        the weights config.
+        We use the structures that we populate in the execute function to find the correct
+        number. The generation of a given combination is halted when we hit the cap that
+        is returned by this function.
     '''
-    while True:
-
-        for i in range(c_objs_count):
-            permut[0][i]=int(random()* obs_counts[i])
-
-        if trans_count>0:
-            pre=[-1]*(c_objs_count + wt_count)
-            for i in range(c_objs_count):
-                pre[i]=int(random()* obs_counts[i])
-            for i in range(wt_count):
-                wt=within_trials[i]
-                wt_id=wt_cells[i][0]
-                params=[]
-                for ind in wt_cells[i][1]:
-                    params.append(pre[ind])
-
-                ans=get_wt_val(asg_wt_vf[i],params)
-                pre[wt_id]=ans
-
-                params=[]
-                for ind in wt_cells[i][1]:
-                    params.append(permut[0][ind])
+    def get_cap(self, comb):
+        if self.unweighted_experiment:
+            return 1
+
+        r=1
+        for i in range(len(self.weighted_objects)):
+            w_obj = self.weighted_objects[i][0]
+            val=comb[w_obj]
+
+            for j in range(len(self.weighted_objects[i])-1):
+                weighted_level_ind=self.weighted_objects[i][j+1]
+                if val == weighted_level_ind:
+                    r *= self.all_weights[w_obj][weighted_level_ind]
+                    break
 
-                ans=get_wt_val(asg_wt_vf[i],params)
-                permut[0][wt_id]=ans
+        return r
 
-            for i in range(trans_count):
-                target_cell=trans_cells[i][1]
-                trans_ind=trans_cells[i][0]
+    '''
+        Return the number of cells that we need to fill to create a cross
+        based on the user constraints. This is an init function and the use
+        of sum() is fine here.
+    '''
+    def perms_count(self, raw):
+        r=1
 
-                src=pre[target_cell]
-                dst=permut[0][target_cell]
+        if self.unweighted_experiment or raw:
+            for i in range(len(self.cross_counts)):
+                r*=self.cross_counts[i]
+        else:
+            for i in range(len(self.cross_counts)):
+                r*= sum(self.cross_weights[i])
 
-                ans=(asg_vf[i])[src][dst]
-                permut[0][trans_ind]=ans
+        return r
 
-        else:
-            for i in range(wt_count):
-                #just permut[0]
+    '''
+        Return a fresh row strcuture to the back-tracking function.
+    '''
+    def new_rows(self, w):
+        rows=[]
+        for i in range(w):
+            r=[0]*self.c_objs_count
+            r[-1]=-1
+            rows.append(r)
+        return rows
+
+    def clear_single_row(self, ar):
+        for i in range(self.c_objs_count-1):
+            ar[i]=0
+        ar[-1]=-1
 
-                wt=within_trials[i]
-                wt_id=wt_cells[i][0]
+    '''
+        Clear object tracker to init the next round of permutation generation.
+    '''
+    def clear_nums(self, nums):
+        for i in range(self.M_raw):
+            nums[i][0]=0
+            if self.unweighted_experiment:
+                self.clear_single_row(nums[i][1][0])
+            else:
+                for j in range(len(nums[i][1])):
+                    self.clear_single_row(nums[i][1][j])
 
-                params=[]
-                for ind in wt_cells[i][1]:
-                    params.append(permut[0][ind])
+    '''
+        This is the core algorithm of this module. This algorithm randomly branches to a valid
+        combination for the cell to its right. It stops progression of the path by early detection
+        of the first cell that creates an invalid derived factor. A big number of paths that end up
+        in invalid permutations from the sample space are avoided. For a partial path of length l
+        that is discarded, (M-l)! permutations are eliminated from the sample space.
+        When we get to fill the last cell, a valid cross is guaranteed.
+        The algorithm does not depend on the sepcific characteristics of the default model that I have
+        assumed for the objects. As long as you can clearly define what you want the code
+        to look back and forward to form the basis of a "valid" next combination, it will
+        work to create a correct permutation for sweetpea experiments. For example, the current
+        code assumes that the window size for a Transition derived level is 2, meaning that we pass
+        the previous and the next values of the respective factor to know that which predicate
+        function is chosen. The window size can be larger, but it does need updating the code
+        to adapt to the new expectation.
+    '''
+    def sm_backtrack_random(self, th=None, trials=None):
+        permut=[]
+        nums=[]
 
-                ans=get_wt_val(asg_wt_vf[i],params)
-                permut[0][wt_id]=ans
+        for i in range(self.M):
+            line = [-1] * self.comb_len
+            permut.append(line)
 
+        weight=1
+        for i in range(self.M_raw):
+            if not self.unweighted_experiment:
+                weight=self.combs_weights[i]
 
-        '''
-        for i in range(c_objs_count,comb_len):
-            ans=(asg_vf[i-c_objs_count])[  pre[i-c_objs_count]  ][ permut[0][i-c_objs_count]  ]
-            permut[0][i]=ans
-        '''
+            nums.append([0 , self.new_rows(weight)  ])
 
-        comb = comb_index(permut[0])
-        nums[comb][0]=1
 
-        loc=0
         back_steps=0
-        #print("[>] Exec JUMP",permut[0],comb)
+        total_bck=0
 
-        rand_asg=[] #each time create a new assignment
-        for i in range(M):
-            line=[]
+        '''
+            Chossing these threasholds needs more work.
+            SM_CORE_TH changes dynamically.
+            When an experiment starts to get problematic, we generally benefit from
+            reducing SM_CORE_TH to smaller numbers (like 30-40). But for most difficult
+            experiments 100-150 works overall better.
+            Generally, if we choose something tens of units greater or smaller than the
+            ideal threashold for the current experiment, efficiency is notably hurt.
+            That is why the starting threshold "th" is chosen per answer by the engine's
+            ThresholdTuner. The default of 150 gives the original 100/150/150 settings.
 
-            for j in range(c_objs_count):
-                obj=[]
-                for z in range(c_counts[j]):
-                    obj.append(z)
-                shuffle_list(obj)
-                line.append(obj)
+        '''
+        if th is None:
+            th=SM_CORE_TH_DEFAULT
+        SM_CORE_TH_MIN=max(1,th*2//3)
+        SM_CORE_TH_RET=th
+        SM_CORE_TH_MAX=th
+        SM_CORE_TH=SM_CORE_TH_MAX
+        restarts=-1
 
-            rand_asg.append(line)
+        loc=0
+        pre=[]
 
         '''
-            Inner loop: Choose a random valid path to right. In each step
-            a whole combination is formed and stored at the next cell. If the
-            current cell fails, revert to previous cell and choose another available
-            path.
+            Main loops.
+            Outer loop: Start with forming the initial states and take it from there.
+            Each group of factors are handled separately. We enumerate through the primary
+            objects and then fill the dependent cells which are WithinTrials and Transitions.
+            The primary target cells constitute the main elements of the back-tracking logic.
+            Note that the value for a dependent cell is looked up in O(1) using the init maps
+            instead on actually calling the predicate functions.
+            We reference the nums structure to track the objects in combination selection process.
         '''
-        while 1:
-            if loc==L-1:
-                return pre,permut
-            elif loc==-1:
-                clear_nums(nums)
-                break
+        while True:
+            if time() >= self.deadline:
+                _cexit(self.deadline_message)
+            if should_stop():
+                raise _Cancelled()
+            restarts+=1
+
+            for i in range(self.c_objs_count):
+                permut[0][i]=int(self.random()* self.obs_counts[i])
+
+            if self.trans_count>0:
+                pre=[-1]*(self.c_objs_count + self.wt_count)
+                for i in range(self.c_objs_count):
+                    pre[i]=int(self.random()* self.obs_counts[i])
+                for i in range(self.wt_count):
+                    wt=self.within_trials[i]
+                    wt_id=self.wt_cells[i][0]
+                    params=[]
+                    for ind in self.wt_cells[i][1]:
+                        params.append(pre[ind])
+
+                    ans=get_wt_val(self.asg_wt_vf[i],params)
+                    pre[wt_id]=ans
+
+                    params=[]
+                    for ind in self.wt_cells[i][1]:
+                        params.append(permut[0][ind])
+
+                    ans=get_wt_val(self.asg_wt_vf[i],params)
+                    permut[0][wt_id]=ans
+
+                for i in range(self.trans_count):
+                    target_cell=self.trans_cells[i][1]
+                    trans_ind=self.trans_cells[i][0]
+
+                    src=pre[target_cell]
+                    dst=permut[0][target_cell]
+
+                    ans=(self.asg_vf[i])[src][dst]
+                    permut[0][trans_ind]=ans
 
-            right_ind=comb_index(permut[loc])
-            if unweighted_experiment:
-                c_states = nums[right_ind][1][ 0 ]
             else:
-                c_states = nums[right_ind][1][ get_states_ar_ind(nums,right_ind) ]
-
-            c_states[-1] += 1
-            for i in range(c_objs_count-1,0,-1):
-                if c_states[i] > c_counts[i]:
-                    _cexit("invalid c states")
+                for i in range(self.wt_count):
+                    #just permut[0]
 
-                if c_states[i] == c_counts[i]:
-                    c_states[i]=0
-                    c_states[i-1] += 1
+                    wt=self.within_trials[i]
+                    wt_id=self.wt_cells[i][0]
 
-            if c_states[0] == c_counts[0]:
-                nums[right_ind][0] -= 1
-                #permut[loc]=-1
+                    params=[]
+                    for ind in self.wt_cells[i][1]:
+                        params.append(permut[0][ind])
 
-                loc-=1
-                back_steps+=1
-                total_bck+=1
+                    ans=get_wt_val(self.asg_wt_vf[i],params)
+                    permut[0][wt_id]=ans
 
-                if back_steps>SM_CORE_TH:
-                    clear_nums(nums)
-
-                    if SM_CORE_TH > SM_CORE_TH_MIN:
-                        SM_CORE_TH -= 1
-                    else:
-                        SM_CORE_TH=SM_CORE_TH_RET
 
-                    break
+            '''
+            for i in range(c_objs_count,comb_len):
+                ans=(asg_vf[i-c_objs_count])[  pre[i-c_objs_count]  ][ permut[0][i-c_objs_count]  ]
+                permut[0][i]=ans
+            '''
 
+            # The first combination (and the preamble) must also satisfy the
+            # trial constraints; otherwise, just start over.
+            if not self.trial_conforms(pre,permut,permut[0],0,trials):
                 continue
 
-            new_comb=[-1]*comb_len
-
-            if unweighted_experiment:
-                c_objs=nums[right_ind][1][0]
-            else:
-                c_objs=nums[right_ind][1][get_states_ar_ind(nums,right_ind)]
-
-            for i in range(c_objs_count):
-                dst_row= c_objs[i]
-
-                if dst_row >= c_counts[i]:
-                    _cexit("invalid row",dst_row,nums[right_ind][1])
+            comb = self.comb_index(permut[0])
+            if self.excluded[comb]:
+                continue
+            nums[comb][0]=1
+
+            loc=0
+            back_steps=0
+            #print("[>] Exec JUMP",permut[0],comb)
+
+            rand_asg=[] #each time create a new assignment
+            for i in range(self.M_raw):
+                line=[]
+
+                for j in range(self.c_objs_count):
+                    obj=[]
+                    for z in range(self.c_counts[j]):
+                        obj.append(z)
+                    shuffle_list(obj,self.random)
+                    line.append(obj)
+
+                rand_asg.append(line)
+
+            '''
+                Inner loop: Choose a random valid path to right. In each step
+                a whole combination is formed and stored at the next cell. If the
+                current cell fails, revert to previous cell and choose another available
+                path.
+            '''
+            while 1:
+                if loc==self.L-1:
+                    self.last_run={'backtracks':total_bck,'restarts':restarts,'threshold':th}
+                    return pre,permut
+                elif loc==-1:
+                    self.clear_nums(nums)
+                    break
 
-                dst_row = (rand_asg[right_ind][i])[dst_row]
-                new_comb[i]=dst_row
+                right_ind=self.comb_index(permut[loc])
+                if self.unweighted_experiment:
+                    c_states = nums[right_ind][1][ 0 ]
+                else:
+                    c_states = nums[right_ind][1][ get_states_ar_ind(nums,right_ind) ]
 
-            for i in range(wt_count):
-                wt=within_trials[i]
-                wt_id=wt_cells[i][0]
+                c_states[-1] += 1
+                for i in range(self.c_objs_count-1,0,-1):
+                    if c_states[i] > self.c_counts[i]:
+                        _cexit("invalid c states")
 
-                params=[]
-                for ind in wt_cells[i][1]:
-                    params.append(new_comb[ind])
+                    if c_states[i] == self.c_counts[i]:
+                        c_states[i]=0
+                        c_states[i-1] += 1
 
-                ans=get_wt_val(asg_wt_vf[i],params)
-                new_comb[wt_id]=ans
+                if c_states[0] == self.c_counts[0]:
+                    nums[right_ind][0] -= 1
+                    #permut[loc]=-1
 
-            for i in range(trans_count):
-                target_cell=trans_cells[i][1]
-                trans_ind=trans_cells[i][0]
+                    loc-=1
+                    back_steps+=1
+                    total_bck+=1
 
-                source_row=permut[loc][target_cell]
-                dst_row=new_comb[target_cell]
+                    if back_steps>SM_CORE_TH:
+                        self.clear_nums(nums)
 
-                ans=(asg_vf[i])[source_row][dst_row]
+                        if SM_CORE_TH > SM_CORE_TH_MIN:
+                            SM_CORE_TH -= 1
+                        else:
+                            SM_CORE_TH=SM_CORE_TH_RET
 
-                new_comb[trans_ind] = ans
+                        break
 
-            comb=comb_index(new_comb)
-            cap=get_cap(new_comb)
+                    continue
 
-            if nums[comb][0]<cap:
-                nums[comb][0] += 1
+                new_comb=[-1]*self.comb_len
 
-                if unweighted_experiment:
-                    clear_single_row(nums[comb][1][0])
+                if self.unweighted_experiment:
+                    c_objs=nums[right_ind][1][0]
                 else:
-                    clear_single_row(nums[comb][1][ get_states_ar_ind(nums,comb) ])
+                    c_objs=nums[right_ind][1][get_states_ar_ind(nums,right_ind)]
 
-                loc+=1
-                permut[loc]=new_comb
+                for i in range(self.c_objs_count):
+                    dst_row= c_objs[i]
 
-            else:
-                #we increment nums at the beginning of the loop
-                pass
+                    if dst_row >= self.c_counts[i]:
+                        _cexit("invalid row",dst_row,nums[right_ind][1])
 
-'''
-    Local function to print the result. Not used when the module
-    is called by sweetpea core.
-'''
-def print_permut(pre,perm):
-    m=[]
+                    dst_row = (rand_asg[right_ind][i])[dst_row]
+                    new_comb[i]=dst_row
 
-    for i in range(comb_len):
-        line=[]
-        for j in range(len(objects[i])):
-            line.append(objects[i][j])
-        m.append(line)
+                for i in range(self.wt_count):
+                    wt=self.within_trials[i]
+                    wt_id=self.wt_cells[i][0]
 
-    s=""
-    comb=""
+                    params=[]
+                    for ind in self.wt_cells[i][1]:
+                        params.append(new_comb[ind])
 
-    if trans_count>0:
-        for i in range(c_objs_count+wt_count):
-            comb+= "{} | ".format(m[i][pre[i]])
-        s+=comb+"\n"
+                    ans=get_wt_val(self.asg_wt_vf[i],params)
+                    new_comb[wt_id]=ans
 
-    for i in range(M):
-        comb=""
-        for j in range(c_objs_count):
-            label=m[j][perm[i][j]]
-            comb+= "{} | ".format(label)
-        comb+=" - "
+                for i in range(self.trans_count):
+                    target_cell=self.trans_cells[i][1]
+                    trans_ind=self.trans_cells[i][0]
 
-        for j in range(c_objs_count,comb_len):
-            comb+= "{} | ".format(m[j][perm[i][j]])
-        s+=comb+"\n"
+                    source_row=permut[loc][target_cell]
+                    dst_row=new_comb[target_cell]
 
-    print(s)
+                    ans=(self.asg_vf[i])[source_row][dst_row]
 
-'''
-    An extra layer of validity check after each answer is formed.
-    Not used when called by sweetpea core.
-    This function checks validity of the cross, predicate values and weights.
-'''
-def check_result(pre,permut):
-    if trans_count>0:
-        for i in range(trans_count):
-            trans_id=trans_cells[i][0]
-            c=trans_cells[i][1]
+                    new_comb[trans_ind] = ans
 
-            src=pre[c]
-            dst=permut[0][c]
+                comb=self.comb_index(new_comb)
+                cap=self.get_cap(new_comb)
 
-            ans=(asg_vf[i])[src][dst]
+                if nums[comb][0]<cap and not self.excluded[comb] and self.trial_conforms(pre,permut,new_comb,loc+1,trials):
+                    nums[comb][0] += 1
 
-            if ans != permut[0][trans_id]:
-                return False
+                    if self.unweighted_experiment:
+                        self.clear_single_row(nums[comb][1][0])
+                    else:
+                        self.clear_single_row(nums[comb][1][ get_states_ar_ind(nums,comb) ])
 
-        for i in range(wt_count):
-            wt_id=wt_cells[i][0]
+                    loc+=1
+                    permut[loc]=new_comb
 
-            params=[]
-            for ind in wt_cells[i][1]:
-                params.append(permut[0][ind])
-            ans=get_wt_val(asg_wt_vf[i],params)
+                else:
+                    #we increment nums at the beginning of the loop
+                    pass
 
-            if ans != permut[0][wt_id]:
-                return False
+    '''
+        Level index of a cell at trial t of the answer, or -1 when the trial
+        has no level for it (a transition at the first trial).
+    '''
+    def trial_value(self, pre, permut, t, cell):
+        if cell>=self.trans_cell_start and t==0:
+            return -1
+        if self.trans_in_crossing:
+            if t==0:
+                return pre[cell]
+            return permut[t-1][cell]
+        return permut[t][cell]
 
-    combs={}
-    weighted_inds={}
+    '''
+        Check the trial constraints for the trials that placing "comb" at
+        permutation row "row" completes, given the rows before it. Trials from
+        "trials" on are cut off from the answer and are not checked.
+    '''
+    def trial_conforms(self, pre, permut, comb, row, trials):
+        if not self.trial_constraints:
+            return True
+
+        permut[row]=comb
+        first=row
+        if self.trans_in_crossing:
+            first=row+1
+            if row==0:
+                first=0
+        for t in range(first,row+1+(1 if self.trans_in_crossing else 0)):
+            if trials and t>=trials:
+                break
+            for con in self.trial_constraints:
+                if not con.check(self,pre,permut,t):
+                    return False
+        return True
 
-    for i in range(M):
-        comb=permut[i]
+    '''
+        The number of trials in an answer before any truncation, including
+        the preamble trial when a transition is crossed.
+    '''
+    def trial_count(self):
+        return self.M+(1 if self.trans_in_crossing else 0)
 
-        index=comb_index(comb)
-        if index not in combs:
-            combs[index]=1
-        else:
-            combs[index]+=1
+    def add_trial_constraint(self, con):
+        self.trial_constraints.append(con)
 
-        weighted_inds[index]= get_cap(comb)
+    '''
+        Remove a combination from the cross, given as the names of its levels
+        in the order of the cross. The combination is never placed, and the
+        answer is shorter by the number of copies that it would have had.
+    '''
+    def exclude_combination(self, names):
+        self.excluded_names.add(tuple(names))
 
-        for j in range(wt_count):
-            wt_id=wt_cells[j][0]
+    def level_names(self, cell):
+        if cell<self.c_objs_count:
+            return self.primary_objects[cell].levels
+        if cell<self.trans_cell_start:
+            return [l[0] for l in self.within_trials[cell-self.c_objs_count][1]]
+        return [l[0] for l in self.transitions[cell-self.trans_cell_start][1]]
 
-            params=[]
-            for ind in wt_cells[j][1]:
-                params.append(comb[ind])
-            ans=get_wt_val(asg_wt_vf[j],params)
+    '''
+        Local function to print the result. Not used when the module
+        is called by sweetpea core.
+    '''
+    def print_permut(self, pre,perm):
+        m=[]
 
-            if ans != comb[wt_id]:
-                return False
+        for i in range(self.comb_len):
+            line=[]
+            for j in range(len(self.objects[i])):
+                line.append(self.objects[i][j])
+            m.append(line)
 
+        s=""
+        comb=""
 
+        if self.trans_count>0:
+            for i in range(self.c_objs_count+self.wt_count):
+                comb+= "{} | ".format(m[i][pre[i]])
+            s+=comb+"\n"
 
-        if i==M-1:
-            break
+        for i in range(self.M):
+            comb=""
+            for j in range(self.c_objs_count):
+                label=m[j][perm[i][j]]
+                comb+= "{} | ".format(label)
+            comb+=" - "
 
-        next_comb=permut[i+1]
-        for j in range(trans_count):
-            trans_id=trans_cells[j][0]
-            target_c=trans_cells[j][1]
+            for j in range(self.c_objs_count,self.comb_len):
+                comb+= "{} | ".format(m[j][perm[i][j]])
+            s+=comb+"\n"
 
-            src=comb[target_c]
-            dst=next_comb[target_c]
+        print(s)
 
-            ans=(asg_vf[j])[src][dst]
+    '''
+        An extra layer of validity check after each answer is formed.
+        Not used when called by sweetpea core.
+        This function checks validity of the cross, predicate values and weights.
+    '''
+    def check_result(self, pre,permut):
+        if self.trans_count>0:
+            for i in range(self.trans_count):
+                trans_id=self.trans_cells[i][0]
+                c=self.trans_cells[i][1]
 
-            if ans != next_comb[trans_id]:
-                return False
+                src=pre[c]
+                dst=permut[0][c]
 
+                ans=(self.asg_vf[i])[src][dst]
 
-    if len(combs) != M_raw:
-        return False
+                if ans != permut[0][trans_id]:
+                    return False
 
-    for ind in combs:
-        if weighted_inds[ind] != combs[ind]:
-            return False
+            for i in range(self.wt_count):
+                wt_id=self.wt_cells[i][0]
 
-    return True
+                params=[]
+                for ind in self.wt_cells[i][1]:
+                    params.append(permut[0][ind])
+                ans=get_wt_val(self.asg_wt_vf[i],params)
 
+                if ans != permut[0][wt_id]:
+                    return False
 
-'''
-    Each permutation is created in the following order:
-        primary objects
-        within trials
-        transitions
+        combs={}
+        weighted_inds={}
 
-    If a within trial is dependent on a previous within trial,
-    it must come after that    in the within_trials array.
-    The user is expected not to pass a dependent factor before
-    its arguments.
+        for i in range(self.M):
+            comb=permut[i]
 
-'''
+            index=self.comb_index(comb)
+            if index not in combs:
+                combs[index]=1
+            else:
+                combs[index]+=1
 
-# we expect an arg of a transition to be a non-transition
-def transition_dependency_check():
-    for t in transitions:
-        if t[2]>= trans_cell_start:
-            _cexit("Invalid transition:",t[0])
+            weighted_inds[index]= self.get_cap(comb)
 
+            for j in range(self.wt_count):
+                wt_id=self.wt_cells[j][0]
 
-# No forward referencing
-def wt_dependency_check():
-    for i in range(len(within_trials)):
-        w=within_trials[i]
-        w_ind_perm = c_objs_count + i
-        for arg in w[2]:
-            if arg >=w_ind_perm:
-                _cexit("Invalid derived constraint:",w[0])
+                params=[]
+                for ind in self.wt_cells[j][1]:
+                    params.append(comb[ind])
+                ans=get_wt_val(self.asg_wt_vf[j],params)
 
-def get_wt_val(ar,perm):
-    cur=ar
-    for i in range(0,len(perm)-1):
-        cur=cur[perm[i]]
-    return cur[perm[-1]]
+                if ans != comb[wt_id]:
+                    return False
 
 
-def sigalrm_hand(sig,frame):
-    _cexit("Experiment not solvable. Change your crossing or constraints.")
 
+            if i==self.M-1:
+                break
 
-'''
-    Itermediate classes for the objects that we need to parse in this module.
-    These itermediary objects store only what we need to create our own encoding not
-    the entire information in the original objects.
-    SMGen does not recognize sweetpea classes. Any new class, object or structure
-    from sweetpea core that is going to be used in SMGen must be first defined for
-    the module.
+            next_comb=permut[i+1]
+            for j in range(self.trans_count):
+                trans_id=self.trans_cells[j][0]
+                target_c=self.trans_cells[j][1]
 
-'''
-class _Factor:
-    def __init__(self,name,initial_levels):
-        self.name=name
-        self.levels=initial_levels # initial_levels to match sweetpea naming convention
-        '''
-            cell_index is used to replace object arguments with the
-            corresponding indices. Since transitions cannot be arguments to
-            any factors, this member is not used for them but we set it anyways.
-        '''
+                src=comb[target_c]
+                dst=next_comb[target_c]
 
+                ans=(self.asg_vf[j])[src][dst]
 
-        self.cell_index=-1
+                if ans != next_comb[trans_id]:
+                    return False
 
-        primary_types=[str,int,float]
-        if type(self.levels[0]) in primary_types:
-            self.type=0
-        elif type(self.levels[0])==_DerivedLevel:
-            self.type=self.levels[0].type
-            self.args=self.levels[0].dr_level.args
-            self.weighted=False
 
-            for l in self.levels:
-                if l.weight>1:
-                    self.weighted=True
-                    break
-        else:
-            _cexit("Unsupported factor:",name)
+        if len(combs) != self.M_raw-sum(self.excluded):
+            return False
 
-class _DerivedLevel:
-    def __init__(self,name,l,weight=1):
-        self.name=name
-        self.dr_level=l
-        self.weight=weight
+        for ind in combs:
+            if weighted_inds[ind] != combs[ind]:
+                return False
 
-        if type(l)==_WithinTrial:
-            self.type=1
-        elif type(l)==_Transition:
-            self.type=2
-        else:
-            _cexit("Unsupported DerivedLevel")
+        return True
 
 
+    '''
+        Each permutation is created in the following order:
+            primary objects
+            within trials
+            transitions
 
-class _WithinTrial:
-    def __init__(self,func,args):
-        self.func=func
-        self.args=args
+        If a within trial is dependent on a previous within trial,
+        it must come after that    in the within_trials array.
+        The user is expected not to pass a dependent factor before
+        its arguments.
 
-class _Transition:
-    def __init__(self,func,args):
-        self.func=func
-        self.args=args
-        #if len(args)!=1:
-        #    print("[!] Unsupported transition")
+    '''
 
-class PrimaryObject:
-    def __init__(self, name, levels, factor):
-        self.name = name
-        self.levels = levels
-        self.factor = factor
+    # we expect an arg of a transition to be a non-transition
+    def transition_dependency_check(self):
+        for t in self.transitions:
+            if t[2]>= self.trans_cell_start:
+                _cexit("Invalid transition:",t[0])
+
+
+    # No forward referencing
+    def wt_dependency_check(self):
+        for i in range(len(self.within_trials)):
+            w=self.within_trials[i]
+            w_ind_perm = self.c_objs_count + i
+            for arg in w[2]:
+                if arg >=w_ind_perm:
+                    _cexit("Invalid derived constraint:",w[0])
         
-'''
-     We add the factor just as a reference. For example, to set a factor cell index.
-     All object gourps will have the original Factor appended to the list.
-
-     Primary object structure:
-     [group name , levels , Factor obj reference]
-'''
-def add_primary(factor):
-    levels=factor.levels
-    primary_objects.append(PrimaryObject(factor.name, factor.levels, factor))
-
-def add_wt(factor):
-    levels=factor.levels
-    args=factor.args
-    levels_internal=[]
-    w_ind=[]
-    w_w=[]
-
-
-    for l in levels:
-        line= [l.name , l.dr_level.func, l.weight]
-        levels_internal.append(line)
-        if len(l.dr_level.args)!=len(args):
-            _cexit("invald wt args")
-
-        for i in range(len(args)):
-            if args[i]!=l.dr_level.args[i]:
-                _cexit("invalid wt args")
-
-    within_trials.append([factor.name,levels_internal,args, factor])
-
-def add_transition(factor):
-    levels=factor.levels
-
-    if len(factor.args)>1:
-        _cexit("Unsupported Factor. Transition with multiple arguments:",factor.name)
-
-    arg=factor.args[0] #single arg
-    levels_internal=[]
-
-    for l in levels:
-        line= [l.name , l.dr_level.func, l.weight]
-        levels_internal.append(line)
-        if  l.dr_level.args[0] != arg :
-            _cexit("invald tr arg")
-
-    transitions.append([factor.name,levels_internal,arg, factor])
-
-
-def define_cross(cross_f):
-    global cross
-
-    cross_inds=[]
-    for f in cross_f:
-        cross_inds.append(f.cell_index)
-
-    cross=cross_inds
-
-    return cross_inds
-
-
-def print_factors():
-    print("\n**************************************")
-    print("Primary:")
-    for o in primary_objects:
-        print(o.name,o.levels,o.factor.cell_index,"Reference:",o[2])
-    print("\n")
-
-    print("WhithinTrials:")
-    for o in within_trials:
-        print(o[0],o[3].cell_index)
-        for l in o[1]:
-            print("\t{} {} {}".format(l[0],l[1],l[2]))
-        print("\tArgs: {} ".format(o[2]))
-
-    print("\n")
-
-    print("Transitions:")
-    for o in transitions:
-        print(o[0],o[3].cell_index)
-        for l in o[1]:
-            print("\t{} {} {}".format(l[0],l[1],l[2]))
-        print("\tArg: {}".format(o[2]))
-    print("**************************************\n\n")
-
-def encode_weights():
-    for wt in within_trials:
-        obj=wt[3]
-        levels=wt[1]
-        if obj.weighted:
-            inds=[obj.cell_index]
-            w=[]
-
-            for i in range(len(levels)):
-                l=levels[i]
-                l_weight=l[2]
-                if l_weight>1:
-                    inds.append(i)
-                    w.append(l[2])
-
-            weighted_objects_init.append(inds)
-            weights_init.append(w)
-
-    for tr in transitions:
-        obj=tr[3]
-        levels=tr[1]
-        if obj.weighted:
-            inds=[obj.cell_index]
-            w=[]
-            for i in range(len(levels)):
-                l=levels[i]
-                if l[2]>1:
-                    inds.append(i)
-                    w.append(l[2])
-
-            weighted_objects_init.append(inds)
-            weights_init.append(w)
-
-def encode_experiment(args):
-    ind=0
-    for factor in args:
-        t=factor.type
-        if t==0:
-            add_primary(factor)
-        elif t==1:
-            add_wt(factor)
-        elif t==2:
-            add_transition(factor)
-
-    ind=0
-    for o in primary_objects:
-        o.factor.cell_index=ind
-        ind+=1
-    for o in within_trials:
-        o[3].cell_index=ind
-        ind+=1
-    for o in transitions:
-        o[3].cell_index=ind
-        ind+=1
-
-
-    for o in within_trials:
-        for i in range(len(o[2])):
-            o[2][i] = o[2][i].cell_index
-
-    for o in transitions:
-        o[2] = o[2].cell_index
-
-    encode_weights()
-
-if __name__=="__main__":
-    pass
-
-
-def execute(answers_count=1, maximum_trials=False):
-    global cross,wt_count,trans_count,c_objs_count,trans_cell_start,unweighted_experiment,asg_vf
-    global asg_wt_vf,combs_weights,M,M_raw,L,comb_len,trans_in_crossing
-
-    if len(cross)<1:
-        _cexit("Invalid input.")
-
-    '''
-        Get cross members weights.
-        weighted_objects and weights must match cross. No extra members in them.
     '''
-    if len(weighted_objects_init)>0:
-        for i in range(len(weighted_objects_init)):
-            obj=weighted_objects_init[i]
-            if obj[0] in cross: #linear search. init operation
-                weighted_objects.append(obj)
-                weights.append(weights_init[i])
-
-    tmp_dc={}
-    for e in cross:
-        tmp_dc[e]=1
-
-    if len(tmp_dc) != len(cross):
-        _cexit("Invalid cross. Check your input.")
+         We add the factor just as a reference. For example, to set a factor cell index.
+         All object gourps will have the original Factor appended to the list.
 
+         Primary object structure:
+         [group name , levels , Factor obj reference]
+    '''
+    def add_primary(self, factor):
+        levels=factor.levels
+        self.primary_objects.append(PrimaryObject(factor.name, factor.levels, factor))
+
+    def add_wt(self, factor):
+        levels=factor.levels
+        args=factor.args
+        levels_internal=[]
+        w_ind=[]
+        w_w=[]
+
+
+        for l in levels:
+            line= [l.name , l.dr_level.func, l.weight]
+            levels_internal.append(line)
+            if len(l.dr_level.args)!=len(args):
+                _cexit("invald wt args")
+
+            for i in range(len(args)):
+                if args[i]!=l.dr_level.args[i]:
+                    _cexit("invalid wt args")
+
+        self.within_trials.append([factor.name,levels_internal,args, factor])
+
+    def add_transition(self, factor):
+        levels=factor.levels
+
+        if len(factor.args)>1:
+            _cexit("Unsupported Factor. Transition with multiple arguments:",factor.name)
+
+        arg=factor.args[0] #single arg
+        levels_internal=[]
+
+        for l in levels:
+            line= [l.name , l.dr_level.func, l.weight]
+            levels_internal.append(line)
+            if  l.dr_level.args[0] != arg :
+                _cexit("invald tr arg")
+
+        self.transitions.append([factor.name,levels_internal,arg, factor])
+
+
+    def define_cross(self, cross_f):
+
+        cross_inds=[]
+        for f in cross_f:
+            cross_inds.append(f.cell_index)
+
+        self.cross=cross_inds
+
+        return cross_inds
+
+
+    def print_factors(self):
+        print("\n**************************************")
+        print("Primary:")
+        for o in self.primary_objects:
+            print(o.name,o.levels,o.factor.cell_index,"Reference:",o[2])
+        print("\n")
+
+        print("WhithinTrials:")
+        for o in self.within_trials:
+            print(o[0],o[3].cell_index)
+            for l in o[1]:
+                print("\t{} {} {}".format(l[0],l[1],l[2]))
+            print("\tArgs: {} ".format(o[2]))
+
+        print("\n")
+
+        print("Transitions:")
+        for o in self.transitions:
+            print(o[0],o[3].cell_index)
+            for l in o[1]:
+                print("\t{} {} {}".format(l[0],l[1],l[2]))
+            print("\tArg: {}".format(o[2]))
+        print("**************************************\n\n")
+
+    def encode_weights(self):
+        for wt in self.within_trials:
+            obj=wt[3]
+            levels=wt[1]
+            if obj.weighted:
+                inds=[obj.cell_index]
+                w=[]
+
+                for i in range(len(levels)):
+                    l=levels[i]
+                    l_weight=l[2]
+                    if l_weight>1:
+                        inds.append(i)
+                        w.append(l[2])
+
+                self.weighted_objects_init.append(inds)
+                self.weights_init.append(w)
+
+        for tr in self.transitions:
+            obj=tr[3]
+            levels=tr[1]
+            if obj.weighted:
+                inds=[obj.cell_index]
+                w=[]
+                for i in range(len(levels)):
+                    l=levels[i]
+                    if l[2]>1:
+                        inds.append(i)
+                        w.append(l[2])
+
+                self.weighted_objects_init.append(inds)
+                self.weights_init.append(w)
+
+    def encode_experiment(self, args):
+        ind=0
+        for factor in args:
+            t=factor.type
+            if t==0:
+                self.add_primary(factor)
+            elif t==1:
+                self.add_wt(factor)
+            elif t==2:
+                self.add_transition(factor)
+
+        ind=0
+        for o in self.primary_objects:
+            o.factor.cell_index=ind
+            ind+=1
+        for o in self.within_trials:
+            o[3].cell_index=ind
+            ind+=1
+        for o in self.transitions:
+            o[3].cell_index=ind
+            ind+=1
+
+
+        for o in self.within_trials:
+            for i in range(len(o[2])):
+                o[2][i] = o[2][i].cell_index
+
+        for o in self.transitions:
+            o[2] = o[2].cell_index
+
+        self.encode_weights()
 
-    wt_count = len(within_trials)
 
     '''
-        Init all structures and build transition maps:
+        Build the lookup tables for the encoded experiment. This only needs to
+        happen once per engine.
     '''
+    def prepare(self):
+        if self.prepared:
+            return
+        self.prepared=True
 
-    trans_count=len(transitions)
 
-    for o in primary_objects:
-        c_counts.append(len(o.levels))
-    c_objs_count = len(c_counts)    # number of main object groups
+        if len(self.cross)<1:
+            _cexit("Invalid input.")
 
-    trans_cell_start=c_objs_count+wt_count
+        '''
+            Get cross members weights.
+            weighted_objects and weights must match cross. No extra members in them.
+        '''
+        if len(self.weighted_objects_init)>0:
+            for i in range(len(self.weighted_objects_init)):
+                obj=self.weighted_objects_init[i]
+                if obj[0] in self.cross: #linear search. init operation
+                    self.weighted_objects.append(obj)
+                    self.weights.append(self.weights_init[i])
 
-    trans_in_crossing=False
-    for e in cross:
-        if e >= trans_cell_start:
-            trans_in_crossing=True
+        tmp_dc={}
+        for e in self.cross:
+            tmp_dc[e]=1
 
-    transition_dependency_check()
-    wt_dependency_check()
+        if len(tmp_dc) != len(self.cross):
+            _cexit("Invalid cross. Check your input.")
 
-    for i in range(c_objs_count):
-        line=[]
-        for j in range(len(primary_objects[i].levels)):
-            obj=str(primary_objects[i].name) + " " + str(primary_objects[i].levels[j])
-            line.append(obj)
-        objects.append(line)
 
-    for i in range(wt_count):
-        line=[]
-        for j in range(len(within_trials[i][1])):
-            obj=within_trials[i][0] + " " + within_trials[i][1][j][0]
-            line.append(obj)
-        objects.append(line)
+        self.wt_count = len(self.within_trials)
 
-    for i in range(trans_count):
-        line=[]
-        for j in range(len(transitions[i][1])):
-            obj=transitions[i][0] + " " + transitions[i][1][j][0]
-            line.append(obj)
-        objects.append(line)
+        '''
+            Init all structures and build transition maps:
+        '''
 
+        self.trans_count=len(self.transitions)
 
-    for o in objects:
-        obs_counts.append(len(o))
+        for o in self.primary_objects:
+            self.c_counts.append(len(o.levels))
+        self.c_objs_count = len(self.c_counts)    # number of main object groups
 
-    comb_len = len(obs_counts)
+        self.trans_cell_start=self.c_objs_count+self.wt_count
 
-    if len(weighted_objects)==0 :
-        unweighted_experiment = True
-    else:
-        unweighted_experiment= False
+        self.trans_in_crossing=False
+        for e in self.cross:
+            if e >= self.trans_cell_start:
+                self.trans_in_crossing=True
 
-    if not unweighted_experiment:
-        if len(weighted_objects) != len(weights):
-            _cexit("Invalid user input")
+        self.transition_dependency_check()
+        self.wt_dependency_check()
 
-        w_dc={}
-        for i in range(len(weighted_objects)):
-            ind=weighted_objects[i][0]
-            w_dc[ind]=[weighted_objects[i][1:], weights[i]]
+        for i in range(self.c_objs_count):
+            line=[]
+            for j in range(len(self.primary_objects[i].levels)):
+                obj=str(self.primary_objects[i].name) + " " + str(self.primary_objects[i].levels[j])
+                line.append(obj)
+            self.objects.append(line)
 
-        for i in range(len(objects)):
-            line=[1]*len(objects[i])
-            if i not in w_dc:
-                all_weights.append(line)
-            else:
-                for j in range(len(w_dc[i][0])):
-                    ind=(w_dc[i][0])[j]
-                    line[ind]=(w_dc[i][1])[j]
-                all_weights.append(line)
+        for i in range(self.wt_count):
+            line=[]
+            for j in range(len(self.within_trials[i][1])):
+                obj=self.within_trials[i][0] + " " + self.within_trials[i][1][j][0]
+                line.append(obj)
+            self.objects.append(line)
 
-        for i in range(len(cross)):
-            cross_weights.append(all_weights[cross[i]])
+        for i in range(self.trans_count):
+            line=[]
+            for j in range(len(self.transitions[i][1])):
+                obj=self.transitions[i][0] + " " + self.transitions[i][1][j][0]
+                line.append(obj)
+            self.objects.append(line)
 
-    for ind in cross:
-        cross_counts.append(len(objects[ind]))
 
-    M = perms_count(0)
-    M_raw = perms_count(1)
-    L=M
+        for o in self.objects:
+            self.obs_counts.append(len(o))
 
-    asg_tmp=[]
-    for i in range(trans_count):
-        target_c = transitions[i][2]
-        trans_cells.append([trans_cell_start+i,target_c])
+        self.comb_len = len(self.obs_counts)
 
-        if target_c < c_objs_count:
-            c_levels=primary_objects[target_c].levels
-            c_count=c_counts[target_c]
+        if len(self.weighted_objects)==0 :
+            self.unweighted_experiment = True
         else:
-            c_levels=[]
-            for z in range(len(within_trials[target_c-c_objs_count][1])):
-                c_levels.append(within_trials[target_c-c_objs_count][1][z][0]) # use string name as the level value
-            c_count=len(c_levels)
-
-        funcs = []
-        for lev in transitions[i][1]:
-            funcs.append(lev[1])
-
-        asg_vf_i=[]
-
-        for j in range(c_count):
-            f_line=[]
-            for z in range(c_count):
-                f_line.append(-1)
-            asg_vf_i.append(f_line)
-
-        for j in range(c_count):
-            for z in range(c_count):
-                src=c_levels[j]
-                dst=c_levels[z]
-
-                answers=[]
-                for f_ind in range(len(funcs)):
-                    arg=[-1,-1]
-                    arg[0]=dst
-                    arg[-1]=src
-
-                    ans=funcs[f_ind](arg)
-                    if ans==True:
-                        answers.append(f_ind)
-                if len(answers)!=1:
-                    _cexit("Invalid predicate functions for transition:",transitions[i][0])
-
-                asg_vf_i[j][z]=answers[0]
-
-        asg_tmp.append(asg_vf_i)
-
-    asg_vf = asg_tmp
+            self.unweighted_experiment= False
 
-    def get_wt_ans(perm,funcs):
-        answers=[]
-        for i in range(len(funcs)):
-            f=funcs[i]
-            ans=f(*perm)
-            if ans==True:
-                answers.append(i)
-        if len(answers)!=1:
-            _cexit("Invalid WithinTrial transition.")
-        return answers[0]
+        if not self.unweighted_experiment:
+            if len(self.weighted_objects) != len(self.weights):
+                _cexit("Invalid user input")
 
-    def put_wt_val(ar,perm,ans):
-        cur=ar
+            w_dc={}
+            for i in range(len(self.weighted_objects)):
+                ind=self.weighted_objects[i][0]
+                w_dc[ind]=[self.weighted_objects[i][1:], self.weights[i]]
 
-        for i in range(0,len(perm)-1):
-            cur=cur[perm[i]]
-
-        cur.append(ans)
-
-    def wt_append_new(ar,perm,until):
-        cur=ar
-        for i in range(0,until):
+            for i in range(len(self.objects)):
+                line=[1]*len(self.objects[i])
+                if i not in w_dc:
+                    self.all_weights.append(line)
+                else:
+                    for j in range(len(w_dc[i][0])):
+                        ind=(w_dc[i][0])[j]
+                        line[ind]=(w_dc[i][1])[j]
+                    self.all_weights.append(line)
+
+            for i in range(len(self.cross)):
+                self.cross_weights.append(self.all_weights[self.cross[i]])
+
+        for ind in self.cross:
+            self.cross_counts.append(len(self.objects[ind]))
+
+        self.M = self.perms_count(0)
+        self.M_raw = self.perms_count(1)
+
+        # Mask the excluded combinations by their index, which enumerates the
+        # cross with its last cell varying fastest. A level name can appear at
+        # several indices of a cell, as weighted levels are duplicated.
+        self.excluded=[False]*self.M_raw
+        if self.excluded_names:
+            cross_names=[self.level_names(cell) for cell in self.cross]
+            for ind,levels in enumerate(product(*[range(n) for n in self.cross_counts])):
+                if tuple(cross_names[i][j] for i,j in enumerate(levels)) in self.excluded_names:
+                    self.excluded[ind]=True
+                    cap=1
+                    if not self.unweighted_experiment:
+                        for i,j in enumerate(levels):
+                            cap*=self.cross_weights[i][j]
+                    self.M-=cap
+        self.L=self.M
+
+        asg_tmp=[]
+        for i in range(self.trans_count):
+            target_c = self.transitions[i][2]
+            self.trans_cells.append([self.trans_cell_start+i,target_c])
+
+            if target_c < self.c_objs_count:
+                c_levels=self.primary_objects[target_c].levels
+                c_count=self.c_counts[target_c]
+            else:
+                c_levels=[]
+                for z in range(len(self.within_trials[target_c-self.c_objs_count][1])):
+                    c_levels.append(self.within_trials[target_c-self.c_objs_count][1][z][0]) # use string name as the level value
+                c_count=len(c_levels)
+
+            funcs = []
+            for lev in self.transitions[i][1]:
+                funcs.append(lev[1])
+
+            asg_vf_i=[]
+
+            for j in range(c_count):
+                f_line=[]
+                for z in range(c_count):
+                    f_line.append(-1)
+                asg_vf_i.append(f_line)
+
+            for j in range(c_count):
+                for z in range(c_count):
+                    src=c_levels[j]
+                    dst=c_levels[z]
+
+                    answers=[]
+                    for f_ind in range(len(funcs)):
+                        arg=[-1,-1]
+                        arg[0]=dst
+                        arg[-1]=src
+
+                        ans=funcs[f_ind](arg)
+                        if ans==True:
+                            answers.append(f_ind)
+                    if len(answers)!=1:
+                        _cexit("Invalid predicate functions for transition:",self.transitions[i][0])
+
+                    asg_vf_i[j][z]=answers[0]
+
+            asg_tmp.append(asg_vf_i)
+
+        self.asg_vf = asg_tmp
+
+        def get_wt_ans(perm,funcs):
+            answers=[]
+            for i in range(len(funcs)):
+                f=funcs[i]
+                ans=f(*perm)
+                if ans==True:
+                    answers.append(i)
+            if len(answers)!=1:
+                _cexit("Invalid WithinTrial transition.")
+            return answers[0]
+
+        def put_wt_val(ar,perm,ans):
+            cur=ar
+
+            for i in range(0,len(perm)-1):
+                cur=cur[perm[i]]
+
+            cur.append(ans)
+
+        def wt_append_new(ar,perm,until):
+            cur=ar
+            for i in range(0,until):
+
+                cur=cur[perm[i]]
+
+            empty=[]
+            level=empty
+            for i in range(until+1,len(perm)-1):
+                level.append([])
+                level=level[0]
+
+            cur.append(empty)
+
+        def perm_to_levels(levels,perm):
+            r=[]
+            for i in range(len(perm)):
+                ind=perm[i]
+                r.append(levels[i][ind])
+
+            return r
+
+        asg_tmp=[]
+        for i in range(self.wt_count):
+            target_cells = self.within_trials[i][2]
+            self.wt_cells.append([self.c_objs_count+i,target_cells])
+
+            funcs = []
+            for lev in self.within_trials[i][1]:
+                funcs.append(lev[1])
+
+
+            perm=[0]*len(target_cells)
+            counts=[-1]*len(target_cells)
+            levels=[]
+
+            for j in range(len(target_cells)):
+                cell=target_cells[j]
+                if cell < self.c_objs_count:
+                    #primary object
+                    counts[j]=len(self.primary_objects[cell].levels)
+                    levels.append(self.primary_objects[cell].levels)
+                else:
+                    #within trial (unlikely to happen)
+                    counts[j]=len(self.within_trials[cell-self.c_objs_count][1])
+                    l=[]
+                    for z in range(len(self.within_trials[cell-self.c_objs_count][1])):
+                        l.append(self.within_trials[cell-self.c_objs_count][1][z][0])
 
-            cur=cur[perm[i]]
+                    levels.append(l)
 
-        empty=[]
-        level=empty
-        for i in range(until+1,len(perm)-1):
-            level.append([])
-            level=level[0]
 
-        cur.append(empty)
+            asg_vf_i=[]
+            cur=asg_vf_i
+            for j in range(len(target_cells)-1):
+                cur.append([])
+                cur=cur[0]
 
-    def perm_to_levels(levels,perm):
-        r=[]
-        for i in range(len(perm)):
-            ind=perm[i]
-            r.append(levels[i][ind])
 
-        return r
+            last=len(target_cells)-1
+            loc=0
 
-    asg_tmp=[]
-    for i in range(wt_count):
-        target_cells = within_trials[i][2]
-        wt_cells.append([c_objs_count+i,target_cells])
+            while 1:
 
-        funcs = []
-        for lev in within_trials[i][1]:
-            funcs.append(lev[1])
+                vals=perm_to_levels(levels,perm)
+                ans=get_wt_ans(vals,funcs)
+                put_wt_val(asg_vf_i,perm,ans)
 
+                if perm[last] == counts[last]-1:
+                    if last==0:
+                        break
 
-        perm=[0]*len(target_cells)
-        counts=[-1]*len(target_cells)
-        levels=[]
+                    perm[last]=0
+                    finished=0
+                    for j in range(last-1,-1,-1):
+                        if perm[j]==counts[j]-1:
+                            if j==0:
+                                finished=1
+                                break
+                            else:
 
-        for j in range(len(target_cells)):
-            cell=target_cells[j]
-            if cell < c_objs_count:
-                #primary object
-                counts[j]=len(primary_objects[cell].levels)
-                levels.append(primary_objects[cell].levels)
-            else:
-                #within trial (unlikely to happen)
-                counts[j]=len(within_trials[cell-c_objs_count][1])
-                l=[]
-                for z in range(len(within_trials[cell-c_objs_count][1])):
-                    l.append(within_trials[cell-c_objs_count][1][z][0])
+                                perm[j]=0
+                                continue
 
-                levels.append(l)
+                        wt_append_new(asg_vf_i,perm,j)
+                        perm[j] += 1
+                        break
+                    if finished:
+                        break
+                else:
+                    perm[last]+=1
+            asg_tmp.append(asg_vf_i)
 
+        self.asg_wt_vf=asg_tmp
 
-        asg_vf_i=[]
-        cur=asg_vf_i
-        for j in range(len(target_cells)-1):
-            cur.append([])
-            cur=cur[0]
 
+        for con in self.trial_constraints:
+            con.resolve(self)
 
-        last=len(target_cells)-1
+        self.combs_weights=[-1]*self.M_raw
         loc=0
-
+        perm=[0]*self.comb_len
+        last=self.comb_len-1
         while 1:
+            ind=self.comb_index(perm)
+            self.combs_weights[ind]=self.get_cap(perm)
 
-            vals=perm_to_levels(levels,perm)
-            ans=get_wt_ans(vals,funcs)
-            put_wt_val(asg_vf_i,perm,ans)
-
-            if perm[last] == counts[last]-1:
+            if perm[last] == self.obs_counts[last]-1:
                 if last==0:
                     break
 
                 perm[last]=0
                 finished=0
                 for j in range(last-1,-1,-1):
-                    if perm[j]==counts[j]-1:
+                    if perm[j]==self.obs_counts[j]-1:
                         if j==0:
                             finished=1
                             break
@@ -1100,130 +1393,163 @@ def execute(answers_count=1, maximum_trials=False):
                             perm[j]=0
                             continue
 
-                    wt_append_new(asg_vf_i,perm,j)
                     perm[j] += 1
                     break
                 if finished:
                     break
             else:
                 perm[last]+=1
-        asg_tmp.append(asg_vf_i)
-
-    asg_wt_vf=asg_tmp
-
-
-    combs_weights=[-1]*M_raw
-    loc=0
-    perm=[0]*comb_len
-    last=comb_len-1
-    while 1:
-        ind=comb_index(perm)
-        combs_weights[ind]=get_cap(perm)
-
-        if perm[last] == obs_counts[last]-1:
-            if last==0:
-                break
-
-            perm[last]=0
-            finished=0
-            for j in range(last-1,-1,-1):
-                if perm[j]==obs_counts[j]-1:
-                    if j==0:
-                        finished=1
-                        break
-                    else:
-
-                        perm[j]=0
-                        continue
-
-                perm[j] += 1
-                break
-            if finished:
-                break
-        else:
-            perm[last]+=1
-
-    iterations=answers_count # number of requested answers
-
-    # signal(SIGALRM,sigalrm_hand)
-
-    timer = threading.Timer(EXEC_TH, sigalrm_hand)
-    timer.start()
-
-    # setitimer(ITIMER_REAL,EXEC_TH,0)
 
-
-    def add_answer(pre,r,answers,maximum_trials):
+    def add_answer(self,pre,r,answers,maximum_trials):
         a={}
 
-        for i in range(c_objs_count):
-            key=primary_objects[i].name
+        for i in range(self.c_objs_count):
+            key=self.primary_objects[i].name
             vals=[]
 
-            if trans_in_crossing:
+            if self.trans_in_crossing:
                 v=pre[i]
-                v=primary_objects[i].levels[v]
+                v=self.primary_objects[i].levels[v]
                 vals.append(v)
 
             for p in r:
                 v=p[i]
-                v=primary_objects[i].levels[v]
+                v=self.primary_objects[i].levels[v]
                 vals.append(v)
             if maximum_trials:
                 vals = vals[0:maximum_trials]
             a[key]=vals
 
 
-        for i in range(wt_count):
-            key=within_trials[i][0]
+        for i in range(self.wt_count):
+            key=self.within_trials[i][0]
             vals=[]
 
-            c_ind=i+c_objs_count
-            if trans_in_crossing:
+            c_ind=i+self.c_objs_count
+            if self.trans_in_crossing:
                 v=pre[c_ind]
-                v=within_trials[i][1][v][0]
+                v=self.within_trials[i][1][v][0]
 
                 vals.append(v)
 
             for p in r:
                 v=p[c_ind]
-                v=within_trials[i][1][v][0]
+                v=self.within_trials[i][1][v][0]
                 vals.append(v)
             if maximum_trials:
                 vals = vals[0:maximum_trials]
             a[key]=vals
 
-        for i in range(trans_count):
-            key=transitions[i][0]
+        for i in range(self.trans_count):
+            key=self.transitions[i][0]
             vals=[]
 
-            c_ind=i+c_objs_count+wt_count
-            if trans_in_crossing:
+            c_ind=i+self.c_objs_count+self.wt_count
+            if self.trans_in_crossing:
                 vals.append('')
 
             for p in r:
                 v=p[c_ind]
-                v=transitions[i][1][v][0]
+                v=self.transitions[i][1][v][0]
                 vals.append(v)
+            # A transition has no level at the first trial
+            vals[0]=''
             if maximum_trials:
                 vals = vals[0:maximum_trials]
             a[key]=vals
 
         answers.append(a)
 
-    exp_answers=[]
-
-    for i in range(iterations):
+    '''
+        Produce answers one at a time, as each is completed.
+        With more than one worker, independent searches run in a pool of forked
+        processes, each seeded separately, and answers arrive in completion order.
+    '''
+    def answers(self, answers_count=1, maximum_trials=False, workers=1, seed=None):
+        self.prepare()
+
+        budget_end=None
+        if self.time_budget is not None:
+            budget_end=time() + self.time_budget
+
+        if workers<=1 or answers_count<=1:
+            if seed is not None:
+                self.random=Random(seed).random
+            for i in range(answers_count):
+                try:
+                    answer,stats=self.produce_answer(maximum_trials,budget_end,i,answers_count)
+                except _Cancelled:
+                    return
+                self.stats.append(stats)
+                report('sample',len(self.stats),requested=answers_count,backtracks=stats['backtracks'])
+                yield answer
+            return
+
+        # Forked processes inherit the encoded experiment, which may hold
+        # predicates that cannot be pickled. Without fork, fall back to threads,
+        # each working on its own shallow copy of the engine in a copy of the
+        # caller's context, so that its search sees the synthesis's progress.
+        # Cancellation is also checked as answers arrive, so answers that forked
+        # workers already have in progress are finished.
+        seeds=Random(seed if seed is not None else random.getrandbits(64))
+        forking='fork' in get_all_start_methods()
+        if forking:
+            executor=ProcessPoolExecutor(workers,mp_context=get_context('fork'),
+                                         initializer=_set_worker_engine,initargs=(self,))
+        else:
+            executor=ThreadPoolExecutor(workers)
+        def submit(i):
+            args=(seeds.getrandbits(64),maximum_trials,budget_end,i,answers_count)
+            if forking:
+                return executor.submit(_produce_in_worker,None,*args)
+            return executor.submit(copy_context().run,_produce_in_worker,copy(self),*args)
+
+        with executor:
+            futures=[submit(i) for i in range(answers_count)]
+            try:
+                for future in as_completed(futures):
+                    try:
+                        answer,stats=future.result()
+                    except _Cancelled:
+                        # A forked worker stops at the deadline that it inherited,
+                        # which has also passed here
+                        should_stop()
+                        return
+                    self.stats.append(stats)
+                    report('sample',len(self.stats),requested=answers_count,backtracks=stats['backtracks'])
+                    yield answer
+                    if should_stop():
+                        return
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def execute(self, answers_count=1, maximum_trials=False, workers=1, seed=None):
+        return list(self.answers(answers_count,maximum_trials,workers,seed))
+
+    def produce_answer(self, maximum_trials, budget_end, i, iterations):
+        exp_answers=[]
         time_s=(time())
+        self.deadline=time_s + self.EXEC_TH
+        self.deadline_message="Experiment not solvable. Change your crossing or constraints."
+        if budget_end is not None and budget_end < self.deadline:
+            self.deadline=budget_end
+            self.deadline_message="SMGen time budget of {} seconds exceeded after {} of {} samples.".format(
+                self.time_budget,i,iterations)
 
-        pre,r=sm_backtrack_random()
+        th=self.tuner.choose()
+        trials=maximum_trials or self.trial_count()
+        pre,r=self.sm_backtrack_random(th,trials)
 
         time_s=(time()) - time_s
+        elapsed=time_s
+
+        self.tuner.record(th,self.last_run['backtracks'],self.last_run['restarts'])
 
         # print("Experiment {} completed...".format(i))
         #print_permut(pre,r)
 
-        add_answer(pre,r,exp_answers,maximum_trials)
+        self.add_answer(pre,r,exp_answers,maximum_trials)
 
         if time_s<1:
             fmt="{:.4f}"
@@ -1243,9 +1569,19 @@ def execute(answers_count=1, maximum_trials=False):
             v="\033[31mINVALID\033[0m"
         print("Post generation validity check: {}\n".format(v))
         '''
-        timer.cancel()
-        # timer = threading.Timer(0)#, on_timer)
-        # timer.start()
-        # setitimer(ITIMER_REAL,0,0) #disable timer
 
-    return exp_answers
+        return exp_answers[0],dict(self.last_run,time=elapsed)
+
+
+# The engine for a forked worker process, inherited from the parent engine.
+_worker_engine=None
+
+def _set_worker_engine(engine):
+    global _worker_engine
+    _worker_engine=engine
+
+def _produce_in_worker(engine,seed,maximum_trials,budget_end,i,iterations):
+    if engine is None:
+        engine=_worker_engine
+    engine.random=Random(seed).random
+    return engine.produce_answer(maximum_trials,budget_end,i,iterations)
@@ -1,12 +1,19 @@
+from itertools import product
+from time import time
+from typing import Optional
+
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
-from sweetpea._internal.cross_block import CrossBlock
+from sweetpea._internal.cross_block import CrossBlock, AlignmentMode
+from sweetpea._internal.instrumentation import instrumented, span
+from sweetpea._internal.progress import with_cancelled
+from sweetpea._internal.weight import combination_weight
 from sweetpea._internal.primitive import *
 from sweetpea._internal.constraint import *
+from sweetpea._internal.constraint import _KInARow
 from sweetpea._internal.sampling_strategy.scattered_map_core import (
     _Factor, _DerivedLevel, _WithinTrial, _Transition,
-    encode_experiment, define_cross, execute, print_factors,
-    reset_state
+    _Exclude, _Pin, _RunLength, _Count, _Crossing, ScatteredMapEngine
 )
 
 '''
@@ -21,32 +28,59 @@ def _cexit(m,*var):
     raise Exception(m)
 
 class SMGen(Gen):
+    def __init__(self, time_budget: Optional[float] = None, workers: int = 1, seed: Optional[int] = None):
+        self.time_budget = time_budget
+        self.workers = workers
+        self.seed = seed
+
+    def __str__(self):
+        return SMGen.class_name()
+
     @staticmethod
     def class_name():
         return 'SMGen'
 
     @staticmethod
     def sample(block: Block, sample_count: int) -> SamplingResult:
-        assert(isinstance(block, MultiCrossBlockRepeat))
+        return SMGen.__sample(block, sample_count, None, 1, None)
 
-        if len(block.crossings) != 1:
-            _cexit(f"Multiple-crossing blocks are not supported by SMGen.")
+    def sample_object(self, block: Block, sample_count: int) -> SamplingResult:
+        return SMGen.__sample(block, sample_count, self.time_budget, self.workers, self.seed)
 
-        for c in block.constraints:
-            if (isinstance(c, AtMostKInARow) or isinstance(c, AtLeastKInARow) or isinstance(c, ExactlyK)
-                or isinstance(c, Exclude) or isinstance(c, Pin)):
-                _cexit(f"{type(c).__name__} constraints are not supported by SMGen.")
+    @staticmethod
+    def __sample(block: Block, sample_count: int, time_budget: Optional[float],
+                 workers: int, seed: Optional[int]) -> SamplingResult:
+        with instrumented() as instrumentation:
+            result=SMGen.__generate(block, sample_count, time_budget, workers, seed)
+            instrumentation.with_spans(result.metrics)
+            return result
+
+    @staticmethod
+    def __generate(block: Block, sample_count: int, time_budget: Optional[float],
+                   workers: int, seed: Optional[int]) -> SamplingResult:
+        assert(isinstance(block, MultiCrossBlockRepeat))
+
+        # The search is built around the crossing that covers the most trials,
+        # preferring one that does not need to be repeated; any other crossing
+        # is balanced by checking each trial as it is placed
+        trial_count=block.trials_per_sample()
+        coverage=[(min(block.preamble_sizes[i] + block.crossing_sizes[i] * block.crossing_weights[i], trial_count),
+                   -block.crossing_weights[i])
+                  for i in range(len(block.crossings))]
+        primary_crossing=coverage.index(max(coverage))
+        crossing=block.orig_crossings[primary_crossing]
+        design=block.orig_design
 
         # For now, implement a minimum-trials contraint by weighting the levels of
         # one non-derived factor
         maximum_trials = False
-        scale_one = block.crossing_weight()
-        if scale_one > 1:
-            maximum_trials = block.trials_per_sample()
+        scale_one = block.crossing_weight(block.crossings[primary_crossing])
+        if scale_one > 1 or len(block.crossings) > 1:
+            maximum_trials = trial_count
+        scaled=[f.name for f in list(crossing) + list(design) if not isinstance(f.levels[0], DerivedLevel)]
 
-        reset_state()
-        design=block.orig_design
-        crossing=block.orig_crossings[0]
+        start=time()
+        engine=ScatteredMapEngine(time_budget=time_budget)
         primary=[]
         derived=[]
         p_dc={}
@@ -84,10 +118,12 @@ class SMGen(Gen):
                     _levels.append([l.name,pred,arg_names,l._weight])
             else:
                 # For now, implement weighting for a non-derived factor by duplicating levels
+                scale=1
+                if name==scaled[0]:
+                    scale=scale_one
                 for l in levels:
-                    for i in range(scale_one * l._weight):
+                    for i in range(scale * l._weight):
                         _levels.append(l.name)
-                scale_one = 1
 
             if d_type==None:
                 primary.append([name,_levels])
@@ -142,12 +178,84 @@ class SMGen(Gen):
             else:
                 sm_cross.append(p_dc[f.name])
 
-        encode_experiment(sm_design)
+        with span('encode_design'):
+            engine.encode_experiment(sm_design)
+
+            # Exclude, Pin and k-in-a-row constraints are enforced while the
+            # search places each trial, instead of filtering finished answers
+            sm_factors=cast(dict, dict(p_dc))
+            sm_factors.update(dr_dc)
+            for c in block.constraints:
+                trial_constraint=SMGen.__trial_constraint(block, c, sm_factors)
+                if trial_constraint:
+                    engine.add_trial_constraint(trial_constraint)
+            for i in range(len(block.crossings)):
+                if i != primary_crossing:
+                    engine.add_trial_constraint(SMGen.__crossing_constraint(block, i, sm_factors))
+
+            cross=engine.define_cross(sm_cross)
+            # Combinations that Exclude constraints remove from the crossing,
+            # or that are impossible, are never placed
+            for levels in block.excluded_combinations(block.crossings[primary_crossing]):
+                engine.exclude_combination([l.name for l in levels])
+            engine.prepare()
+        if engine.trial_count() < trial_count:
+            _cexit(f"SMGen cannot produce the {trial_count} trials required by the crossings.")
+
+        with span('solve', workers=workers):
+            r=engine.execute(answers_count=sample_count, maximum_trials=maximum_trials,
+                             workers=workers, seed=seed)
+
+        metrics={
+            'sample_count': sample_count,
+            'workers': workers,
+            'time': time() - start,
+            'sample_times': [st['time'] for st in engine.stats],
+            'backtracks': [st['backtracks'] for st in engine.stats],
+            'restarts': [st['restarts'] for st in engine.stats],
+            'thresholds': [st['threshold'] for st in engine.stats],
+            'total_backtracks': sum(st['backtracks'] for st in engine.stats)
+        }
+        samples=SamplingResult(r,with_cancelled(metrics))
 
-        cross=define_cross(sm_cross)
-        r=execute(answers_count=sample_count, maximum_trials=maximum_trials)
+        return samples
 
-        samples=SamplingResult(r,{})
+    @staticmethod
+    def __crossing_constraint(block: MultiCrossBlockRepeat, i: int, sm_factors: dict) -> _Crossing:
+        c=block.crossings[i]
+        weight=block.crossing_weight(c)
+        if block.alignment is AlignmentMode.POST_PREAMBLE:
+            start=block.preamble_size()
+        else:
+            start=block.preamble_sizes[i]
+        quotas={}
+        excluded=block.excluded_combinations(c)
+        for levels in product(*[f.levels for f in c]):
+            if levels not in excluded:
+                quotas[tuple(l.name for l in levels)]=weight * combination_weight(levels)
+        return _Crossing([sm_factors[f.name] for f in block.orig_crossings[i]], start,
+                         block.crossing_sizes[i] * weight, quotas)
 
-        return samples
+    @staticmethod
+    def __trial_constraint(block: Block, c: Constraint, sm_factors: dict) -> Optional[object]:
+        if isinstance(c, Exclude):
+            return _Exclude(sm_factors[c.factor.name], c.level.name)
+        if isinstance(c, Pin):
+            return _Pin(sm_factors[c.factor.name], c.level.name,
+                        block.get_trial_numbers(c.factor, c.index, c.within_block))
+        if isinstance(c, _KInARow):
+            factor=sm_factors[c.level.factor.name]
+            ranges=block.map_block_trial_ranges(c.within_block, lambda start, end: (start, end))
+            if isinstance(c, AtMostKInARow):
+                return _RunLength(factor, c.level.name, ranges, max_run=c.k)
+            if isinstance(c, AtLeastKInARow):
+                return _RunLength(factor, c.level.name, ranges, min_run=c.k)
+            if isinstance(c, ExactlyKInARow):
+                return _RunLength(factor, c.level.name, ranges, min_run=c.k, max_run=c.k)
+            if isinstance(c, ExactlyKMultipleInARow):
+                return _RunLength(factor, c.level.name, ranges, multiple=c.k)
+            if isinstance(c, ExactlyK):
+                return _Count(factor, c.level.name, ranges, c.k)
+            _cexit(f"{type(c).__name__} constraints are not supported by SMGen.")
+        return None
 
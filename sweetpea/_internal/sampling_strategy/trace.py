@@ -0,0 +1,150 @@
+import json
+
+from typing import Dict, List, Optional, Tuple, cast
+
+from sweetpea._internal.instrumentation import MAIN_TRACK
+from sweetpea._internal.sampling_strategy.base import SamplingResult
+
+
+"""
+Exports the timings recorded in a sampling result's metrics in formats that
+standard profilers can open, so that runs can be inspected and compared:
+
+  * Chrome Trace Event JSON, for chrome://tracing or https://ui.perfetto.dev
+  * speedscope JSON, for https://www.speedscope.app
+
+Timings are first flattened into spans of the form recorded by
+`sweetpea._internal.instrumentation`, which strategies report as a list in
+`metrics['spans']`. GuidedGen's nested sample/trial/solver-call metrics are
+converted into 'build_cnf', 'sample', 'trial', 'candidate_check' and 'decode'
+spans.
+"""
+
+
+def sampling_spans(metrics: dict) -> List[dict]:
+    spans = [dict(span) for span in metrics.get('spans', [])]
+    for span in spans:
+        span.setdefault('track', MAIN_TRACK)
+        span.setdefault('args', {})
+    if 'sample_metrics' in metrics and 'start' in metrics:
+        spans += _guided_spans(metrics)
+    spans.sort(key=lambda span: (span['start'], -span['time']))
+    return spans
+
+
+def _guided_spans(metrics: dict) -> List[dict]:
+    parallel = metrics.get('workers', 1) > 1
+    spans = [_span('build_cnf', metrics['start'], metrics['cnf_time'])]
+    for sample_number, sample in enumerate(metrics['sample_metrics']):
+        spans.append(_span('sample', sample['start'], sample['time'], args={'sample': sample_number + 1}))
+        for trial in sample['trials']:
+            spans.append(_span('trial', trial['start'], trial['time'],
+                               args={'trial': trial['t'], 'cached': trial.get('cached', False)}))
+            for call in trial['solver_calls']:
+                track = call['worker'] if parallel else MAIN_TRACK
+                spans.append(_span('candidate_check', call['start'], call['time'], track,
+                                   {'SAT': call['SAT']}))
+        spans.append(_span('decode', sample['decode_start'], sample['decode_time']))
+    return spans
+
+
+def _span(name: str, start: float, duration: float, track: str = MAIN_TRACK,
+          args: Optional[dict] = None) -> dict:
+    return {'name': name, 'start': start, 'time': duration, 'track': track, 'args': args or {}}
+
+
+def _tracks(spans: List[dict]) -> List[str]:
+    tracks = [MAIN_TRACK]
+    for span in spans:
+        if span['track'] not in tracks:
+            tracks.append(span['track'])
+    return tracks
+
+
+"""
+Generates a Chrome Trace Event file for a given sampling.
+"""
+class ChromeTrace():
+
+    @staticmethod
+    def generate(filename: str, sampling_result: SamplingResult) -> None:
+        with open(filename, 'w') as f:
+            json.dump(ChromeTrace.convert(sampling_result.metrics), f)
+
+    @staticmethod
+    def convert(metrics: dict) -> dict:
+        spans = sampling_spans(metrics)
+        tracks = _tracks(spans)
+        origin = spans[0]['start'] if spans else 0
+        events = cast(List[dict], [])
+        for tid, track in enumerate(tracks):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                           'args': {'name': track}})
+        for span in spans:
+            events.append({'name': span['name'],
+                           'ph': 'X',
+                           'ts': (span['start'] - origin) * 1e6,
+                           'dur': span['time'] * 1e6,
+                           'pid': 1,
+                           'tid': tracks.index(span['track']),
+                           'args': span['args']})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+"""
+Generates a speedscope file for a given sampling, with one evented profile per track.
+"""
+class Speedscope():
+    SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+    @staticmethod
+    def generate(filename: str, sampling_result: SamplingResult) -> None:
+        with open(filename, 'w') as f:
+            json.dump(Speedscope.convert(sampling_result.metrics), f)
+
+    @staticmethod
+    def convert(metrics: dict) -> dict:
+        spans = sampling_spans(metrics)
+        origin = spans[0]['start'] if spans else 0
+        frames = cast(Dict[str, int], {})
+        profiles = []
+        for track in _tracks(spans):
+            track_spans = [span for span in spans if span['track'] == track]
+            if not track_spans:
+                continue
+            for span in track_spans:
+                frames.setdefault(span['name'], len(frames))
+            profiles.append(Speedscope.__convert_track(track, track_spans, frames, origin))
+        return {
+            '$schema': Speedscope.SCHEMA,
+            'shared': {'frames': [{'name': name} for name in frames]},
+            'profiles': profiles
+        }
+
+    @staticmethod
+    def __convert_track(track: str, spans: List[dict], frames: Dict[str, int], origin: float) -> dict:
+        events = cast(List[dict], [])
+        # Spans that are still open, as (frame, end) pairs; a span that would
+        # outlast its parent is clipped so that the events stay well nested.
+        stack = cast(List[Tuple[int, float]], [])
+        for span in spans:
+            start = span['start'] - origin
+            while stack and stack[-1][1] <= start:
+                frame, end = stack.pop()
+                events.append({'type': 'C', 'frame': frame, 'at': end})
+            end = start + span['time']
+            if stack:
+                end = min(end, stack[-1][1])
+            events.append({'type': 'O', 'frame': frames[span['name']], 'at': start})
+            stack.append((frames[span['name']], end))
+        while stack:
+            frame, end = stack.pop()
+            events.append({'type': 'C', 'frame': frame, 'at': end})
+        return {
+            'type': 'evented',
+            'name': track,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': max(event['at'] for event in events),
+            'events': events
+        }
@@ -1,5 +1,4 @@
 from math import ceil, log
-from tqdm import tqdm
 import sys
 
 from typing import List, cast
@@ -7,6 +6,7 @@ from typing import List, cast
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
 from sweetpea._internal.core import sample_uniform, CNF
+from sweetpea._internal.instrumentation import instrumented, span
 
 """
 This strategy relies UniGen to sample uniformly from possible solutions.
@@ -20,18 +20,23 @@ class UniGen(Gen):
     @staticmethod
     def sample(block: Block, sample_count: int, min_search: bool=False, use_cmsgen=False) -> SamplingResult:
 
-        backend_request = block.build_backend_request()
-        if block.show_errors():
-            return SamplingResult([], {})
-
-        solutions = sample_uniform(
-            sample_count,
-            CNF(backend_request.get_cnfs_as_json()),
-            backend_request.fresh - 1,
-            block.variables_per_sample(),
-            backend_request.get_requests_as_generation_requests(),
-            use_docker=False,
-            use_cmsgen=use_cmsgen)
-
-        result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
-        return SamplingResult(result, {})
+        with instrumented() as instrumentation:
+            backend_request = block.build_backend_request()
+            with span('validate_block'):
+                if block.show_errors():
+                    return SamplingResult([], instrumentation.with_spans({}))
+
+            cnf = CNF(backend_request.get_cnfs_as_json())
+            with span('solve'):
+                solutions = sample_uniform(
+                    sample_count,
+                    cnf,
+                    backend_request.fresh - 1,
+                    block.variables_per_sample(),
+                    backend_request.get_requests_as_generation_requests(),
+                    use_docker=False,
+                    use_cmsgen=use_cmsgen)
+
+            with span('decode'):
+                result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
+            return SamplingResult(result, instrumentation.with_spans({}))
@@ -11,6 +11,10 @@ from sweetpea._internal.logic import And, cnf_to_json
 def build_cnf(block: Block) -> CNF:
     """Converts a Block into a CNF represented as a Unigen-compatible string.
     """
+    return block.cached_encoding('cnf', lambda: _build_cnf(block))
+
+
+def _build_cnf(block: Block) -> CNF:
     backend_request = block.build_backend_request()
     cnf = CNF(backend_request.get_cnfs_as_json())
     combined_cnf = combine_cnf_with_requests(
@@ -0,0 +1,94 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, cast, overload
+
+import numpy as np
+
+from sweetpea._internal import columnar
+from sweetpea._internal.primitive import Factor
+
+
+class TrialMatrix(Sequence[dict]):
+    """A batch of trial sequences stored as columns. Each factor with levels is
+    an array of level indices with one row per sequence and one column per
+    trial, using the smallest integer type that fits, where ``-1`` stands for
+    a trial without a level. A continuous factor is an array of its values.
+
+    A :class:`.TrialMatrix` is a sequence of experiments: indexing it or
+    iterating over it produces each experiment in the usual form of a
+    dictionary that maps factor names to lists of level names, converting
+    one experiment at a time. Slicing produces a :class:`.TrialMatrix` that
+    shares the arrays.
+    """
+
+    def __init__(self, columns: Dict[str, Tuple[np.ndarray, Optional[list]]]):
+        self.columns = columns
+        self.__names = {name: None if levels is None else np.array(list(levels) + [''], dtype=object)
+                        for name, (codes, levels) in columns.items()}
+
+    @staticmethod
+    def from_experiments(factors: List[Factor], experiments: Iterable[dict]) -> 'TrialMatrix':
+        """Codes experiments one at a time, keeping only the columns of `factors`."""
+        manifest, arrays = columnar.experiment_columns(factors, experiments)
+        return TrialMatrix({entry['name']: (array, entry['levels']) for entry, array in zip(manifest, arrays)})
+
+    @staticmethod
+    def load(path: str) -> 'TrialMatrix':
+        """Loads experiments saved by :func:`.save_experiments_npz` or :func:`.save_experiments_npy`."""
+        return TrialMatrix(columnar.load(path))
+
+    @property
+    def factor_names(self) -> List[str]:
+        return list(self.columns)
+
+    @property
+    def trial_count(self) -> int:
+        codes = next(iter(self.columns.values()))[0]
+        return codes.shape[1] if codes.ndim == 2 else 0
+
+    def codes(self, factor_name: str) -> np.ndarray:
+        """The array for a factor, with one row per experiment."""
+        return self.columns[factor_name][0]
+
+    def levels(self, factor_name: str) -> Optional[list]:
+        """The level names that a factor's codes index, or ``None`` for a continuous factor."""
+        return self.columns[factor_name][1]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(codes.nbytes for codes, levels in self.columns.values())
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))[0]) if self.columns else 0
+
+    @overload
+    def __getitem__(self, index: int) -> dict: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> 'TrialMatrix': ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[dict, 'TrialMatrix']:
+        if isinstance(index, slice):
+            return TrialMatrix({name: (codes[index], levels) for name, (codes, levels) in self.columns.items()})
+        experiment = {}
+        for name, (codes, levels) in self.columns.items():
+            names = self.__names[name]
+            if names is None:
+                experiment[name] = codes[index].tolist()
+            else:
+                experiment[name] = names[codes[index]].tolist()
+        return experiment
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield cast(dict, self[i])
+
+    def to_dicts(self) -> List[dict]:
+        """Converts every experiment to the dictionary form."""
+        return list(self)
+
+    def as_columnar(self) -> Tuple[List[dict], List[np.ndarray]]:
+        manifest = [{'name': name, 'key': f'factor_{i}', 'levels': levels}
+                    for i, (name, (codes, levels)) in enumerate(self.columns.items())]
+        return manifest, [codes for codes, levels in self.columns.values()]
+
+    def __repr__(self) -> str:
+        return f'TrialMatrix({len(self)} experiments x {self.trial_count} trials, factors={self.factor_names})'
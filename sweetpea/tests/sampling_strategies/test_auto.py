@@ -0,0 +1,106 @@
+import operator as op
+import pytest
+
+from sweetpea import (
+    Factor, DerivedLevel, WithinTrial, Transition, CrossBlock, AtMostKInARow,
+    synthesize_trials, sample_mismatch_experiment, AutoGen, RandomGen, IterateSATGen
+)
+from sweetpea._internal.sampling_strategy.base import SamplingResult
+
+
+color = Factor("color", ["red", "blue", "green", "yellow"])
+text = Factor("text", ["red", "blue", "green", "yellow"])
+
+congruent = Factor("congruent?", [
+    DerivedLevel("con", WithinTrial(op.eq, [color, text])),
+    DerivedLevel("inc", WithinTrial(op.ne, [color, text]))
+])
+
+color_repeats = Factor("repeated color?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no", Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+
+simple_block = CrossBlock([color, text, congruent], [color, text], [])
+
+# RandomGen rejects nearly every candidate, but SMGen's search is quick
+constrained_block = CrossBlock([color, text, congruent, color_repeats], [color, text],
+                               [AtMostKInARow(3, (congruent, "inc")), AtMostKInARow(1, (congruent, "con")),
+                                AtMostKInARow(1, (color_repeats, "yes")), AtMostKInARow(2, (color_repeats, "no"))])
+
+
+def estimates(monkeypatch, random=None, smgen=None, sat=None):
+    """Replaces the pilots with the given estimates, where a pilot without an
+    estimate must not run."""
+    def fixed(name, estimate):
+        def pilot(*args, **kwargs):
+            assert estimate is not None, f"The {name} pilot ran"
+            return estimate
+        return staticmethod(pilot)
+    monkeypatch.setattr(RandomGen, 'pilot', fixed('RandomGen', random))
+    monkeypatch.setattr(AutoGen, '_AutoGen__smgen_pilot', fixed('SMGen', smgen))
+    monkeypatch.setattr(AutoGen, '_AutoGen__sat_pilot', fixed('SAT', sat))
+
+
+# RandomGen would accept 3 of 10 candidates at 1ms each
+quick_random = {'time': 0.01, 'candidates': 10, 'accepted': 3, 'possible_sequences': 10**6}
+# RandomGen would reject every one of 1000 candidates at 0.5ms each
+rejecting_random = {'time': 0.5, 'candidates': 1000, 'accepted': 0, 'possible_sequences': 10**6}
+
+
+def test_random_cost():
+    random_cost = AutoGen._AutoGen__random_cost
+    assert random_cost(quick_random, 3) == pytest.approx(0.001 * 3 * 12 / 4)
+    assert random_cost(rejecting_random, 5) == pytest.approx(0.0005 * 5 * 1002)
+    # Every sequence was tried
+    assert random_cost({'time': 0.2, 'candidates': 4, 'accepted': 1, 'possible_sequences': 4}, 100) == pytest.approx(0.2)
+    # No sequence is possible
+    assert random_cost({'time': 0.0, 'candidates': 0, 'accepted': 0, 'possible_sequences': 0}, 10) == 0.0
+
+
+def test_selects_random_when_it_is_fast(monkeypatch):
+    estimates(monkeypatch, random=quick_random)
+    result = AutoGen.sample(simple_block, 3)
+    auto = result.metrics['auto']
+    assert auto['strategy'] == 'RandomGen'
+    # Later pilots are not run
+    assert set(auto['estimates']) == {'RandomGen'}
+    assert len(result.samples) == 3
+    assert simple_block._encodings is None
+
+
+def test_selects_smgen_when_random_rejects(monkeypatch):
+    estimates(monkeypatch, random=rejecting_random, smgen={'time': 0.01})
+    result = AutoGen(pilot_time=0.5).sample_object(constrained_block, 5)
+    auto = result.metrics['auto']
+    assert auto['strategy'] == 'SMGen'
+    assert auto['costs'] == {'RandomGen': pytest.approx(2.505), 'SMGen': pytest.approx(0.05)}
+    assert 'SAT' not in auto['estimates']
+    assert any(s['name'] == 'pilot' for s in result.metrics['spans'])
+    for sample in result.samples:
+        assert sample_mismatch_experiment(constrained_block, sample) == {}
+
+
+def test_selects_lowest_cost(monkeypatch):
+    estimates(monkeypatch, random=rejecting_random, smgen={'error': "No sequence was produced"},
+              sat={'variables': 10, 'clauses': 20, 'satisfiable': True, 'startup_time': 0.05, 'solve_time': 0.1})
+    monkeypatch.setattr(IterateSATGen, 'sample', staticmethod(lambda block, count: SamplingResult([], {})))
+    auto = AutoGen.sample(constrained_block, 5).metrics['auto']
+    assert auto['strategy'] == 'IterateSATGen'
+    assert auto['costs'] == {'RandomGen': pytest.approx(2.505), 'IterateSATGen': pytest.approx(0.5),
+                             'CMSGen': pytest.approx(0.05 + 0.05 * 2 * 5)}
+
+
+def test_progress_excludes_pilots(monkeypatch):
+    estimates(monkeypatch, random=rejecting_random, smgen={'time': 0.01})
+    events = []
+    trials = synthesize_trials(constrained_block, 2, AutoGen(pilot_time=0.5), on_progress=events.append)
+    assert len(trials) == 2
+    assert [e['samples'] for e in events if e['stage'] == 'sample'] == [1, 2]
+
+
+def test_random_pilot():
+    estimate = RandomGen.pilot(constrained_block, 0.1)
+    assert estimate['candidates'] > estimate['accepted']
+    assert estimate['possible_sequences'] > estimate['candidates']
+    assert RandomGen.pilot(simple_block, 10, max_accepted=2)['accepted'] == 2
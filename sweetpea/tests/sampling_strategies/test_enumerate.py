@@ -0,0 +1,79 @@
+import operator as op
+
+from itertools import islice, product
+
+from sweetpea import (
+    CrossBlock, MinimumTrials, AtMostKInARow, Factor, DerivedLevel, WithinTrial, Transition,
+    enumerate_trials, sample_mismatch_experiment
+)
+from sweetpea._internal.sampling_strategy.random import RandomGen
+
+color = Factor("color", ["red", "blue"])
+text  = Factor("text",  ["red", "blue"])
+
+congruent = Factor("congruent?", [
+    DerivedLevel("con", WithinTrial(op.eq, [color, text])),
+    DerivedLevel("inc", WithinTrial(op.ne, [color, text]))
+])
+
+color_repeats = Factor("repeated color?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no",  Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+
+
+def as_key(sample: dict) -> tuple:
+    return tuple((k, tuple(v)) for k, v in sorted(sample.items()))
+
+
+def check_all_valid_and_distinct(block, samples):
+    for s in samples:
+        assert sample_mismatch_experiment(block, s) == {}
+    assert len(set(map(as_key, samples))) == len(samples)
+
+
+def test_enumerate_trials_full_crossing():
+    block = CrossBlock([color, text, congruent], [color, text], [])
+    samples = list(enumerate_trials(block))
+    assert len(samples) == 24
+    check_all_valid_and_distinct(block, samples)
+
+
+def test_enumerate_trials_with_leftover():
+    block = CrossBlock([color, text], [color, text], [MinimumTrials(6)])
+    samples = list(enumerate_trials(block))
+    # The crossing is doubled to cover 6 trials, so each combination appears at most twice
+    assert len(samples) == 1440
+    check_all_valid_and_distinct(block, samples)
+
+
+def test_enumerate_with_preamble():
+    block = CrossBlock([color, text, color_repeats], [text, color_repeats], [])
+    samples = list(RandomGen.enumerate(block))
+    # Brute force: every color/text assignment whose last four trials cover the crossing
+    expected = 0
+    for colors in product(["red", "blue"], repeat=5):
+        for texts in product(["red", "blue"], repeat=5):
+            repeats = ["yes" if a == b else "no" for a, b in zip(colors, colors[1:])]
+            if len(set(zip(texts[1:], repeats))) == 4:
+                expected += 1
+    assert len(samples) == expected
+    check_all_valid_and_distinct(block, samples)
+
+
+def test_enumerate_rejects_constraint_violations():
+    unconstrained = CrossBlock([color, text], [color, text], [MinimumTrials(8)])
+    constrained = CrossBlock([color, text], [color, text], [MinimumTrials(8), AtMostKInARow(1, color)])
+    expected = [s for s in RandomGen.enumerate(unconstrained)
+                if all(a != b for a, b in zip(s["color"], s["color"][1:]))]
+    samples = list(RandomGen.enumerate(constrained))
+    assert len(samples) > 0
+    assert sorted(map(as_key, samples)) == sorted(map(as_key, expected))
+
+
+def test_enumerate_trials_is_lazy():
+    shape = Factor("shape", ["a", "b", "c", "d", "e", "f"])
+    size = Factor("size", ["1", "2", "3", "4", "5", "6"])
+    block = CrossBlock([shape, size], [shape, size], [])
+    samples = list(islice(enumerate_trials(block), 3))
+    check_all_valid_and_distinct(block, samples)
@@ -1,7 +1,7 @@
 import pytest
 
 from sweetpea._internal.logic import And
-from sweetpea._internal.sampling_strategy.guided import GuidedGen
+from sweetpea._internal.sampling_strategy.guided import GuidedGen, _PrefixCache
 
 
 def test_committed_to_solution():
@@ -9,3 +9,31 @@ def test_committed_to_solution():
         And([1, 3, 5]),
         And([2, 4, 6])
     ]) == [1, 3, 5, 2, 4, 6]
+
+
+def test_prefix_cache_lookup():
+    cache = _PrefixCache(10)
+    assert cache.lookup([]) is None
+    cache.store([], [[1, 3], [2, 4]])
+    cache.store([And([1, 3])], [[6, 8]])
+    assert cache.lookup([]) == [[1, 3], [2, 4]]
+    assert cache.lookup([And([1, 3])]) == [[6, 8]]
+    assert cache.lookup([And([2, 4])]) is None
+    assert cache.lookup([And([1, 3]), And([6, 8])]) is None
+
+
+def test_prefix_cache_evicts_least_recently_used():
+    cache = _PrefixCache(2)
+    cache.store([], [[1], [2]])
+    cache.store([And([1])], [[3]])
+    assert cache.lookup([]) == [[1], [2]]
+    cache.store([And([2])], [[4]])
+    assert cache.lookup([And([1])]) is None
+    assert cache.lookup([]) == [[1], [2]]
+    assert cache.lookup([And([2])]) == [[4]]
+
+
+def test_prefix_cache_disabled():
+    cache = _PrefixCache(0)
+    cache.store([], [[1], [2]])
+    assert cache.lookup([]) is None
@@ -0,0 +1,75 @@
+from sweetpea import Factor, CrossBlock, synthesize_trials
+from sweetpea._internal.instrumentation import Instrumentation, instrumented, span
+from sweetpea._internal.sampling_strategy.random import RandomGen
+from sweetpea._internal.sampling_strategy.smgen import SMGen
+from sweetpea._internal.server import build_cnf
+
+
+color = Factor("color", ["red", "blue"])
+text = Factor("text", ["red", "blue"])
+block = CrossBlock([color, text], [color, text], [])
+
+
+def test_span_records_args_and_calls_back():
+    seen = []
+    instrumentation = Instrumentation(callback=seen.append)
+    with instrumentation.span('step', size=1) as args:
+        args['found'] = 2
+    assert len(instrumentation.spans) == 1
+    recorded = instrumentation.spans[0]
+    assert recorded['name'] == 'step' and recorded['track'] == 'main'
+    assert recorded['args'] == {'size': 1, 'found': 2}
+    assert recorded['time'] >= 0
+    assert seen == [recorded]
+
+
+def test_span_without_instrumentation_does_nothing():
+    with span('step') as args:
+        args['found'] = 1
+    with instrumented(enabled=False) as instrumentation:
+        with span('step'):
+            pass
+    assert instrumentation.spans == []
+
+
+def test_nested_instrumentation_continues():
+    with instrumented() as outer:
+        with instrumented() as inner:
+            with span('step'):
+                pass
+    assert inner is outer
+    assert [s['name'] for s in outer.spans] == ['step']
+
+
+def test_build_cnf_spans():
+    with instrumented() as instrumentation:
+        build_cnf(block)
+    names = [s['name'] for s in instrumentation.spans]
+    assert 'build_backend_request' in names
+    assert 'apply_constraint' in names
+    assert 'convert_cnf' in names
+    assert 'encode_cardinality' in names
+
+
+def test_random_gen_spans():
+    spans = RandomGen.sample(block, 2).metrics['spans']
+    names = [s['name'] for s in spans]
+    assert {'validate_block', 'count_solutions', 'solve', 'decode'} <= set(names)
+    assert names.count('decode') == 2
+
+
+def test_smgen_spans():
+    names = [s['name'] for s in SMGen.sample(block, 1).metrics['spans']]
+    assert names == ['encode_design', 'solve']
+
+
+def test_synthesize_trials_callback():
+    seen = []
+    synthesize_trials(block, 1, RandomGen, on_span=seen.append)
+    names = [s['name'] for s in seen]
+    assert 'solve' in names and 'add_implied_levels' in names
+    assert names.index('add_implied_levels') > names.index('solve')
+
+    seen = []
+    synthesize_trials(block, 1, RandomGen, instrument=False, on_span=seen.append)
+    assert seen == []
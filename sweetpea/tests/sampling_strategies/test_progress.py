@@ -0,0 +1,80 @@
+import pytest
+
+from time import time
+
+from sweetpea import Factor, CrossBlock, AtLeastKInARow, CancellationToken, synthesize_trials
+from sweetpea._internal.progress import reporting, should_stop
+from sweetpea._internal.sampling_strategy.guided import GuidedGen
+from sweetpea._internal.sampling_strategy.random import RandomGen
+from sweetpea._internal.sampling_strategy.smgen import SMGen
+
+
+color = Factor("color", ["red", "blue", "green"])
+text = Factor("text", ["red", "blue", "green"])
+block = CrossBlock([color, text], [color, text], [])
+
+
+def test_token_timeout():
+    assert not CancellationToken().cancelled
+    assert CancellationToken(timeout=0).cancelled
+    token = CancellationToken(timeout=60)
+    token.cancel()
+    assert token.cancelled
+
+
+def test_should_stop_without_reporting():
+    assert not should_stop()
+    with reporting() as progress:
+        assert not should_stop()
+    assert not progress.stopped
+
+
+@pytest.mark.parametrize('strategy', [RandomGen, SMGen])
+def test_cancel_from_progress_callback(strategy):
+    token = CancellationToken()
+    events = []
+
+    def on_progress(event):
+        events.append(event)
+        if event['stage'] == 'sample':
+            token.cancel()
+
+    trials = synthesize_trials(block, 5, strategy, on_progress=on_progress, cancellation=token)
+    assert len(trials) == 1
+    assert token.stopped
+    assert events[0]['stage'] == 'sample' and events[0]['samples'] == 1
+    assert events[-1]['stage'] == 'done' and events[-1]['cancelled']
+
+
+@pytest.mark.parametrize('strategy', [RandomGen, SMGen, GuidedGen])
+def test_timeout_produces_partial_result(strategy):
+    token = CancellationToken(timeout=0)
+    with reporting(token=token):
+        result = strategy.sample(block, 3)
+    assert result.samples == []
+    assert result.metrics['cancelled']
+    assert token.stopped
+
+
+def test_cancel_smgen_thread_workers(monkeypatch):
+    # Without fork, workers are threads, whose searches stop once cancelled
+    # instead of running until their deadline
+    from sweetpea._internal.sampling_strategy import scattered_map_core
+    monkeypatch.setattr(scattered_map_core, 'get_all_start_methods', lambda: ['spawn'])
+    unsolvable = CrossBlock([color, text], [color, text], [AtLeastKInARow(4, color)])
+    token = CancellationToken(timeout=0.5)
+    start = time()
+    trials = synthesize_trials(unsolvable, 2, SMGen(workers=2), cancellation=token)
+    assert trials == [] and token.stopped
+    assert time() - start < 30
+
+
+def test_not_cancelled():
+    token = CancellationToken(timeout=60)
+    events = []
+    trials = synthesize_trials(block, 2, RandomGen, on_progress=events.append, cancellation=token)
+    assert len(trials) == 2
+    assert not token.stopped
+    assert [e['samples'] for e in events if e['stage'] == 'sample'] == [1, 2]
+    assert events[-1] == {**events[-1], 'stage': 'done', 'samples': 2, 'cancelled': False}
+    assert 'cancelled' not in RandomGen.sample(block, 1).metrics
@@ -0,0 +1,130 @@
+import operator as op
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sweetpea import (
+    CrossBlock, MultiCrossBlock, Merge, Factor, DerivedLevel, WithinTrial, Transition, MinimumTrials,
+    AtMostKInARow, AtLeastKInARow, ExactlyK, ExactlyKInARow, Exclude, Pin,
+    synthesize_trials, sample_mismatch_experiment, SMGen
+)
+from sweetpea._internal.sampling_strategy.scattered_map_core import ThresholdTuner
+
+color = Factor("color", ["red", "blue", "green"])
+text  = Factor("text",  ["red", "blue", "green"])
+size  = Factor("size",  ["big", "small"])
+
+congruent = Factor("congruent?", [
+    DerivedLevel("con", WithinTrial(op.eq, [color, text])),
+    DerivedLevel("inc", WithinTrial(op.ne, [color, text]))
+])
+
+color_repeats = Factor("repeated color?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no",  Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+
+block = CrossBlock([color, text, congruent, color_repeats], [color, text], [])
+
+
+def test_smgen_samples_are_valid():
+    for sample in synthesize_trials(block, 5, sampling_strategy=SMGen):
+        assert sample_mismatch_experiment(block, sample) == {}
+
+
+def test_smgen_runs_in_parallel_threads():
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: SMGen.sample(block, 3), range(8)))
+    for result in results:
+        assert len(result.samples) == 3
+        for sample in result.samples:
+            assert sample_mismatch_experiment(block, block.add_implied_levels(sample)) == {}
+
+
+def test_smgen_reports_search_metrics():
+    result = SMGen.sample(block, 4)
+    for key in ['sample_times', 'backtracks', 'restarts', 'thresholds']:
+        assert len(result.metrics[key]) == 4
+    assert result.metrics['total_backtracks'] == sum(result.metrics['backtracks'])
+
+
+def test_smgen_time_budget():
+    with pytest.raises(Exception, match="time budget"):
+        SMGen(time_budget=0).sample_object(block, 3)
+    assert len(SMGen(time_budget=60).sample_object(block, 3).samples) == 3
+
+
+def test_threshold_tuner_prefers_fewest_backtracks():
+    tuner = ThresholdTuner([150, 100, 60])
+    assert tuner.choose() == 150
+    tuner.record(150, 10, 0)
+    assert tuner.choose() == 150
+    tuner.record(150, 900, 3)
+    assert tuner.choose() == 100
+    tuner.record(100, 200, 1)
+    assert tuner.choose() == 60
+    tuner.record(60, 800, 5)
+    assert tuner.choose() == 100
+
+
+def test_smgen_with_workers():
+    result = SMGen(workers=3, seed=5).sample_object(block, 6)
+    assert len(result.samples) == 6
+    assert len(result.metrics['backtracks']) == 6
+    for sample in result.samples:
+        assert sample_mismatch_experiment(block, block.add_implied_levels(sample)) == {}
+
+
+def test_smgen_workers_are_seeded():
+    first = SMGen(workers=2, seed=11).sample_object(block, 4).samples
+    second = SMGen(workers=2, seed=11).sample_object(block, 4).samples
+    key = lambda s: sorted((k, tuple(v)) for k, v in s.items())
+    assert sorted(map(key, first)) == sorted(map(key, second))
+
+
+@pytest.mark.parametrize('design, crossing, constraints', [
+    ([color, text, congruent], [color, text], [AtMostKInARow(1, color)]),
+    ([color, text, congruent], [color, text], [AtMostKInARow(1, congruent["con"])]),
+    ([color, text, congruent], [color, text], [AtLeastKInARow(3, color)]),
+    ([color, text, congruent], [color, text], [ExactlyKInARow(3, color)]),
+    ([color, text], [color], [MinimumTrials(7), ExactlyK(3, text["red"])]),
+    ([color, text, congruent, color_repeats], [text, color_repeats], [Exclude(color["green"])]),
+    ([color, text, congruent, color_repeats], [color, text],
+     [AtMostKInARow(1, color_repeats["yes"]), Pin(0, text["red"])]),
+    ([color, text, congruent, color_repeats], [text, color_repeats],
+     [Pin(-1, color_repeats["yes"]), Pin(0, color["blue"])]),
+])
+def test_smgen_trial_constraints(design, crossing, constraints):
+    constrained = CrossBlock(design, crossing, constraints)
+    for sample in synthesize_trials(constrained, 3, sampling_strategy=SMGen(time_budget=60)):
+        assert sample_mismatch_experiment(constrained, sample) == {}
+
+
+@pytest.mark.parametrize('constrained', [
+    CrossBlock([color, text], [color, text], [Exclude(color["green"])]),
+    CrossBlock([color, text, congruent], [color, text], [Exclude(congruent["con"])]),
+    CrossBlock([color, text, congruent, color_repeats], [color, text, congruent], []),
+    MultiCrossBlock([color, text, size, congruent], [[color, size], [text, congruent]],
+                    [Exclude(text["blue"])], mode="weight"),
+])
+def test_smgen_excluded_crossing_combinations(constrained):
+    # Combinations that are excluded from a crossing, or impossible, are never placed
+    for sample in synthesize_trials(constrained, 3, sampling_strategy=SMGen(time_budget=60)):
+        assert len(sample["color"]) == constrained.trials_per_sample()
+        assert constrained.sample_mismatch_crossing(sample) == []
+        assert sample_mismatch_experiment(constrained, sample) == {}
+
+
+@pytest.mark.parametrize('multi_block', [
+    MultiCrossBlock([color, text, size], [[color, text], [size]], [], mode="repeat"),
+    MultiCrossBlock([color, text, size], [[color, text], [text, size]], [], mode="weight"),
+    MultiCrossBlock([color, text, size, congruent, color_repeats], [[color, text], [size, color_repeats]], [],
+                    mode="repeat", alignment="parallel start"),
+    MultiCrossBlock([color, text, size, congruent], [[color, text], [size, congruent]],
+                    [AtMostKInARow(2, size)], mode="weight"),
+    Merge([CrossBlock([color, text], [color, text], []), CrossBlock([color, size], [size], [])]),
+])
+def test_smgen_multiple_crossings(multi_block):
+    for sample in synthesize_trials(multi_block, 3, sampling_strategy=SMGen(time_budget=60)):
+        assert multi_block.sample_mismatch_crossing(sample) == []
+        assert sample_mismatch_experiment(multi_block, sample) == {}
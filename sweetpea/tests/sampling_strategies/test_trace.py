@@ -0,0 +1,63 @@
+from sweetpea._internal.sampling_strategy.trace import ChromeTrace, Speedscope, sampling_spans
+
+
+def guided_metrics(workers: int = 1) -> dict:
+    return {
+        'start': 100.0,
+        'cnf_time': 1.0,
+        'workers': workers,
+        'time': 5.0,
+        'sample_metrics': [{
+            'start': 101.0,
+            'time': 4.0,
+            'decode_start': 104.5,
+            'decode_time': 0.5,
+            'trials': [
+                {'t': 1, 'start': 101.0, 'time': 2.0, 'solver_calls': [
+                    {'start': 101.0, 'time': 1.0, 'SAT': True, 'worker': 'a'},
+                    {'start': 101.0, 'time': 1.5, 'SAT': False, 'worker': 'b'}
+                ]},
+                {'t': 2, 'start': 103.0, 'time': 1.5, 'cached': True, 'solver_calls': []}
+            ]
+        }]
+    }
+
+
+def test_guided_spans():
+    spans = sampling_spans(guided_metrics())
+    assert [s['name'] for s in spans] == ['build_cnf', 'sample', 'trial', 'candidate_check',
+                                          'candidate_check', 'trial', 'decode']
+    assert all(s['track'] == 'main' for s in spans)
+
+
+def test_strategy_spans():
+    spans = sampling_spans({'spans': [{'name': 'decode', 'start': 2.0, 'time': 1.0},
+                                      {'name': 'build_cnf', 'start': 1.0, 'time': 1.0}]})
+    assert [s['name'] for s in spans] == ['build_cnf', 'decode']
+
+
+def test_chrome_trace_uses_worker_threads():
+    trace = ChromeTrace.convert(guided_metrics(workers=2))
+    events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    assert events[0]['name'] == 'build_cnf' and events[0]['ts'] == 0 and events[0]['dur'] == 1e6
+    checks = [e for e in events if e['name'] == 'candidate_check']
+    assert len({e['tid'] for e in checks}) == 2
+    assert all(e['tid'] == 0 for e in events if e['name'] != 'candidate_check')
+
+
+def test_speedscope_events_are_nested():
+    document = Speedscope.convert(guided_metrics())
+    frames = [f['name'] for f in document['shared']['frames']]
+    [profile] = document['profiles']
+    stack = []
+    last = 0.0
+    for event in profile['events']:
+        assert event['at'] >= last
+        last = event['at']
+        if event['type'] == 'O':
+            stack.append(event['frame'])
+        else:
+            assert stack.pop() == event['frame']
+    assert stack == []
+    assert profile['endValue'] == 5.0
+    assert set(frames) == {'build_cnf', 'sample', 'trial', 'candidate_check', 'decode'}
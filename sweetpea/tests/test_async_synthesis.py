@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import threading
+import warnings
+import pytest
+
+from sweetpea import (
+    Factor, DerivedLevel, WithinTrial, CrossBlock, RandomGen, SMGen, CancellationToken, TrialMatrix,
+    synthesize_trials_async, iterate_trials_async
+)
+
+
+color = Factor("color", ["red", "blue"])
+text = Factor("text", ["red", "blue"])
+con = DerivedLevel("con", WithinTrial(lambda c, t: c == t, [color, text]))
+inc = DerivedLevel("inc", WithinTrial(lambda c, t: c != t, [color, text]))
+congruency = Factor("congruency", [con, inc])
+block = CrossBlock([color, text, congruency], [color, text], [])
+
+# Has too many sequences to sample them all
+shape = Factor("shape", ["a", "b", "c", "d"])
+size = Factor("size", ["1", "2", "3", "4"])
+large_block = CrossBlock([shape, size], [shape, size], [])
+
+
+def test_synthesize_trials_async():
+    events = []
+    trials = asyncio.run(synthesize_trials_async(block, 2, RandomGen, on_progress=events.append))
+    assert len(trials) == 2
+    assert set(trials[0]) == {"color", "text", "congruency"}
+    assert [e['stage'] for e in events] == ['sample', 'sample', 'done']
+
+    matrix = asyncio.run(synthesize_trials_async(block, 2, RandomGen, as_matrix=True))
+    assert isinstance(matrix, TrialMatrix) and len(matrix) == 2
+
+
+def test_iterate_trials_async():
+    async def collect():
+        return [trials async for trials in iterate_trials_async(block, 5, SMGen, batch_size=2)]
+    assert len(asyncio.run(collect())) == 5
+
+
+def test_timeout_and_errors():
+    token = CancellationToken(timeout=0)
+    assert asyncio.run(synthesize_trials_async(block, 2, RandomGen, cancellation=token)) == []
+    assert token.stopped
+    with pytest.raises(AttributeError):
+        asyncio.run(synthesize_trials_async(block, 2, "not a strategy"))
+
+
+def test_worker_limit_and_cancel(monkeypatch):
+    monkeypatch.setenv("SWEETPEA_ASYNC_WORKERS", "1")
+
+    async def run():
+        long = asyncio.ensure_future(synthesize_trials_async(large_block, 10**6, RandomGen))
+        await asyncio.sleep(0.2)
+        # The only worker is busy, so another call waits
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(synthesize_trials_async(block, 1, RandomGen), 0.5)
+        long.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await long
+        return await asyncio.wait_for(synthesize_trials_async(block, 1, RandomGen), 10)
+    assert len(asyncio.run(run())) == 1
+
+
+def test_cancel_token():
+    token = CancellationToken()
+
+    def cancel_after_samples(event):
+        if event['samples'] >= 3:
+            token.cancel()
+    trials = asyncio.run(asyncio.wait_for(
+        synthesize_trials_async(large_block, 10**6, RandomGen, on_progress=cancel_after_samples,
+                                cancellation=token), 30))
+    assert 3 <= len(trials) < 10**6
+    assert token.stopped
+
+
+@pytest.fixture
+def other_thread():
+    release = threading.Event()
+    other = threading.Thread(target=release.wait)
+    other.start()
+    yield
+    release.set()
+    other.join()
+
+
+def test_process_with_threads(other_thread):
+    # With another thread running, the worker is not forked, but the block is
+    # pickled for it
+    async def run():
+        task = asyncio.ensure_future(synthesize_trials_async(large_block, 10**6, RandomGen))
+        await asyncio.sleep(0.5)
+        assert multiprocessing.active_children()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        asyncio.run(run())
+        assert len(asyncio.run(synthesize_trials_async(block, 2, RandomGen))) == 2
+
+
+def test_cancel_token_in_thread(other_thread):
+    # A block that cannot be pickled is sampled in a thread instead
+    lock = threading.Lock()
+    odd = DerivedLevel("odd", WithinTrial(lambda s: lock is not None and s in ["a", "c"], [shape]))
+    even = DerivedLevel("even", WithinTrial(lambda s: lock is not None and s in ["b", "d"], [shape]))
+    parity = Factor("parity", [odd, even])
+    unpicklable = CrossBlock([shape, size, parity], [shape, size], [])
+    token = CancellationToken()
+
+    async def run():
+        task = asyncio.ensure_future(synthesize_trials_async(unpicklable, 10**6, RandomGen, cancellation=token))
+        await asyncio.sleep(0.2)
+        token.cancel()
+        return await asyncio.wait_for(task, 30)
+    with pytest.warns(RuntimeWarning, match="runs in a thread"):
+        assert len(asyncio.run(run())) < 10**6
+    assert token.stopped
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from sweetpea import predictability_scores
+from sweetpea._internal.auto_correlation_score import (
+    LaggedSamples, train_test_split_samples, predictability_score_factor
+)
+
+samples = [
+    {'color': ['red', 'green', 'red', 'green', 'red', 'green'],
+     'word': ['red', 'green', 'red', 'green', 'red', 'red']},
+    {'color': ['green', 'red', 'green', 'red', 'green', 'red'],
+     'word': ['green', 'red', 'red', 'red', 'green', 'blue']}
+]
+
+
+def lagged_rows(sample, factor, k, code):
+    # Each row lists the k preceding levels of every factor in turn
+    x, y = [], []
+    for end in range(k, len(sample[factor])):
+        x.append([code[f][l] for f in sample for l in sample[f][end - k:end]])
+        y.append(code[factor][sample[factor][end]])
+    return x, y
+
+
+def test_lagged_samples_rows():
+    lagged = LaggedSamples(samples, k=2)
+    code = {'color': {'green': 0, 'red': 1}, 'word': {'blue': 0, 'green': 1, 'red': 2}}
+    for factor in ['color', 'word']:
+        x, y = lagged.rows(factor, np.array([1, 0]))
+        x1, y1 = lagged_rows(samples[1], factor, 2, code)
+        x0, y0 = lagged_rows(samples[0], factor, 2, code)
+        assert x.tolist() == x1 + x0
+        assert y.tolist() == y1 + y0
+
+
+def test_lagged_samples_caps_k_at_half_the_trials():
+    assert LaggedSamples(samples, k=10).x.shape == (2 * 3, 6)
+
+
+def test_lagged_samples_one_hot():
+    lagged = LaggedSamples(samples, k=2, one_hot=True)
+    x, _ = lagged.rows('word', np.array([0]))
+    assert x.shape == (4, 2 * 2 + 2 * 3)
+    # red, green for color, then red, green for word
+    assert x[0].tolist() == [0, 1, 1, 0, 0, 0, 1, 0, 1, 0]
+
+
+def test_train_test_split_by_sample():
+    lagged = LaggedSamples(samples * 5, k=2)
+    x_train, y_train, x_test, y_test = train_test_split_samples(lagged, 'color', .8)
+    assert x_train.shape == (8 * 4, 4) and y_test.shape == (2 * 4,)
+
+
+def test_lagged_samples_of_different_lengths():
+    longer = {'color': samples[1]['color'] + ['green', 'red'], 'word': samples[1]['word'] + ['red', 'blue']}
+    lagged = LaggedSamples([samples[0], longer], k=2)
+    code = {'color': {'green': 0, 'red': 1}, 'word': {'blue': 0, 'green': 1, 'red': 2}}
+    x, y = lagged.rows('word', np.array([1, 0]))
+    x1, y1 = lagged_rows(longer, 'word', 2, code)
+    x0, y0 = lagged_rows(samples[0], 'word', 2, code)
+    assert x.tolist() == x1 + x0
+    assert y.tolist() == y1 + y0
+    x_train, _, x_test, _ = train_test_split_samples(lagged, 'color', .5)
+    assert sorted([len(x_train), len(x_test)]) == [4, 6]
+    # No window spans two samples
+    assert predictability_score_factor([samples[0], longer], 'color') == 1.0
+
+
+def test_lagged_samples_require_equal_lengths_within_a_sample():
+    with pytest.raises(Exception, match="same number of trials"):
+        LaggedSamples([samples[0], {'color': ['red', 'green'], 'word': ['red']}])
+
+
+def test_predictability_score():
+    alternating = {'color': ['red', 'green'] * 8}
+    assert predictability_score_factor([alternating], 'color') == 1.0
+    # After red comes green 3 times out of 5, and after green always red
+    sample = {'color': ['red', 'red', 'green', 'red', 'green', 'red', 'red', 'green', 'red']}
+    entropy = lambda p: -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+    expected = 1 - (5 / 8) * entropy(3 / 5) / entropy(5 / 8)
+    assert predictability_score_factor([sample], 'color') == pytest.approx(expected)
+
+
+def test_predictability_of_independent_levels_is_low():
+    rng = np.random.default_rng(3)
+    samples = [{'color': list(rng.choice(['red', 'green', 'blue'], 200))} for _ in range(20)]
+    assert predictability_score_factor(samples, 'color', 1) < 0.01
+    assert predictability_scores(samples, number_trials=2)['color'] < 0.05
@@ -0,0 +1,90 @@
+import operator as op
+import pytest
+import random
+
+from sweetpea import (
+    CrossBlock, Factor, DerivedLevel, WithinTrial, Transition, MinimumTrials, RandomGen,
+    AtMostKInARow, AtLeastKInARow, ExactlyK, ExactlyKInARow, Exclude, Pin, LatinSquare, Sequential,
+    synthesize_trials
+)
+from sweetpea._internal.sample_conversion import convert_sample_from_names_to_objects
+
+color = Factor("color", ["red", "blue", "green"])
+text  = Factor("text",  ["red", "blue", "green"])
+shape = Factor("shape", ["circle", "square"])
+
+congruent = Factor("congruent?", [
+    DerivedLevel("con", WithinTrial(op.eq, [color, text])),
+    DerivedLevel("inc", WithinTrial(op.ne, [color, text]))
+])
+
+color_repeats = Factor("repeated color?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no",  Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+
+blocks = [
+    CrossBlock([color, text, congruent], [color, text],
+               [AtMostKInARow(1, color), AtLeastKInARow(2, congruent["inc"])]),
+    CrossBlock([color, text, shape], [color, text], [ExactlyK(4, shape["circle"]), Pin(-1, shape["square"])]),
+    CrossBlock([color, text, color_repeats], [color, text],
+               [ExactlyKInARow(2, color_repeats["yes"]), Exclude(text["green"])]),
+    CrossBlock([color, text, shape], [color, shape], [LatinSquare([color, text]), MinimumTrials(9)]),
+    CrossBlock([color, shape], [shape], [Sequential(color), MinimumTrials(6)]),
+]
+
+
+def random_sample(block, rng):
+    # Draw from a couple of levels per factor, so that constraints sometimes hold
+    sample = {}
+    for f in block.design:
+        levels = rng.sample(f.levels, min(2, len(f.levels)))
+        sample[f] = [rng.choice(levels) for _ in range(block.trials_per_sample())]
+    return sample
+
+
+def latin_square_sample(block, rng):
+    # text is the main factor; color rotates by one level per segment
+    sample = random_sample(block, rng)
+    sample[color] = []
+    sample[text] = []
+    for segment in range(3):
+        for k in rng.sample(range(3), 3):
+            sample[text].append(text.levels[k])
+            sample[color].append(color.levels[(k + segment) % 3])
+    return sample
+
+
+def valid_samples(block, rng):
+    if block is blocks[3]:
+        return [latin_square_sample(block, rng) for _ in range(3)]
+    return [convert_sample_from_names_to_objects(s, block.design)
+            for s in synthesize_trials(block, 3, sampling_strategy=RandomGen)]
+
+
+def reference_mismatches(block, sample):
+    return [c for c in block.constraints if not c.potential_sample_conforms(sample, block)]
+
+
+@pytest.mark.parametrize('block', blocks)
+def test_compiled_checks_match_reference(block):
+    checker = block.constraint_checker()
+    rng = random.Random(3)
+    samples = [random_sample(block, rng) for _ in range(300)]
+    samples += valid_samples(block, rng)
+    conforming = 0
+    for sample in samples:
+        expected = reference_mismatches(block, sample)
+        assert checker.mismatches(sample) == expected
+        assert checker.conforms(sample) == (expected == [])
+        conforming += not expected
+    assert conforming >= 3
+    # As one batch
+    assert checker.conforming(samples).tolist() == [not reference_mismatches(block, s) for s in samples]
+
+
+def test_checker_skips_constraints_that_always_hold():
+    block = blocks[0]
+    checked = [c for c, check in block.constraint_checker().checks]
+    assert all(isinstance(c, (AtMostKInARow, AtLeastKInARow)) for c in checked)
+    assert block.constraint_checker() is block.constraint_checker()
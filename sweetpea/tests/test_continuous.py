@@ -1,7 +1,7 @@
 import operator as op
 import pytest
 
-from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial, Transition, Window, SimpleLevel, ContinuousFactor
+from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial, Transition, Window, SimpleLevel, ContinuousFactor, ContinuousFactorWindow
 from sweetpea import synthesize_trials, RandomGen, MinimumTrials, CrossBlock
 from sweetpea._internal.constraint import ContinuousConstraint
 import random
@@ -267,4 +267,89 @@ def test_continuous_constraint():
         time_gaussian_sample = np.array(experiments[ind][time_gaussian.name])
         time_exponential_sample = np.array(experiments[ind][time_exponential.name])
         sum_sample = time_gaussian_sample+time_exponential_sample
-        assert np.all(sum_sample > 2)
\ No newline at end of file
+        assert np.all(sum_sample > 2)
+# Batch Sampling Tests
+def test_sample_n():
+    rng = np.random.default_rng(0)
+    uniform = time_uniform.get_distribution().sample_n(1000, rng)
+    assert uniform.shape == (1000,)
+    assert np.all((0 <= uniform) & (uniform <= 10))
+    assert abs(np.mean(time_exponential.get_distribution().sample_n(10000, rng)) - 1) < 0.1
+    assert abs(np.mean(time_gaussian.get_distribution().sample_n(10000, rng))) < 0.1
+    assert np.all(time_lognormal.get_distribution().sample_n(100, rng) > 0)
+
+    diffs = dist_diff.sample_n(3, rng, [[5, 6, 7], [1, 2, 3]])
+    assert diffs.tolist() == [4, 4, 4]
+    with pytest.raises(RuntimeError):
+        dist_diff.sample_n(3, rng, [[5, 6, 7]])
+
+    cumulative = CustomDistribution(lambda: 1, cumulative=True)
+    assert cumulative.sample_n(3, rng).tolist() == [1, 2, 3]
+
+def test_block_samples_columns_repeatably():
+    design = [color, time_uniform, time_gaussian, difference_time, color_time]
+    block = CrossBlock(design, [color], [MinimumTrials(20)])
+    random.seed(7)
+    first = synthesize_trials(block, 2, RandomGen)
+    random.seed(7)
+    second = synthesize_trials(block, 2, RandomGen)
+    assert first == second
+    for experiment in first:
+        assert len(experiment[time_uniform.name]) == 20
+        assert all(isinstance(v, float) for v in experiment[difference_time.name])
+
+def test_block_samples_cumulative_per_trial():
+    counter = ContinuousFactor("counter", distribution=CustomDistribution(lambda: 1, cumulative=True))
+    assert not CrossBlock._samples_by_column(counter)
+    assert CrossBlock._samples_by_column(difference_time)
+    block = CrossBlock([color, counter], [color], [])
+    for experiment in synthesize_trials(block, 2, RandomGen):
+        assert experiment[counter.name] == [1, 2, 3, 4]
+
+# Resampling Tests
+def test_check_columns():
+    vectorized = ContinuousConstraint([time_gaussian, time_exponential], greater_than_2)
+    assert vectorized.check_columns([[1, 0, 3], [2, 1, 0]]).tolist() == [True, False, True]
+
+    def scalar_only(a, b):
+        if a + b > 2:
+            return True
+        return False
+    per_trial = ContinuousConstraint([time_gaussian, time_exponential], scalar_only)
+    assert per_trial.check_columns([[1, 0, 3], [2, 1, 0]]).tolist() == [True, False, True]
+
+def test_targeted_resampling():
+    tight = ContinuousConstraint([time_uniform], lambda t: t > 9)
+    block = CrossBlock([color, time_uniform, time_gaussian, difference_time], [color], [MinimumTrials(200), tight])
+    for experiment in synthesize_trials(block, 1, RandomGen):
+        assert all(t > 9 for t in experiment[time_uniform.name])
+        assert experiment[difference_time.name] == [u - g for u, g in zip(experiment[time_uniform.name],
+                                                                          experiment[time_gaussian.name])]
+
+def test_targeted_resampling_updates_windows_and_sums():
+    base = ContinuousFactor("base", distribution=UniformDistribution(0, 1))
+    window_sum = ContinuousFactor("window_sum", distribution=CustomDistribution(
+        lambda w: w[0] + w[-1] if not math.isnan(w[-1]) else w[0], [ContinuousFactorWindow([base], width=2)]))
+    total = ContinuousFactor("total", distribution=CustomDistribution(lambda b: b, [base], cumulative=True))
+    block = CrossBlock([color, base, window_sum, total], [color],
+                       [MinimumTrials(40), ContinuousConstraint([base], lambda b: b > 0.5)])
+    for experiment in synthesize_trials(block, 1, RandomGen):
+        values = experiment["base"]
+        assert all(v > 0.5 for v in values)
+        assert experiment["window_sum"][1:] == pytest.approx([a + b for a, b in zip(values[1:], values)])
+        assert experiment["total"] == pytest.approx(np.cumsum(values).tolist())
+
+def test_targeted_resampling_updates_dependents_of_sums():
+    onset = ContinuousFactor("onset", distribution=CustomDistribution(lambda: random.uniform(0, 1), cumulative=True))
+    double = ContinuousFactor("double", distribution=CustomDistribution(lambda o: 2 * o, [onset]))
+    block = CrossBlock([color, onset, double], [color],
+                       [MinimumTrials(12), ContinuousConstraint([onset], lambda o: o % 1 > 0.3)])
+    for experiment in synthesize_trials(block, 1, RandomGen):
+        assert experiment["double"] == pytest.approx([2 * o for o in experiment["onset"]])
+
+def test_resampling_attempt_budget():
+    impossible = ContinuousConstraint([time_uniform], lambda t: t > 10)
+    block = CrossBlock([color, time_uniform], [color], [impossible])
+    for mode in ["targeted", "sequence"]:
+        with pytest.raises(RuntimeError, match="after 5 resampling attempts"):
+            block.sample_continuous(0, {"color": ["red", "blue", "green", "brown"]}, mode=mode, max_attempts=5)
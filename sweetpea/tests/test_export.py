@@ -0,0 +1,67 @@
+import csv
+import operator as op
+import numpy as np
+
+from itertools import islice
+
+from sweetpea import (
+    CrossBlock, Factor, DerivedLevel, WithinTrial, Transition, ContinuousFactor, UniformDistribution, RandomGen,
+    synthesize_trials, enumerate_trials, save_experiments_csv, save_experiments_npz, save_experiments_npy,
+    load_experiments_columns
+)
+
+color = Factor("color", ["red", "blue"])
+text  = Factor("text",  ["red", "blue"])
+
+color_repeats = Factor("repeated color?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no",  Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+
+block = CrossBlock([color, text, color_repeats], [color, text], [])
+
+
+def test_save_experiments_csv_streams_an_iterator(tmp_path):
+    experiments = list(islice(enumerate_trials(block), 3))
+    save_experiments_csv(block, islice(enumerate_trials(block), 3), str(tmp_path / "exp"))
+    for idx, experiment in enumerate(experiments):
+        with open(tmp_path / f"exp_{idx}.csv") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ["color", "text", "repeated color?"]
+        assert rows[1:] == [list(row) for row in zip(experiment["color"], experiment["text"],
+                                                     experiment["repeated color?"])]
+
+
+def check_columns(columns, experiments):
+    assert list(columns) == ["color", "text", "repeated color?"]
+    for name, (codes, levels) in columns.items():
+        assert codes.shape == (len(experiments), 4)
+        decoded = [[levels[c] if c >= 0 else "" for c in row] for row in codes.tolist()]
+        assert decoded == [e[name] for e in experiments]
+    assert columns["repeated color?"][0][:, 0].tolist() == [-1] * len(experiments)
+
+
+def test_save_experiments_npz(tmp_path):
+    experiments = synthesize_trials(block, 5, sampling_strategy=RandomGen)
+    save_experiments_npz(block, iter(experiments), str(tmp_path / "exp.npz"))
+    columns = load_experiments_columns(str(tmp_path / "exp.npz"))
+    check_columns(columns, experiments)
+    assert columns["color"][0].dtype == np.int8
+
+
+def test_save_experiments_npy(tmp_path):
+    experiments = synthesize_trials(block, 5, sampling_strategy=RandomGen)
+    save_experiments_npy(block, experiments, str(tmp_path / "exp"))
+    columns = load_experiments_columns(str(tmp_path / "exp"))
+    check_columns(columns, experiments)
+    assert isinstance(columns["text"][0], np.memmap)
+
+
+def test_save_experiments_npz_with_continuous_factor(tmp_path):
+    time = ContinuousFactor("time", distribution=UniformDistribution(0, 1))
+    continuous_block = CrossBlock([color, text, time], [color, text], [])
+    experiments = synthesize_trials(continuous_block, 2, sampling_strategy=RandomGen)
+    save_experiments_npz(continuous_block, experiments, str(tmp_path / "exp.npz"))
+    values, levels = load_experiments_columns(str(tmp_path / "exp.npz"))["time"]
+    assert levels is None
+    assert values.tolist() == [e["time"] for e in experiments]
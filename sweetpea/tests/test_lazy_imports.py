@@ -0,0 +1,53 @@
+import subprocess
+import sys
+
+import sweetpea
+from sweetpea._internal import main
+
+
+# Loaded on first use, not by importing sweetpea and describing a design.
+HEAVY_MODULES = [
+    'numpy', 'networkx', 'tqdm', 'urllib.request', 'zipfile',
+    'sweetpea._internal.sampling_strategy.random',
+    'sweetpea._internal.sampling_strategy.smgen',
+    'sweetpea._internal.core.generate.sample_uniform',
+    'sweetpea._internal.core.generate.tools.executables',
+]
+
+# Generous, so that only an eager import of a heavy dependency fails the test.
+IMPORT_TIME_LIMIT = 1.0
+
+
+def run_python(code: str) -> str:
+    completed = subprocess.run([sys.executable, '-W', 'ignore', '-c', code],
+                               capture_output=True, text=True, check=True)
+    return completed.stdout.strip()
+
+
+def test_import_does_not_load_heavy_modules():
+    loaded = run_python(f"""
+import sys
+import sweetpea
+from sweetpea import Factor, CrossBlock, synthesize_trials
+color = Factor("color", ["red", "blue"])
+CrossBlock([color], [color], [])
+print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+""")
+    assert loaded == ''
+
+
+def test_import_time():
+    elapsed = float(run_python("""
+import time
+start = time.perf_counter()
+from sweetpea import Factor, CrossBlock, synthesize_trials
+print(time.perf_counter() - start)
+"""))
+    assert elapsed < IMPORT_TIME_LIMIT
+
+
+def test_exports_resolve():
+    assert set(sweetpea.__all__) == set(main.__all__)
+    for name in sweetpea.__all__:
+        assert getattr(sweetpea, name) is getattr(main, name)
+    assert set(sweetpea.__all__) <= set(dir(sweetpea))
@@ -0,0 +1,76 @@
+import operator as op
+import pytest
+import random
+
+from sweetpea import (
+    CrossBlock, MultiCrossBlock, Factor, DerivedLevel, WithinTrial, Transition, Window,
+    MinimumTrials, AtMostKInARow, ExactlyK, RandomGen,
+    synthesize_trials, sample_mismatch_experiment, validate_samples
+)
+from sweetpea._internal.primitive import SimpleLevel
+
+color = Factor("color", ["red", "blue", "green"])
+text  = Factor("text",  ["red", "blue", "green"])
+size  = Factor("size",  [SimpleLevel("big", 2), SimpleLevel("small", 1)])
+
+congruent = Factor("congruent?", [
+    DerivedLevel("con", WithinTrial(op.eq, [color, text])),
+    DerivedLevel("inc", WithinTrial(op.ne, [color, text]))
+])
+
+color_repeats = Factor("repeated color?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no",  Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+
+three_reds = Factor("three reds?", [
+    DerivedLevel("yes", Window(lambda colors: all(c == "red" for c in colors.values()), [color], 3, 1)),
+    DerivedLevel("no",  Window(lambda colors: not all(c == "red" for c in colors.values()), [color], 3, 1))
+])
+
+blocks = [
+    CrossBlock([color, text, congruent], [color, text], [AtMostKInARow(1, congruent["con"])]),
+    CrossBlock([color, text, color_repeats], [text, color_repeats], [ExactlyK(2, color["red"])]),
+    CrossBlock([color, text, three_reds], [color, text], [MinimumTrials(12)]),
+    CrossBlock([color, size], [color, size], []),
+    MultiCrossBlock([color, text, size, congruent], [[color, text], [size, congruent]], [], mode="weight"),
+]
+
+
+def perturbed(block, sample, rng):
+    # Replace a few levels, so that samples fail in a variety of ways
+    sample = {name: list(levels) for name, levels in sample.items()}
+    for _ in range(rng.randint(0, 3)):
+        f = rng.choice(block.design)
+        t = rng.randrange(block.trials_per_sample())
+        if sample[f.name][t] != "":
+            sample[f.name][t] = rng.choice(f.levels).name
+    return sample
+
+
+@pytest.mark.parametrize('block', blocks)
+def test_validate_samples_matches_sample_mismatch_experiment(block):
+    rng = random.Random(7)
+    valid = synthesize_trials(block, 5, sampling_strategy=RandomGen)
+    samples = [perturbed(block, rng.choice(valid), rng) for _ in range(150)]
+    expected = [sample_mismatch_experiment(block, sample) for sample in samples]
+    assert validate_samples(block, samples) == expected
+    assert any(report == {} for report in expected)
+    assert any(report != {} for report in expected)
+
+
+def test_validate_samples_in_workers():
+    block = blocks[1]
+    rng = random.Random(8)
+    valid = synthesize_trials(block, 3, sampling_strategy=RandomGen)
+    samples = [perturbed(block, rng.choice(valid), rng) for _ in range(40)]
+    assert validate_samples(block, samples, workers=3) == validate_samples(block, samples)
+
+
+def test_validate_samples_reports_trial_counts():
+    block = blocks[0]
+    sample = synthesize_trials(block, 1, sampling_strategy=RandomGen)[0]
+    short = {name: levels[:-1] for name, levels in sample.items()}
+    assert validate_samples(block, [sample, short]) == [{}, sample_mismatch_experiment(block, short)]
+    with pytest.raises(ValueError, match="not a level"):
+        validate_samples(block, [dict(sample, color=["purple"] * len(sample["color"]))])
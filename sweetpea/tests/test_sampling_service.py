@@ -0,0 +1,173 @@
+import http.client
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from sweetpea import SamplingService
+
+
+design = """
+from sweetpea import Factor, CrossBlock
+color = Factor("color", ["red", "blue"])
+text = Factor("text", ["red", "blue"])
+block = CrossBlock([color, text], [color, text], [])
+"""
+
+other_design = design.replace('"blue"', '"green"')
+
+
+def test_designs_are_kept():
+    service = SamplingService(cache_size=1)
+    result = service.sample(design, 2, 'RandomGen')
+    assert result['fingerprint'] == SamplingService.fingerprint(design)
+    assert len(result['trials']) == 2 and not result['cancelled']
+
+    _, block = service.block(design)
+    assert 'solution_enumerator' in block._encodings
+    assert service.sample(design, 1, 'SMGen')['trials'][0]['color']
+    assert service.block(design)[1] is block
+    assert service.status()['hits'] == 3 and service.status()['misses'] == 1
+
+    # Only the most recently used design is kept
+    service.sample(other_design, 1, 'RandomGen')
+    assert service.status()['designs'] == [SamplingService.fingerprint(other_design)]
+    assert service.block(design)[1] is not block
+
+
+def test_invalid_requests():
+    service = SamplingService()
+    with pytest.raises(ValueError):
+        service.sample(design, 1, 'NoSuchGen')
+    with pytest.raises(ValueError):
+        service.sample("x = 1", 1, 'RandomGen')
+    with pytest.raises(ValueError):
+        service.sample("raise KeyError('oops')", 1, 'RandomGen')
+    assert service.status()['designs'] == []
+
+
+def serving(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def requester(server):
+    def request(method, path, body=None, **headers):
+        port = server.server_address[1]
+        headers = {'Host': f'127.0.0.1:{port}', 'Authorization': f'Bearer {server.token}',
+                   'Content-Type': 'application/json', **headers}
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.putrequest(method, path, skip_host=True)
+        data = (json.dumps(body) if body is not None else '').encode('utf-8')
+        headers.setdefault('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            if value is not None:
+                connection.putheader(name, value)
+        connection.endheaders(data)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    return request
+
+
+def test_http():
+    server = SamplingService().make_server(port=0)
+    serving(server)
+    try:
+        request = requester(server)
+
+        # Requests for the same design are served concurrently
+        results = [None] * 3
+
+        def sample(i):
+            results[i] = request('POST', '/sample', {'design': design, 'samples': 2, 'strategy': 'RandomGen'})
+        threads = [threading.Thread(target=sample, args=(i,)) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for status, result in results:
+            assert status == 200 and len(result['trials']) == 2
+
+        status, result = request('GET', '/status')
+        assert status == 200 and result['designs'] == [SamplingService.fingerprint(design)]
+        assert result['misses'] == 1 and result['hits'] == 2
+
+        assert request('POST', '/sample', {'design': "x = 1"})[0] == 400
+        assert request('POST', '/sample', {'samples': 1})[0] == 400
+        assert request('GET', '/nowhere')[0] == 404
+
+        # Bodies without a valid length, or that are too large, are not read
+        for length in ['-1', 'ten', None]:
+            assert request('POST', '/sample', {'design': design}, **{'Content-Length': length})[0] == 400
+        too_large = str((1 << 20) + 1)
+        assert request('POST', '/sample', {'design': design}, **{'Content-Length': too_large})[0] == 413
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_rejects_untrusted_requests(tmp_path):
+    server = SamplingService().make_server(port=0)
+    serving(server)
+    marker = tmp_path / 'marker'
+    body = {'design': f"open({str(marker)!r}, 'w').close()", 'samples': 1}
+    port = server.server_address[1]
+    try:
+        request = requester(server)
+        # A cross-site form or fetch without a preflight
+        assert request('POST', '/sample', body, **{'Content-Type': 'text/plain'})[0] == 415
+        assert request('POST', '/sample', body, **{'Content-Type': None})[0] == 415
+        # DNS rebinding
+        assert request('POST', '/sample', body, Host='evil.example')[0] == 403
+        assert request('POST', '/sample', body, Host=f'evil.example:{port}')[0] == 403
+        assert request('POST', '/sample', body, Origin=f'http://127.0.0.1:{port}')[0] == 403
+        assert request('POST', '/sample', body, Authorization=None)[0] == 401
+        assert request('POST', '/sample', body, Authorization='Bearer wrong')[0] == 401
+        assert request('GET', '/status', Authorization=None)[0] == 401
+        assert request('GET', '/status', Origin='http://evil.example')[0] == 403
+        assert not marker.exists()
+
+        assert request('POST', '/sample', body, Host=f'localhost:{port}')[0] == 400
+        assert marker.exists()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_listens_only_locally():
+    with pytest.raises(ValueError):
+        SamplingService().make_server(host='0.0.0.0', port=0)
+    server = SamplingService().make_server(port=0, token='secret')
+    assert server.token == 'secret'
+    server.server_close()
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="requires Unix sockets")
+def test_unix_socket(tmp_path):
+    path = str(tmp_path / 'sweetpea.sock')
+    server = SamplingService().make_server(path=path)
+    serving(server)
+    try:
+        body = json.dumps({'design': design, 'samples': 1, 'strategy': 'RandomGen'}).encode('utf-8')
+        assert os.stat(path).st_mode & 0o077 == 0
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        client.sendall(b"POST /sample HTTP/1.0\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                       % (len(body), body))
+        response = b""
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            response += data
+        client.close()
+        head, _, content = response.partition(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.0 200")
+        assert len(json.loads(content)['trials']) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not os.path.exists(path)
@@ -0,0 +1,76 @@
+import operator as op
+import random
+import numpy as np
+
+from sweetpea import (
+    CrossBlock, Factor, DerivedLevel, WithinTrial, Transition, ContinuousFactor, UniformDistribution, RandomGen,
+    TrialMatrix, synthesize_trials, experiments_to_tuples, validate_samples, save_experiments_npz
+)
+
+color = Factor("color", ["red", "blue", "green"])
+text  = Factor("text",  ["red", "blue", "green"])
+
+congruent = Factor("congruent?", [
+    DerivedLevel("con", WithinTrial(op.eq, [color, text])),
+    DerivedLevel("inc", WithinTrial(op.ne, [color, text]))
+])
+
+color_repeats = Factor("repeated color?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no",  Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+
+block = CrossBlock([color, text, congruent, color_repeats], [color, text], [])
+
+
+def test_synthesize_trials_as_matrix():
+    matrix = synthesize_trials(block, 6, sampling_strategy=RandomGen, as_matrix=True)
+    assert isinstance(matrix, TrialMatrix)
+    assert len(matrix) == 6 and matrix.trial_count == 9
+    assert matrix.factor_names == ["color", "text", "congruent?", "repeated color?"]
+    assert matrix.codes("color").dtype == np.int8 and matrix.codes("color").shape == (6, 9)
+    assert matrix.levels("congruent?") == ["con", "inc"]
+    assert matrix[0]["repeated color?"][0] == ""
+    for experiment in matrix:
+        assert [c == t for c, t in zip(experiment["color"], experiment["text"])] \
+            == [c == "con" for c in experiment["congruent?"]]
+    assert experiments_to_tuples(block, matrix) == experiments_to_tuples(block, matrix.to_dicts())
+
+
+def test_matrix_matches_list(monkeypatch):
+    # Samples are finished one at a time for a matrix, but in the same way
+    monkeypatch.setenv("SWEETPEA_CHECK_SYNTHESIZED", "1")
+    time = ContinuousFactor("time", distribution=UniformDistribution(0, 1))
+    continuous_block = CrossBlock([color, text, congruent, time], [color, text], [])
+    random.seed(3)
+    experiments = synthesize_trials(continuous_block, 4, sampling_strategy=RandomGen)
+    random.seed(3)
+    matrix = synthesize_trials(continuous_block, 4, sampling_strategy=RandomGen, as_matrix=True)
+    assert matrix.to_dicts() == experiments
+
+
+def test_trial_matrix_round_trips_experiments():
+    experiments = synthesize_trials(block, 5, sampling_strategy=RandomGen)
+    matrix = TrialMatrix.from_experiments(block.design, experiments)
+    assert matrix.to_dicts() == experiments
+    assert matrix[1:3].to_dicts() == experiments[1:3]
+    assert matrix.nbytes == 4 * 5 * 9
+
+
+def test_validate_samples_on_matrix(tmp_path):
+    experiments = synthesize_trials(block, 4, sampling_strategy=RandomGen)
+    experiments[2]["congruent?"] = ["con" if c == "inc" else "inc" for c in experiments[2]["congruent?"]]
+    matrix = TrialMatrix.from_experiments(block.design, experiments)
+    assert validate_samples(block, matrix) == validate_samples(block, experiments)
+    assert validate_samples(block, matrix, workers=2)[2] == {'factors': ['congruent?']}
+    save_experiments_npz(block, matrix, str(tmp_path / "exp.npz"))
+    assert TrialMatrix.load(str(tmp_path / "exp.npz")).to_dicts() == experiments
+
+
+def test_trial_matrix_with_continuous_factor():
+    time = ContinuousFactor("time", distribution=UniformDistribution(0, 1))
+    continuous_block = CrossBlock([color, text, time], [color, text], [])
+    matrix = synthesize_trials(continuous_block, 2, sampling_strategy=RandomGen, as_matrix=True)
+    assert matrix.levels("time") is None
+    assert matrix.codes("time").dtype == np.float64
+    assert matrix[1]["time"] == matrix.codes("time")[1].tolist()